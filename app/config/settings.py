@@ -1,4 +1,5 @@
 import os
+import tempfile
 from dotenv import load_dotenv
 
 # Load environment variables from .env in project root
@@ -10,9 +11,88 @@ EVOLUTION_URL = os.getenv("EVOLUTION_URL", "").rstrip("/")
 EVOLUTION_INSTANCE = os.getenv("EVOLUTION_INSTANCE", "")
 EVOLUTION_TOKEN = os.getenv("EVOLUTION_TOKEN", "")
 
+# Pool de instâncias que dividem os envios: "nome:token[:mensagens_por_segundo]"
+# separados por vírgula. Vazio usa só EVOLUTION_INSTANCE; a primeira é a exibida na tela
+EVOLUTION_INSTANCES = os.getenv("EVOLUTION_INSTANCES", "")
+
+# Conexões mantidas abertas por processo e timeouts (segundos) das chamadas à Evolution
+EVOLUTION_POOL_SIZE = int(os.getenv("EVOLUTION_POOL_SIZE", "10"))
+EVOLUTION_CONNECT_TIMEOUT = float(os.getenv("EVOLUTION_CONNECT_TIMEOUT", "5"))
+EVOLUTION_READ_TIMEOUT = float(os.getenv("EVOLUTION_READ_TIMEOUT", "30"))
+
+# Envios simultâneos por execução: a janela parte do valor inicial e se ajusta
+# entre o mínimo e o máximo conforme a latência (segundos) e os erros da Evolution
+EVOLUTION_INITIAL_CONCURRENCY = int(os.getenv("EVOLUTION_INITIAL_CONCURRENCY", "5"))
+EVOLUTION_MIN_CONCURRENCY = int(os.getenv("EVOLUTION_MIN_CONCURRENCY", "1"))
+EVOLUTION_MAX_CONCURRENCY = int(os.getenv("EVOLUTION_MAX_CONCURRENCY", "20"))
+EVOLUTION_LATENCY_TARGET = float(os.getenv("EVOLUTION_LATENCY_TARGET", "2"))
+
+# Intervalo (segundos) do log da janela de concorrência durante um lote (0 desativa)
+EVOLUTION_STATS_SECONDS = float(os.getenv("EVOLUTION_STATS_SECONDS", "15"))
+
+# Mensagens por segundo e rajada máxima por instância, somando todos os workers
+EVOLUTION_RATE_PER_SECOND = float(os.getenv("EVOLUTION_RATE_PER_SECOND", "2"))
+EVOLUTION_RATE_BURST = float(os.getenv("EVOLUTION_RATE_BURST", "5"))
+EVOLUTION_RATE_DIR = os.getenv("EVOLUTION_RATE_DIR", tempfile.gettempdir())
+
+# Novas tentativas em 429/5xx/timeouts: tentativas por mensagem, backoff (segundos)
+# e fração das mensagens da execução que pode ser repetida
+EVOLUTION_RETRY_ATTEMPTS = int(os.getenv("EVOLUTION_RETRY_ATTEMPTS", "3"))
+EVOLUTION_RETRY_BASE_SECONDS = float(os.getenv("EVOLUTION_RETRY_BASE_SECONDS", "1"))
+EVOLUTION_RETRY_MAX_SECONDS = float(os.getenv("EVOLUTION_RETRY_MAX_SECONDS", "20"))
+EVOLUTION_RETRY_BUDGET = float(os.getenv("EVOLUTION_RETRY_BUDGET", "0.2"))
+
+# Tempo (segundos) após o qual um envio reservado e não concluído pode ser retomado
+EVOLUTION_IDEMPOTENCY_LEASE_SECONDS = float(os.getenv("EVOLUTION_IDEMPOTENCY_LEASE_SECONDS", "900"))
+
+# Validade (segundos) do estado da sessão em cache e pausa dos envios com a instância fechada
+EVOLUTION_SESSION_TTL = float(os.getenv("EVOLUTION_SESSION_TTL", "15"))
+EVOLUTION_BREAKER_SECONDS = float(os.getenv("EVOLUTION_BREAKER_SECONDS", "60"))
+
+# Parser usado na leitura dos CSVs do PontoMais ("c" ou "pyarrow")
+CSV_ENGINE = os.getenv("CSV_ENGINE", "c")
+
+# Linhas por bloco na leitura da Auditoria (0 lê o arquivo de uma vez)
+CSV_CHUNK_ROWS = int(os.getenv("CSV_CHUNK_ROWS", "100000"))
+
+# Cache em disco dos relatórios processados (CSV_CACHE_MAX_MB=0 desativa)
+CSV_CACHE_DIR = os.getenv("CSV_CACHE_DIR", "cache_relatorios")
+CSV_CACHE_MAX_MB = int(os.getenv("CSV_CACHE_MAX_MB", "512"))
+CSV_CACHE_MAX_AGE_HOURS = float(os.getenv("CSV_CACHE_MAX_AGE_HOURS", "24"))
+
+# "local" envia dentro do worker web; "fila" grava os lotes para o despachante
+# (python -m app.despachante) enviar em outro processo
+ENVIO_MODO = os.getenv("ENVIO_MODO", "local").strip().lower()
+FILA_ENVIOS_PATH = os.getenv("FILA_ENVIOS_PATH", "fila_envios/fila.sqlite3")
+FILA_LEASE_SECONDS = float(os.getenv("FILA_LEASE_SECONDS", "300"))
+FILA_POLL_SECONDS = float(os.getenv("FILA_POLL_SECONDS", "2"))
+# Reservas de um mesmo lote antes de ele ser abandonado como falho
+FILA_MAX_TENTATIVAS = int(os.getenv("FILA_MAX_TENTATIVAS", "5"))
+
+# Une em uma só mensagem as equipes que apontam para o mesmo número. Mensagens
+# acima de WHATSAPP_MAX_BYTES são enviadas em partes numeradas
+ENVIO_CONSOLIDAR_POR_NUMERO = os.getenv("ENVIO_CONSOLIDAR_POR_NUMERO", "0").strip().lower() in {"1", "true", "sim"}
+WHATSAPP_MAX_BYTES = int(os.getenv("WHATSAPP_MAX_BYTES", "4096"))
+
+# Números das equipes: idade (segundos) a partir da qual a planilha é revalidada em
+# segundo plano, idade a partir da qual o envio espera a revalidação e cópia local
+# usada na partida dos workers e se a planilha cair
+NUMEROS_EQUIPES_TTL = float(os.getenv("NUMEROS_EQUIPES_TTL", "300"))
+NUMEROS_EQUIPES_IDADE_MAXIMA = float(os.getenv("NUMEROS_EQUIPES_IDADE_MAXIMA", str(NUMEROS_EQUIPES_TTL * 12)))
+NUMEROS_EQUIPES_SNAPSHOT = os.getenv("NUMEROS_EQUIPES_SNAPSHOT", "cache_equipes/numeros_equipes.json")
+
 # Configurações de banco de dados MySQL
 DB_HOST = os.getenv("DB_HOST", "localhost")
 DB_PORT = int(os.getenv("DB_PORT", "3306"))
 DB_NAME = os.getenv("DB_NAME", "")
 DB_USER = os.getenv("DB_USER", "")
 DB_PASSWORD = os.getenv("DB_PASSWORD", "")
+
+# Conexões mantidas no pool de cada processo; pedidos além disso abrem conexões avulsas
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "4"))
+
+# Cria banco e tabelas na primeira conexão de cada processo (0 se o deploy roda python -m app.history)
+DB_SCHEMA_AUTO = os.getenv("DB_SCHEMA_AUTO", "1").strip().lower() in {"1", "true", "sim"}
+
+# Dias exibidos pela tela de histórico quando nenhuma data é informada
+HISTORICO_PERIODO_PADRAO_DIAS = int(os.getenv("HISTORICO_PERIODO_PADRAO_DIAS", "30"))
@@ -1,23 +1,85 @@
-from app.processamento.csv_reader import carregar_dados
+from app.processamento.cache_relatorios import carregar_dados_com_cache
 from app.whatsapp.mensagem import gerar_mensagens
 from app.whatsapp.mensagem_assinaturas import gerar_mensagens_assinaturas
-from app.routes import enviar_whatsapp
 from app.history import (
     registrar_envio,
     registrar_resultado_relatorio,
     normalizar_nome_relatorio,
+    gerar_chave_idempotencia,
 )
-from concurrent.futures import ThreadPoolExecutor, as_completed
 from app.whatsapp.numeros_equipes import carregar_numeros_equipes
+from app.whatsapp.despacho import Envio, despachar
+from app.whatsapp.montagem import montar_mensagem_equipe
 from app.processamento.log import configurar_log
-from app.processamento.mapear_gerencia import eh_loja
+from app.processamento.mapear_gerencia import eh_loja, estatisticas_cache_equipes
 from collections import defaultdict
-from datetime import datetime
+from dataclasses import asdict, dataclass
+from typing import Dict, List, Set, Tuple
 import logging
 import pandas as pd
 from app.types import MensagemDetalhada
 
-def processar_csv(
+
+@dataclass
+class LoteEnvio:
+    """Mensagens de uma execução e o contexto para fechar o resultado depois do envio."""
+
+    nome_arquivo_log: str
+    tipo_relatorio: str
+    nome_relatorio_chave: str
+    nome_relatorio_exibicao: str
+    logs: List[dict]
+    stats: dict
+    envios: List[Envio]
+    historico_por_equipe: Dict[str, List[Tuple[str, str]]]
+    equipes_previstas: Set[str]
+    equipes_com_erro: Set[str]
+    equipes_sem_numero: List[str]
+
+    def para_dict(self) -> dict:
+        """Versão serializável em JSON, usada pela fila de envios."""
+        dados = asdict(self)
+        dados["stats"] = dict(self.stats, equipes=sorted(self.stats["equipes"]))
+        dados["equipes_previstas"] = sorted(self.equipes_previstas)
+        dados["equipes_com_erro"] = sorted(self.equipes_com_erro)
+        return dados
+
+    @classmethod
+    def de_dict(cls, dados: dict) -> "LoteEnvio":
+        dados = dict(dados)
+        dados["stats"] = dict(dados["stats"], equipes=set(dados["stats"]["equipes"]))
+        dados["envios"] = [
+            Envio(**dict(envio, chave=tuple(envio["chave"]))) for envio in dados["envios"]
+        ]
+        dados["historico_por_equipe"] = {
+            equipe: [tuple(registro) for registro in registros]
+            for equipe, registros in dados["historico_por_equipe"].items()
+        }
+        dados["equipes_previstas"] = set(dados["equipes_previstas"])
+        dados["equipes_com_erro"] = set(dados["equipes_com_erro"])
+        return cls(**dados)
+
+
+def _normalizar_equipe_valor(valor: object) -> str:
+    texto = str(valor).strip().upper()
+    if texto in {"", "NAN", "NONE", "NULL"}:
+        return ""
+    return texto
+
+
+def _indexar_equipe_por_grupo(df):
+    """Mapeia cada ``(Nome, Data)`` para a ``EquipeTratada`` da primeira linha do grupo."""
+    primeiras = df.drop_duplicates(subset=["Nome", "Data"])
+    return dict(zip(zip(primeiras["Nome"], primeiras["Data"]), primeiras["EquipeTratada"]))
+
+
+def _indexar_equipe_original(df):
+    """Mapeia cada ``EquipeTratada`` para o nome de ``Equipe`` da primeira linha em que aparece."""
+    primeiras = df.drop_duplicates(subset=["EquipeTratada"])
+    return dict(zip(primeiras["EquipeTratada"], primeiras["Equipe"]))
+
+
+def preparar_envios(
     caminho_csv,
     ignorar_sabados,
     tipo_relatorio,
@@ -26,11 +88,16 @@ def processar_csv(
     nome_relatorio_original=None,
     equipes_permitidas=None,
 ):
+    """Lê o relatório, gera as mensagens e monta o :class:`LoteEnvio` da execução.
+
+    Nada é enviado aqui: o lote pode ser despachado na hora
+    (:func:`processar_csv`) ou gravado na fila do despachante.
+    """
     nome_arquivo_log = configurar_log()
     logging.info(f">>> Iniciando processamento CSV: {caminho_csv}")
     logging.info(f">>> Parâmetros: ignorar_sabados={ignorar_sabados}, tipo={tipo_relatorio}")
     
-    df = carregar_dados(caminho_csv, ignorar_sabados, tipo_relatorio)
+    df = carregar_dados_com_cache(caminho_csv, ignorar_sabados, tipo_relatorio)
     
     # Renomeia colunas comuns
     df.columns = df.columns.str.strip()
@@ -54,17 +121,11 @@ def processar_csv(
     nome_relatorio_chave = normalizar_nome_relatorio(nome_relatorio or nome_relatorio_original)
     nome_relatorio_exibicao = (nome_relatorio_original or nome_relatorio or nome_relatorio_chave or "relatorio_sem_nome").strip()
 
-    def normalizar_equipe_valor(valor: object) -> str:
-        texto = str(valor).strip().upper()
-        if texto in {"", "NAN", "NONE", "NULL"}:
-            return ""
-        return texto
-
     equipes_selecionadas_norm = None
     if equipes_selecionadas:
         equipes_selecionadas_norm = {
             valor
-            for valor in (normalizar_equipe_valor(eq) for eq in equipes_selecionadas)
+            for valor in (_normalizar_equipe_valor(eq) for eq in equipes_selecionadas)
             if valor
         }
 
@@ -72,14 +133,11 @@ def processar_csv(
     if equipes_permitidas:
         equipes_permitidas_norm = {
             valor
-            for valor in (normalizar_equipe_valor(eq) for eq in equipes_permitidas)
+            for valor in (_normalizar_equipe_valor(eq) for eq in equipes_permitidas)
             if valor
         }
 
     equipes_previstas_norm = set(equipes_permitidas_norm or [])
-    equipes_sucesso_norm = set()
-
-
 
     def equipe_autorizada(equipe_normalizada: str) -> bool:
         if equipes_permitidas_norm and equipe_normalizada not in equipes_permitidas_norm:
@@ -88,108 +146,89 @@ def processar_csv(
             return False
         return True
 
+    # Em reenvios parciais só as pendências podem receber mensagem, então as
+    # demais equipes saem do DataFrame antes de gerar qualquer texto. Sem
+    # ``equipes_permitidas`` o relatório inteiro continua sendo gerado, pois as
+    # equipes não selecionadas precisam entrar como pendências do relatório.
+    if equipes_permitidas_norm:
+        equipes_relatorio = df["EquipeTratada"].unique().tolist()
+        ignoradas = sorted(e for e in equipes_relatorio if e not in equipes_permitidas_norm)
+        if ignoradas:
+            logs.append({
+                "type": "info",
+                "message": f"Envio ignorado para {len(ignoradas)} equipe(s) com relatório já concluído: {', '.join(ignoradas)}.",
+            })
+        df = df[df["EquipeTratada"].isin([e for e in equipes_relatorio if equipe_autorizada(e)])]
+        logging.info("Equipes mantidas após o filtro: %d de %d", df["EquipeTratada"].nunique(), len(equipes_relatorio))
+
+    equipe_original_por_tratada = _indexar_equipe_original(df)
+
+    def chave_envio(equipe_normalizada: str, mensagem: str):
+        # Sem nome de relatório não há como reconhecer um reenvio
+        if not nome_relatorio_chave:
+            return None
+        return gerar_chave_idempotencia(nome_relatorio_chave, equipe_normalizada, mensagem)
+
     equipes_com_erro = set()
     if tipo_relatorio == "Assinaturas":
         mensagens_por_equipe = gerar_mensagens_assinaturas(df)
         if not equipes_previstas_norm:
             equipes_previstas_norm = {
                 valor
-                for valor in (normalizar_equipe_valor(equipe) for equipe in mensagens_por_equipe.keys())
+                for valor in (_normalizar_equipe_valor(equipe) for equipe in mensagens_por_equipe.keys())
                 if valor
             }
-        futures = {}
         historico_por_equipe = defaultdict(list)
-        with ThreadPoolExecutor(max_workers=5) as executor:
-            for equipe, dados in sorted(mensagens_por_equipe.items()):
-                equipe_normalizada = str(equipe).strip().upper()
-                if equipes_permitidas_norm and equipe_normalizada not in equipes_permitidas_norm:
-                    logs.append({"type": "info", "message": f"Envio ignorado para {equipe_normalizada} (relat?rio j? conclu?do)."})
-                    continue
-                if equipes_selecionadas_norm and equipe_normalizada not in equipes_selecionadas_norm:
-                    continue
-
-                numero = numero_equipe.get(equipe_normalizada)
-                if not numero or numero.strip().lower() in ["nan", "none", ""]:
-                    equipes_sem_numero.append(equipe)
-                    stats["erro"] += 1
-                    equipes_com_erro.add(equipe_normalizada)
-                    continue
+        envios = []
+        for equipe, dados in sorted(mensagens_por_equipe.items()):
+            equipe_normalizada = str(equipe).strip().upper()
+            # As equipes fora de ``equipes_permitidas`` já saíram do DataFrame
+            if equipes_selecionadas_norm and equipe_normalizada not in equipes_selecionadas_norm:
+                continue
 
-                equipe_original = df[df["EquipeTratada"] == equipe_normalizada]["Equipe"].iloc[0]
-                titulo = f"LOJA {equipe_normalizada}" if eh_loja(equipe_original) else f"{equipe_normalizada}"
-
-                mensagem_final = dados["mensagem"].strip()
-                future = executor.submit(
-                    enviar_whatsapp, numero, mensagem_final, equipe_normalizada
-                )
-                futures[future] = (titulo, equipe_normalizada)
-                stats["total"] += 1
-                stats["equipes"].add(equipe_normalizada)
-
-                motivo = str(dados.get("motivo", "")).strip() or "Assinatura pendente"
-                nomes_registrados = []
-                for nome in dados.get("nomes", []):
-                    nome_limpo = str(nome).strip()
-                    if not nome_limpo:
-                        continue
-                    nomes_registrados.append((nome_limpo, motivo))
-                if nomes_registrados:
-                    historico_por_equipe[equipe_normalizada].extend(nomes_registrados)
-
-        for future in as_completed(futures):
-            titulo, equipe_nome = futures[future]
-            registros = historico_por_equipe.get(equipe_nome, [])
-            try:
-                future.result()
-                logs.append({"type": "success", "message": f" Mensagem enviada para {titulo}"})
-                stats["sucesso"] += 1
-                equipe_sucesso = normalizar_equipe_valor(equipe_nome)
-                if equipe_sucesso:
-                    equipes_sucesso_norm.add(equipe_sucesso)
-                if registros:
-                    envios_lote = [
-                        {
-                            "equipe": equipe_nome,
-                            "tipo_relatorio": tipo_relatorio,
-                            "status": "sucesso",
-                            "pessoa": pessoa,
-                            "motivo_envio": motivo,
-                            "nome_relatorio": nome_relatorio_chave,
-                        }
-                        for pessoa, motivo in registros
-                    ]
-                    registrar_envio(envios_lote)
-            except Exception as e:
-                logs.append({"type": "error", "message": f" Erro ao enviar para {titulo}: {str(e)}"})
+            numero = numero_equipe.get(equipe_normalizada)
+            if not numero or numero.strip().lower() in ["nan", "none", ""]:
+                equipes_sem_numero.append(equipe)
                 stats["erro"] += 1
-                equipes_com_erro.add(str(equipe_nome).strip().upper())
-                if registros:
-                    envios_lote = [
-                        {
-                            "equipe": equipe_nome,
-                            "tipo_relatorio": tipo_relatorio,
-                            "status": "erro",
-                            "pessoa": pessoa,
-                            "motivo_envio": motivo,
-                            "nome_relatorio": nome_relatorio_chave,
-                        }
-                        for pessoa, motivo in registros
-                    ]
-                    registrar_envio(envios_lote)
+                equipes_com_erro.add(equipe_normalizada)
+                continue
+
+            equipe_original = equipe_original_por_tratada[equipe_normalizada]
+            titulo = f"LOJA {equipe_normalizada}" if eh_loja(equipe_original) else f"{equipe_normalizada}"
+
+            mensagem_final = dados["mensagem"].strip()
+            envios.append(Envio(
+                (titulo, equipe_normalizada),
+                numero,
+                mensagem_final,
+                equipe_normalizada,
+                nome_relatorio=nome_relatorio_chave,
+                chave_idempotencia=chave_envio(equipe_normalizada, mensagem_final),
+            ))
+            stats["total"] += 1
+            stats["equipes"].add(equipe_normalizada)
+
+            motivo = str(dados.get("motivo", "")).strip() or "Assinatura pendente"
+            nomes_registrados = []
+            for nome in dados.get("nomes", []):
+                nome_limpo = str(nome).strip()
+                if not nome_limpo:
+                    continue
+                nomes_registrados.append((nome_limpo, motivo))
+            if nomes_registrados:
+                historico_por_equipe[equipe_normalizada].extend(nomes_registrados)
 
     else:
         mensagens_por_grupo = gerar_mensagens(df, tipo_relatorio)
         mensagens_por_equipe_data = defaultdict(lambda: defaultdict(list))
         historico_por_equipe = defaultdict(list)
+        equipe_por_grupo = _indexar_equipe_por_grupo(df)
 
         for (nome, data), detalhes in mensagens_por_grupo.items():
             if not isinstance(detalhes, MensagemDetalhada):
                 continue
 
-            equipe_match = df.loc[(df["Nome"] == nome) & (df["Data"] == data), "EquipeTratada"]
-            if equipe_match.empty:
-                continue
-            equipe = equipe_match.iloc[0]
+            equipe = equipe_por_grupo[(nome, data)]
             mensagens_por_equipe_data[equipe][data].append(detalhes.texto)
 
             nome_formatado = str(nome).strip()
@@ -206,103 +245,126 @@ def processar_csv(
         if not equipes_previstas_norm:
             equipes_previstas_norm = {
                 valor
-                for valor in (normalizar_equipe_valor(equipe) for equipe in mensagens_por_equipe_data.keys())
+                for valor in (_normalizar_equipe_valor(equipe) for equipe in mensagens_por_equipe_data.keys())
                 if valor
             }
 
-        futures = {}
-        with ThreadPoolExecutor(max_workers=5) as executor:
-            for equipe, datas in sorted(mensagens_por_equipe_data.items()):
-                equipe_normalizada = str(equipe).strip().upper()
-                if equipes_permitidas_norm and equipe_normalizada not in equipes_permitidas_norm:
-                    logs.append({"type": "info", "message": f"Envio ignorado para {equipe_normalizada} (relat?rio j? conclu?do)."})
-                    continue
-                if equipes_selecionadas_norm and equipe_normalizada not in equipes_selecionadas_norm:
-                    continue
+        envios = []
+        for equipe, datas in sorted(mensagens_por_equipe_data.items()):
+            equipe_normalizada = str(equipe).strip().upper()
+            # As equipes fora de ``equipes_permitidas`` já saíram do DataFrame
+            if equipes_selecionadas_norm and equipe_normalizada not in equipes_selecionadas_norm:
+                continue
 
-                numero = numero_equipe.get(equipe_normalizada)
-                if not numero or numero.strip().lower() in ["nan", "none", ""]:
-                    equipes_sem_numero.append(equipe)
-                    stats["erro"] += 1
-                    equipes_com_erro.add(equipe_normalizada)
-                    continue
+            numero = numero_equipe.get(equipe_normalizada)
+            if not numero or numero.strip().lower() in ["nan", "none", ""]:
+                equipes_sem_numero.append(equipe)
+                stats["erro"] += 1
+                equipes_com_erro.add(equipe_normalizada)
+                continue
 
-                mensagens_sub = datas
-                datas_sub = defaultdict(list)
+            mensagens_sub = datas
+            datas_sub = defaultdict(list)
 
-                for data, mensagens in mensagens_sub.items():
-                    mensagens_validas = [m for m in mensagens if m and isinstance(m, str)]
-                    if mensagens_validas:
-                        datas_sub[data].extend(mensagens_validas)
+            for data, mensagens in mensagens_sub.items():
+                mensagens_validas = [m for m in mensagens if m and isinstance(m, str)]
+                if mensagens_validas:
+                    datas_sub[data].extend(mensagens_validas)
 
-                if not datas_sub:
-                    continue
+            if not datas_sub:
+                continue
 
-                equipe_original = df[df["EquipeTratada"] == equipe_normalizada]["Equipe"].iloc[0]
-                titulo = f"LOJA {equipe}" if eh_loja(equipe_original) else f"{equipe}"
-                mensagem_final = f"*{titulo}*\n\n"
-
-                for data in sorted(datas_sub.keys(), key=lambda d: datetime.strptime(d, "%d/%m/%Y")):
-                    mensagens_validas = [m.strip() for m in datas_sub[data] if m and m.strip()]
-                    if not mensagens_validas:
-                        continue
-                    mensagem_final += f"*NO DIA {data}:*\n"
-                    for m in mensagens_validas:
-                        mensagem_final += f"• {m}\n"
-                    mensagem_final += "\n"
-
-                future = executor.submit(
-                    enviar_whatsapp, numero, mensagem_final.strip(), equipe
-                )
-                futures[future] = (titulo, equipe)
-                stats["total"] += 1
-                stats["equipes"].add(equipe_normalizada)
-
-        for future in as_completed(futures):
-            titulo, equipe_nome = futures[future]
-            registros = historico_por_equipe.get(equipe_nome, [])
-            try:
-                future.result()
-                logs.append({"type": "success", "message": f" Mensagem enviada para {titulo}"})
-                stats["sucesso"] += 1
-                equipe_sucesso = normalizar_equipe_valor(equipe_nome)
-                if equipe_sucesso:
-                    equipes_sucesso_norm.add(equipe_sucesso)
-                if registros:
-                    envios_lote = [
-                        {
-                            "equipe": equipe_nome,
-                            "tipo_relatorio": tipo_relatorio,
-                            "status": "sucesso",
-                            "pessoa": pessoa,
-                            "motivo_envio": motivo,
-                            "nome_relatorio": nome_relatorio_chave,
-                        }
-                        for pessoa, motivo in registros
-                    ]
-                    registrar_envio(envios_lote)
-            except Exception as e:
-                logs.append({"type": "error", "message": f" Erro ao enviar para {titulo}: {str(e)}"})
-                stats["erro"] += 1
-                equipes_com_erro.add(str(equipe_nome).strip().upper())
-                if registros:
-                    envios_lote = [
-                        {
-                            "equipe": equipe_nome,
-                            "tipo_relatorio": tipo_relatorio,
-                            "status": "erro",
-                            "pessoa": pessoa,
-                            "motivo_envio": motivo,
-                            "nome_relatorio": nome_relatorio_chave,
-                        }
-                        for pessoa, motivo in registros
-                    ]
-                    registrar_envio(envios_lote)
+            equipe_original = equipe_original_por_tratada[equipe_normalizada]
+            titulo = f"LOJA {equipe}" if eh_loja(equipe_original) else f"{equipe}"
+            mensagem_final = montar_mensagem_equipe(titulo, datas_sub)
+            envios.append(Envio(
+                (titulo, equipe),
+                numero,
+                mensagem_final,
+                equipe,
+                nome_relatorio=nome_relatorio_chave,
+                chave_idempotencia=chave_envio(equipe_normalizada, mensagem_final),
+            ))
+            stats["total"] += 1
+            stats["equipes"].add(equipe_normalizada)
+
+    return LoteEnvio(
+        nome_arquivo_log=nome_arquivo_log,
+        tipo_relatorio=tipo_relatorio,
+        nome_relatorio_chave=nome_relatorio_chave,
+        nome_relatorio_exibicao=nome_relatorio_exibicao,
+        logs=logs,
+        stats=stats,
+        envios=envios,
+        historico_por_equipe=dict(historico_por_equipe),
+        equipes_previstas=equipes_previstas_norm,
+        equipes_com_erro=equipes_com_erro,
+        equipes_sem_numero=equipes_sem_numero,
+    )
+
+
+def finalizar_lote(lote: LoteEnvio, resultados, estatisticas_envio=None, chaves_registro=None):
+    """Registra o histórico de cada envio e o resumo do relatório.
+
+    ``resultados`` são pares ``((titulo, equipe), erro)`` como os devolvidos
+    por :func:`despachar`. ``chaves_registro`` associa a chave de cada envio
+    a uma chave estável (lote e posição) para que finalizar o mesmo lote de
+    novo não duplique o histórico. Retorna ``(logs, stats)`` da execução.
+    """
+    chaves_registro = chaves_registro or {}
+    tipo_relatorio = lote.tipo_relatorio
+    nome_relatorio_chave = lote.nome_relatorio_chave
+    logs = lote.logs
+    stats = lote.stats
+    historico_por_equipe = lote.historico_por_equipe
+    equipes_previstas_norm = set(lote.equipes_previstas)
+    equipes_com_erro = set(lote.equipes_com_erro)
+    equipes_sem_numero = lote.equipes_sem_numero
+    equipes_sucesso_norm = set()
+
+    for (titulo, equipe_nome), erro in resultados:
+        registros = historico_por_equipe.get(equipe_nome, [])
+        if erro is None:
+            logs.append({"type": "success", "message": f" Mensagem enviada para {titulo}"})
+            stats["sucesso"] += 1
+            equipe_sucesso = _normalizar_equipe_valor(equipe_nome)
+            if equipe_sucesso:
+                equipes_sucesso_norm.add(equipe_sucesso)
+            if registros:
+                envios_lote = [
+                    {
+                        "equipe": equipe_nome,
+                        "tipo_relatorio": tipo_relatorio,
+                        "status": "sucesso",
+                        "pessoa": pessoa,
+                        "motivo_envio": motivo,
+                        "nome_relatorio": nome_relatorio_chave,
+                    }
+                    for pessoa, motivo in registros
+                ]
+                registrar_envio(envios_lote, chave_registro=chaves_registro.get((titulo, equipe_nome)))
+        else:
+            logs.append({"type": "error", "message": f" Erro ao enviar para {titulo}: {str(erro)}"})
+            stats["erro"] += 1
+            equipes_com_erro.add(str(equipe_nome).strip().upper())
+            if registros:
+                envios_lote = [
+                    {
+                        "equipe": equipe_nome,
+                        "tipo_relatorio": tipo_relatorio,
+                        "status": "erro",
+                        "pessoa": pessoa,
+                        "motivo_envio": motivo,
+                        "nome_relatorio": nome_relatorio_chave,
+                    }
+                    for pessoa, motivo in registros
+                ]
+                registrar_envio(envios_lote, chave_registro=chaves_registro.get((titulo, equipe_nome)))
 
     if not equipes_previstas_norm and isinstance(stats["equipes"], set):
         equipes_previstas_norm = {
             valor
-            for valor in (normalizar_equipe_valor(eq) for eq in stats["equipes"])
+            for valor in (_normalizar_equipe_valor(eq) for eq in stats["equipes"])
             if valor
         }
 
@@ -329,11 +391,12 @@ def processar_csv(
     stats["total"] = max(stats["sucesso"] + stats["erro"], total_equipes_previstas)
     stats["equipes"] = total_equipes_previstas
     stats["pendencias"] = len(equipes_com_erro)
+    stats["concorrencia"] = estatisticas_envio or {}
 
     if nome_relatorio_chave:
         registrar_resultado_relatorio(
             nome_relatorio_chave,
-            nome_relatorio_exibicao,
+            lote.nome_relatorio_exibicao,
             tipo_relatorio,
             stats["total"],
             stats["sucesso"],
@@ -341,5 +404,30 @@ def processar_csv(
             equipes_com_erro,
         )
 
+    logging.info("Cache de equipes: %s", estatisticas_cache_equipes())
     logging.info(">>> Finalizando processamento CSV. Total de equipes: %d", stats["total"])
-    return logs, stats, nome_arquivo_log
+    return logs, stats
+
+
+def processar_csv(
+    caminho_csv,
+    ignorar_sabados,
+    tipo_relatorio,
+    equipes_selecionadas=None,
+    nome_relatorio=None,
+    nome_relatorio_original=None,
+    equipes_permitidas=None,
+):
+    lote = preparar_envios(
+        caminho_csv,
+        ignorar_sabados,
+        tipo_relatorio,
+        equipes_selecionadas,
+        nome_relatorio=nome_relatorio,
+        nome_relatorio_original=nome_relatorio_original,
+        equipes_permitidas=equipes_permitidas,
+    )
+    estatisticas_envio = {}
+    resultados = despachar(lote.envios, estatisticas_envio)
+    logs, stats = finalizar_lote(lote, resultados, estatisticas_envio)
+    return logs, stats, lote.nome_arquivo_log
@@ -0,0 +1,150 @@
+"""Despachante de envios: processo separado que drena a fila durável.
+
+Uso:
+    python -m app.despachante
+
+Com ``ENVIO_MODO=fila`` os workers web apenas geram as mensagens e gravam
+o lote em :mod:`app.whatsapp.fila`. Este processo envia os lotes em ordem,
+grava o resultado de cada equipe assim que ele chega e, ao final, registra o
+histórico, o resumo do relatório e o status da tarefa consultado pelo
+front-end. Um lote interrompido é retomado apenas pelos itens pendentes.
+
+Enquanto o lote é processado uma thread renova a reserva a cada terço de
+``FILA_LEASE_SECONDS``, para que um envio longo não seja assumido por outro
+despachante. O histórico de cada item é gravado com a chave
+``<tarefa>:<posição>``, então finalizar de novo um lote que caiu entre o
+histórico e a conclusão não duplica registros. Um lote que falha
+``FILA_MAX_TENTATIVAS`` vezes é descartado e a tarefa termina com erro.
+"""
+from __future__ import annotations
+
+import logging
+import signal
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from app.config.settings import (  # noqa: E402
+    FILA_LEASE_SECONDS,
+    FILA_MAX_TENTATIVAS,
+    FILA_POLL_SECONDS,
+)
+from app.controller import LoteEnvio, finalizar_lote  # noqa: E402
+from app.whatsapp import fila  # noqa: E402
+from app.whatsapp.despacho import despachar  # noqa: E402
+
+_encerrar = False
+
+
+def enfileirar(task_id: str, lote: LoteEnvio, debug_data: Optional[str] = None) -> int:
+    """Grava o lote na fila; chamado pelo worker web no lugar do envio direto."""
+    dados = lote.para_dict()
+    envios = dados.pop("envios")
+    return fila.enfileirar_lote(task_id, dados, envios, {"debug": debug_data})
+
+
+def _manter_reserva(lote_id: int, dono: str, parar: threading.Event) -> None:
+    """Renova a reserva do lote até ``parar`` ser sinalizado."""
+    intervalo = max(1.0, FILA_LEASE_SECONDS / 3)
+    while not parar.wait(intervalo):
+        try:
+            if not fila.renovar_reserva(lote_id, dono):
+                logging.error("Reserva do lote %d perdida para outro despachante", lote_id)
+                return
+        except Exception:  # noqa: BLE001
+            logging.exception("Falha ao renovar a reserva do lote %d", lote_id)
+
+
+def processar_proximo_lote() -> bool:
+    """Envia o próximo lote da fila. Retorna ``False`` se não havia lote."""
+    from app.tasks import concluir_tarefa
+
+    for lote_esgotado, tarefa_esgotada in fila.descartar_lotes_esgotados():
+        logging.error("Lote %d descartado após %d tentativas", lote_esgotado, FILA_MAX_TENTATIVAS)
+        concluir_tarefa(
+            tarefa_esgotada, error=f"Envio abandonado após {FILA_MAX_TENTATIVAS} tentativas"
+        )
+
+    reservado = fila.reservar_lote()
+    if reservado is None:
+        return False
+    lote_id, task_id, dados, extra, dono = reservado
+
+    itens = fila.itens_do_lote(lote_id)
+    lote = LoteEnvio.de_dict(dict(dados, envios=[envio for _, envio, _, _ in itens]))
+    posicoes = {envio.chave: posicao for (posicao, _, _, _), envio in zip(itens, lote.envios)}
+    pendentes = [envio for (_, _, status, _), envio in zip(itens, lote.envios) if status == fila.ITEM_PENDENTE]
+    logging.info(
+        "Lote %d (tarefa %s): %d de %d envios pendentes", lote_id, task_id, len(pendentes), len(itens)
+    )
+
+    def registrar(chave, erro: Optional[Exception]) -> None:
+        fila.registrar_item(lote_id, posicoes[chave], None if erro is None else str(erro), dono)
+
+    chaves_registro = {chave: f"{task_id}:{posicao}" for chave, posicao in posicoes.items()}
+    estatisticas_envio: Dict[str, Any] = {}
+    parar = threading.Event()
+    renovacao = threading.Thread(
+        target=_manter_reserva, args=(lote_id, dono, parar), name=f"reserva-lote-{lote_id}", daemon=True
+    )
+    renovacao.start()
+    try:
+        despachar(pendentes, estatisticas_envio, ao_concluir=registrar)
+
+        # Resultados de todos os itens, inclusive os gravados antes de uma retomada
+        resultados = []
+        for (_, _, status, erro), envio in zip(fila.itens_do_lote(lote_id), lote.envios):
+            if status == fila.ITEM_ENVIADO:
+                resultados.append((envio.chave, None))
+            else:
+                resultados.append((envio.chave, RuntimeError(erro or "Envio não realizado")))
+        logs, stats = finalizar_lote(lote, resultados, estatisticas_envio, chaves_registro)
+    except Exception:  # noqa: BLE001
+        # O lote continua reservado e será retomado quando a reserva vencer
+        logging.exception(
+            "Erro ao processar lote %d; nova tentativa após a reserva vencer (máximo de %d)",
+            lote_id,
+            FILA_MAX_TENTATIVAS,
+        )
+        return True
+    finally:
+        parar.set()
+        renovacao.join()
+
+    # Com a reserva perdida, o novo dono finaliza o lote (o histórico não duplica)
+    if not fila.renovar_reserva(lote_id, dono):
+        logging.warning("Reserva do lote %d perdida antes da conclusão; fica com o novo dono", lote_id)
+        return True
+    concluir_tarefa(task_id, result={
+        "logs": logs,
+        "stats": stats,
+        "nome_arquivo_log": lote.nome_arquivo_log,
+        "debug": extra.get("debug"),
+    })
+    if not fila.concluir_lote(lote_id, dono):
+        logging.warning("Reserva do lote %d perdida durante a conclusão", lote_id)
+    return True
+
+
+def _pedir_encerramento(signum, frame) -> None:  # noqa: ARG001
+    global _encerrar
+    logging.info("Sinal %s recebido; encerrando após o lote atual", signum)
+    _encerrar = True
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    signal.signal(signal.SIGTERM, _pedir_encerramento)
+    signal.signal(signal.SIGINT, _pedir_encerramento)
+    logging.info("Despachante iniciado")
+    while not _encerrar:
+        if not processar_proximo_lote():
+            time.sleep(FILA_POLL_SECONDS)
+
+
+if __name__ == "__main__":
+    main()
@@ -8,18 +8,32 @@ Responsável por:
 Observações:
 - Usa MySQL via ``mysql-connector-python``
 - Força ``utf8mb4`` para suportar acentuação e emojis
+- Cada processo mantém um pool de ``DB_POOL_SIZE`` conexões; o banco e as
+  tabelas são garantidos uma única vez por processo (ou no deploy, com
+  ``python -m app.history`` e ``DB_SCHEMA_AUTO=0``), e não a cada consulta
+- O schema evolui por migrações numeradas (``MIGRACOES``); as já aplicadas
+  ficam registradas na tabela ``schema_migracoes``
+- ``envios_diarios`` guarda as contagens por dia, equipe, tipo, status e
+  motivo, atualizadas junto com cada gravação em ``envios``; totais e
+  gráfico do histórico são lidos dela
 """
 from __future__ import annotations
 
+import argparse
+import hashlib
+import os
+import threading
+from collections import Counter
 from contextlib import contextmanager
 from pathlib import Path
-from datetime import datetime
-from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, TypedDict, Union
+from datetime import date, datetime, timedelta
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, TypedDict, Union
 
 import mysql.connector
 from mysql.connector.connection import MySQLConnection
 from mysql.connector.cursor import MySQLCursor
-from mysql.connector import errorcode, Error as MySQLError
+from mysql.connector import pooling, Error as MySQLError
+from mysql.connector.errors import PoolError
 import logging
 from werkzeug.utils import secure_filename
 
@@ -27,7 +41,9 @@ from app.config.settings import (
     DB_HOST,
     DB_NAME,
     DB_PASSWORD,
+    DB_POOL_SIZE,
     DB_PORT,
+    DB_SCHEMA_AUTO,
     DB_USER,
 )
 
@@ -36,6 +52,11 @@ DATETIME_FORMAT = "%d/%m/%Y %H:%M:%S"
 STATUS_SUCESSO_TOTAL = "sucesso_total"
 STATUS_ENVIO_PARCIAL = "parcial"
 
+# Estados de uma chave de idempotência de envio
+RESERVA_CONCEDIDA = "reservado"
+RESERVA_JA_ENVIADO = "enviado"
+RESERVA_EM_ANDAMENTO = "em_andamento"
+
 
 def normalizar_nome_relatorio(nome: Optional[str]) -> str:
     """Normaliza o nome do relat?rio para uso como chave ?nica."""
@@ -87,24 +108,55 @@ def _ensure_database() -> None:
         # Não interrompe forçosamente: a conexão abaixo pode funcionar se o DB já existir
 
 
+def _config_conexao() -> Dict[str, Any]:
+    return {
+        "host": DB_HOST,
+        "port": DB_PORT,
+        "database": DB_NAME,
+        "user": DB_USER,
+        "password": DB_PASSWORD,
+        "charset": "utf8mb4",
+        "use_unicode": True,
+        "autocommit": False,
+        "raise_on_warnings": False,
+        "allow_local_infile": True,
+    }
+
+
+_pool: Optional[pooling.MySQLConnectionPool] = None
+_pool_pid: Optional[int] = None
+_pool_lock = threading.Lock()
+
+
+def _obter_pool() -> pooling.MySQLConnectionPool:
+    """Pool do processo atual; um worker criado por ``fork`` monta o seu."""
+    global _pool, _pool_pid
+    pid = os.getpid()
+    if _pool is not None and _pool_pid == pid:
+        return _pool
+    with _pool_lock:
+        if _pool is None or _pool_pid != pid:
+            _pool = pooling.MySQLConnectionPool(
+                pool_name=f"historico_{pid}",
+                pool_size=DB_POOL_SIZE,
+                pool_reset_session=True,
+                **_config_conexao(),
+            )
+            _pool_pid = pid
+        return _pool
+
+
 @contextmanager
-def get_connection() -> Iterator[MySQLConnection]:
-    """Retorna uma conexão com o banco MySQL, garantindo UTF-8."""
+def _conexao() -> Iterator[MySQLConnection]:
+    """Conexão do pool, devolvida a ele ao sair; sem checar o schema."""
     _validate_db_settings()
-    _ensure_database()
     try:
-        connection = mysql.connector.connect(
-            host=DB_HOST,
-            port=DB_PORT,
-            database=DB_NAME,
-            user=DB_USER,
-            password=DB_PASSWORD,
-            charset="utf8mb4",
-            use_unicode=True,
-            autocommit=False,
-            raise_on_warnings=False,
-            allow_local_infile=True,
-        )
+        try:
+            connection = _obter_pool().get_connection()
+        except PoolError:
+            # Pool esgotado: uma conexão avulsa evita esperar pelas demais
+            logging.debug("Pool MySQL esgotado; abrindo conexão avulsa")
+            connection = mysql.connector.connect(**_config_conexao())
     except MySQLError as exc:  # noqa: BLE001
         logging.error(
             "Erro ao conectar no MySQL %s:%s/%s: %s",
@@ -123,90 +175,260 @@ def get_connection() -> Iterator[MySQLConnection]:
             pass
 
 
-def _ensure_column(cursor: MySQLCursor, column_name: str, definition: str) -> None:
-    """Cria a coluna informada caso ela ainda não exista."""
+@contextmanager
+def get_connection() -> Iterator[MySQLConnection]:
+    """Retorna uma conexão com o banco MySQL, garantindo UTF-8 e o schema."""
+    garantir_schema()
+    with _conexao() as connection:
+        yield connection
 
-    cursor.execute("SHOW COLUMNS FROM envios LIKE %s", (column_name,))
-    if cursor.fetchone() is None:
-        cursor.execute(f"ALTER TABLE envios ADD COLUMN {column_name} {definition}")
 
+def _existe_coluna(cursor: MySQLCursor, tabela: str, coluna: str) -> bool:
+    cursor.execute(f"SHOW COLUMNS FROM {tabela} LIKE %s", (coluna,))
+    return bool(cursor.fetchall())
 
-def init_db() -> None:
-    """Cria a tabela de histórico e garante as colunas necessárias."""
 
-    with get_connection() as conn:
-        cursor = conn.cursor()
-        try:
-            try:
-                cursor.execute(
-                    (
-                        "CREATE TABLE IF NOT EXISTS envios ("
-                        "id INT AUTO_INCREMENT PRIMARY KEY,"
-                        "data_envio DATETIME NOT NULL,"
-                        "equipe VARCHAR(255) NOT NULL,"
-                        "tipo_relatorio VARCHAR(255) NOT NULL,"
-                        "status VARCHAR(255) NOT NULL,"
-                        "pessoa VARCHAR(255) NULL,"
-                        "motivo_envio TEXT NULL"
-                        ") ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci"
-                    )
-                )
-            except MySQLError as exc:  # noqa: BLE001
-                if exc.errno not in {errorcode.ER_TABLE_EXISTS_ERROR, errorcode.ER_DB_CREATE_EXISTS}:
-                    logging.error("Erro ao criar tabela de histórico: %s", exc)
-                    raise
-            # Redundante, mas mantém compatibilidade caso a tabela exista com schema antigo
-            _ensure_column(cursor, "pessoa", "VARCHAR(255) NULL")
-            _ensure_column(cursor, "motivo_envio", "TEXT NULL")
-            _ensure_column(cursor, "nome_relatorio", "VARCHAR(255) NULL")
-            conn.commit()
-        finally:
-            cursor.close()
+def _existe_indice(cursor: MySQLCursor, tabela: str, indice: str) -> bool:
+    cursor.execute(f"SHOW INDEX FROM {tabela} WHERE Key_name = %s", (indice,))
+    return bool(cursor.fetchall())
 
 
+def _adicionar_coluna(cursor: MySQLCursor, tabela: str, coluna: str, definicao: str) -> None:
+    if not _existe_coluna(cursor, tabela, coluna):
+        cursor.execute(f"ALTER TABLE {tabela} ADD COLUMN {coluna} {definicao}")
 
-def _init_relatorio_tables() -> None:
-    """Garante as tabelas auxiliares de controle de relatórios."""
 
-    with get_connection() as conn:
-        cursor = conn.cursor()
+def _criar_indice(cursor: MySQLCursor, tabela: str, indice: str, colunas: str) -> None:
+    """Cria o índice sem bloquear as escritas na tabela enquanto ele é montado."""
+    if not _existe_indice(cursor, tabela, indice):
+        cursor.execute(
+            f"ALTER TABLE {tabela} ADD INDEX {indice} ({colunas}), ALGORITHM=INPLACE, LOCK=NONE"
+        )
+
+
+# Os passos são idempotentes: DDL no MySQL faz commit implícito, então uma
+# migração interrompida no meio precisa poder ser reaplicada por inteiro.
+
+def _migracao_envios(cursor: MySQLCursor) -> None:
+    cursor.execute(
+        (
+            "CREATE TABLE IF NOT EXISTS envios ("
+            "id INT AUTO_INCREMENT PRIMARY KEY,"
+            "data_envio DATETIME NOT NULL,"
+            "equipe VARCHAR(255) NOT NULL,"
+            "tipo_relatorio VARCHAR(255) NOT NULL,"
+            "status VARCHAR(255) NOT NULL,"
+            "pessoa VARCHAR(255) NULL,"
+            "motivo_envio TEXT NULL,"
+            "nome_relatorio VARCHAR(255) NULL"
+            ") ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci"
+        )
+    )
+    # Bancos anteriores às migrações podem ter a tabela sem estas colunas
+    _adicionar_coluna(cursor, "envios", "pessoa", "VARCHAR(255) NULL")
+    _adicionar_coluna(cursor, "envios", "motivo_envio", "TEXT NULL")
+    _adicionar_coluna(cursor, "envios", "nome_relatorio", "VARCHAR(255) NULL")
+
+
+def _migracao_relatorios(cursor: MySQLCursor) -> None:
+    cursor.execute(
+        (
+            "CREATE TABLE IF NOT EXISTS relatorios ("
+            "id INT AUTO_INCREMENT PRIMARY KEY,"
+            "nome_relatorio VARCHAR(255) NOT NULL UNIQUE,"
+            "nome_original VARCHAR(255) NULL,"
+            "tipo_relatorio VARCHAR(255) NOT NULL,"
+            "status VARCHAR(32) NOT NULL,"
+            "total_mensagens INT NOT NULL DEFAULT 0,"
+            "mensagens_sucesso INT NOT NULL DEFAULT 0,"
+            "mensagens_erro INT NOT NULL DEFAULT 0,"
+            "atualizado_em DATETIME NOT NULL"
+            ") ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci"
+        )
+    )
+    cursor.execute(
+        (
+            "CREATE TABLE IF NOT EXISTS relatorio_pendencias ("
+            "id INT AUTO_INCREMENT PRIMARY KEY,"
+            "relatorio_id INT NOT NULL,"
+            "equipe VARCHAR(255) NOT NULL,"
+            "registrado_em DATETIME NOT NULL,"
+            "UNIQUE KEY relatorio_equipe (relatorio_id, equipe),"
+            "CONSTRAINT fk_relatorio_pendencias_relatorio "
+            "FOREIGN KEY (relatorio_id) REFERENCES relatorios (id) "
+            "ON DELETE CASCADE"
+            ") ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci"
+        )
+    )
+
+
+def _migracao_idempotencia(cursor: MySQLCursor) -> None:
+    cursor.execute(
+        (
+            "CREATE TABLE IF NOT EXISTS envios_idempotencia ("
+            "chave CHAR(64) NOT NULL PRIMARY KEY,"
+            "nome_relatorio VARCHAR(255) NULL,"
+            "equipe VARCHAR(255) NOT NULL,"
+            "status VARCHAR(16) NOT NULL,"
+            "tentativas INT NOT NULL DEFAULT 0,"
+            "criado_em DATETIME NOT NULL,"
+            "atualizado_em DATETIME NOT NULL"
+            ") ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci"
+        )
+    )
+
+
+def _migracao_indices_envios(cursor: MySQLCursor) -> None:
+    # Período sozinho ou com equipe (filtros do histórico)
+    _criar_indice(cursor, "envios", "idx_envios_data_equipe", "data_envio, equipe")
+    # Equipe com ou sem período; também atende o SELECT DISTINCT equipe
+    _criar_indice(cursor, "envios", "idx_envios_equipe_data", "equipe, data_envio")
+    _criar_indice(cursor, "envios", "idx_envios_tipo_data", "tipo_relatorio, data_envio")
+    _criar_indice(cursor, "envios", "idx_envios_nome_relatorio", "nome_relatorio")
+
+
+# Agregação de ``envios`` no formato de ``envios_diarios``; status e motivo
+# entram na chave pelo MD5 (com as larguras de ``envios`` a chave passaria do
+# limite do InnoDB), que o Python reproduz em _acumular_envios_diarios
+_SQL_AGREGAR_ENVIOS = (
+    "INSERT INTO envios_diarios "
+    "(dia, equipe, tipo_relatorio, status, status_hash, motivo_hash, motivo, quantidade) "
+    "SELECT DATE(data_envio), equipe, tipo_relatorio, status, MD5(status), "
+    "MD5(COALESCE(motivo_envio, '')), MIN(motivo_envio), COUNT(*) FROM envios "
+)
+_SQL_AGRUPAR_ENVIOS = (
+    " GROUP BY DATE(data_envio), equipe, tipo_relatorio, status, MD5(COALESCE(motivo_envio, ''))"
+)
+
+
+def _migracao_envios_diarios(cursor: MySQLCursor) -> None:
+    cursor.execute(
+        (
+            "CREATE TABLE IF NOT EXISTS envios_diarios ("
+            "dia DATE NOT NULL,"
+            "equipe VARCHAR(255) NOT NULL,"
+            "tipo_relatorio VARCHAR(255) NOT NULL,"
+            "status VARCHAR(255) NOT NULL,"
+            "status_hash CHAR(32) CHARACTER SET ascii NOT NULL,"
+            "motivo_hash CHAR(32) CHARACTER SET ascii NOT NULL,"
+            "motivo TEXT NULL,"
+            "quantidade INT NOT NULL DEFAULT 0,"
+            "PRIMARY KEY (dia, equipe, tipo_relatorio, status_hash, motivo_hash),"
+            "KEY idx_envios_diarios_equipe_dia (equipe, dia),"
+            "KEY idx_envios_diarios_tipo_dia (tipo_relatorio, dia)"
+            ") ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci"
+        )
+    )
+    # O histórico existente não é agregado aqui: a migração roda com a trava
+    # tomada e os demais workers esperando. O preenchimento é feito um dia por
+    # transação pelo --reconstruir-agregado.
+    cursor.execute("SELECT 1 FROM envios LIMIT 1")
+    if cursor.fetchall():
+        logging.warning(
+            "envios_diarios criada vazia; rode 'python -m app.history --reconstruir-agregado' "
+            "para agregar o histórico existente"
+        )
+
+
+def _migracao_envios_registros(cursor: MySQLCursor) -> None:
+    cursor.execute(
+        (
+            "CREATE TABLE IF NOT EXISTS envios_registros ("
+            "chave VARCHAR(128) CHARACTER SET ascii NOT NULL PRIMARY KEY,"
+            "registrado_em DATETIME NOT NULL"
+            ") ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci"
+        )
+    )
+
+
+# Versões em ordem. Uma versão aplicada não deve mudar: alterações entram como versão nova.
+MIGRACOES: List[Tuple[int, str, Callable[[MySQLCursor], None]]] = [
+    (1, "tabela envios", _migracao_envios),
+    (2, "tabelas de controle de relatórios", _migracao_relatorios),
+    (3, "tabela de idempotência dos envios", _migracao_idempotencia),
+    (4, "índices de consulta do histórico", _migracao_indices_envios),
+    (5, "agregado diário dos envios", _migracao_envios_diarios),
+    (6, "registro idempotente dos envios da fila", _migracao_envios_registros),
+]
+
+# Trava nomeada do MySQL que impede dois processos de migrarem ao mesmo tempo
+_TRAVA_MIGRACOES = "disparador_schema_migracoes"
+_TRAVA_MIGRACOES_SEGUNDOS = 120
+
+
+def aplicar_migracoes(conn: MySQLConnection) -> List[int]:
+    """Aplica as migrações pendentes e retorna as versões aplicadas agora."""
+
+    aplicadas_agora: List[int] = []
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT GET_LOCK(%s, %s)", (_TRAVA_MIGRACOES, _TRAVA_MIGRACOES_SEGUNDOS))
+        (obtida,) = cursor.fetchone()
+        if obtida != 1:
+            raise RuntimeError("Tempo esgotado aguardando outra migração do histórico")
         try:
             cursor.execute(
                 (
-                    "CREATE TABLE IF NOT EXISTS relatorios ("
-                    "id INT AUTO_INCREMENT PRIMARY KEY,"
-                    "nome_relatorio VARCHAR(255) NOT NULL UNIQUE,"
-                    "nome_original VARCHAR(255) NULL,"
-                    "tipo_relatorio VARCHAR(255) NOT NULL,"
-                    "status VARCHAR(32) NOT NULL,"
-                    "total_mensagens INT NOT NULL DEFAULT 0,"
-                    "mensagens_sucesso INT NOT NULL DEFAULT 0,"
-                    "mensagens_erro INT NOT NULL DEFAULT 0,"
-                    "atualizado_em DATETIME NOT NULL"
+                    "CREATE TABLE IF NOT EXISTS schema_migracoes ("
+                    "versao INT NOT NULL PRIMARY KEY,"
+                    "descricao VARCHAR(255) NOT NULL,"
+                    "aplicada_em DATETIME NOT NULL"
                     ") ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci"
                 )
             )
-            cursor.execute(
-                (
-                    "CREATE TABLE IF NOT EXISTS relatorio_pendencias ("
-                    "id INT AUTO_INCREMENT PRIMARY KEY,"
-                    "relatorio_id INT NOT NULL,"
-                    "equipe VARCHAR(255) NOT NULL,"
-                    "registrado_em DATETIME NOT NULL,"
-                    "UNIQUE KEY relatorio_equipe (relatorio_id, equipe),"
-                    "CONSTRAINT fk_relatorio_pendencias_relatorio "
-                    "FOREIGN KEY (relatorio_id) REFERENCES relatorios (id) "
-                    "ON DELETE CASCADE"
-                    ") ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci"
+            cursor.execute("SELECT versao FROM schema_migracoes")
+            aplicadas = {versao for (versao,) in cursor.fetchall()}
+            for versao, descricao, passo in MIGRACOES:
+                if versao in aplicadas:
+                    continue
+                logging.info("Aplicando migração %d do histórico: %s", versao, descricao)
+                passo(cursor)
+                cursor.execute(
+                    "INSERT INTO schema_migracoes (versao, descricao, aplicada_em) VALUES (%s, %s, %s)",
+                    (versao, descricao, datetime.now()),
                 )
-            )
-            conn.commit()
-        except MySQLError as exc:  # noqa: BLE001
-            conn.rollback()
-            logging.error("Erro ao garantir tabelas de relatorio: %s", exc)
-            raise
+                conn.commit()
+                aplicadas_agora.append(versao)
         finally:
-            cursor.close()
+            cursor.execute("DO RELEASE_LOCK(%s)", (_TRAVA_MIGRACOES,))
+    finally:
+        cursor.close()
+    return aplicadas_agora
+
+
+_schema_pronto = False
+_schema_lock = threading.Lock()
+
+
+def garantir_schema(forcar: bool = False) -> None:
+    """Cria o banco e aplica as migrações uma única vez por processo.
+
+    As demais chamadas retornam sem consultar o banco. Com
+    ``DB_SCHEMA_AUTO=0`` nada é feito aqui e o schema fica a cargo do
+    deploy (``python -m app.history``), que chama com ``forcar=True``.
+    """
+
+    global _schema_pronto
+    if _schema_pronto or not (DB_SCHEMA_AUTO or forcar):
+        return
+    with _schema_lock:
+        if _schema_pronto:
+            return
+        _ensure_database()
+        with _conexao() as conn:
+            try:
+                aplicar_migracoes(conn)
+            except MySQLError as exc:  # noqa: BLE001
+                conn.rollback()
+                logging.error("Erro ao migrar o schema do histórico: %s", exc)
+                raise
+        _schema_pronto = True
+
+
+def init_db() -> None:
+    """Cria a tabela de histórico e as auxiliares, se ainda não existirem."""
+
+    garantir_schema(forcar=True)
 
 
 def registrar_resultado_relatorio(
@@ -234,7 +456,6 @@ tipo_relatorio: str,
     if equipes_com_erro:
         equipes_falhas = sorted({str(equipe).strip() for equipe in equipes_com_erro if str(equipe).strip()})
 
-    _init_relatorio_tables()
     agora = datetime.now()
 
     with get_connection() as conn:
@@ -314,8 +535,6 @@ def obter_status_relatorio(nome_relatorio: Optional[str]) -> Optional[Dict[str,
     if not nome_chave:
         return None
 
-    _init_relatorio_tables()
-
     with get_connection() as conn:
         cursor = conn.cursor(dictionary=True)
         try:
@@ -369,6 +588,95 @@ def obter_status_relatorio(nome_relatorio: Optional[str]) -> Optional[Dict[str,
 
 
 
+def gerar_chave_idempotencia(nome_relatorio: Optional[str], equipe: str, mensagem: str) -> str:
+    """Gera a chave de um envio a partir do relatório, da equipe e do conteúdo."""
+
+    conteudo = hashlib.sha256(mensagem.encode("utf-8")).hexdigest()
+    base = "|".join([normalizar_nome_relatorio(nome_relatorio), str(equipe).strip().upper(), conteudo])
+    return hashlib.sha256(base.encode("utf-8")).hexdigest()
+
+
+def reservar_envio(
+    chave: str,
+    nome_relatorio: Optional[str],
+    equipe: str,
+    prazo_segundos: float,
+) -> str:
+    """Marca o envio como em andamento antes de chamar a Evolution.
+
+    Retorna ``RESERVA_CONCEDIDA`` quando o envio pode seguir,
+    ``RESERVA_JA_ENVIADO`` quando a mesma mensagem já foi entregue e
+    ``RESERVA_EM_ANDAMENTO`` quando outra execução a reservou há menos de
+    ``prazo_segundos``. Reservas mais antigas que o prazo (por exemplo, de
+    um worker que morreu no meio do envio) podem ser retomadas.
+    """
+
+    agora = datetime.now()
+    nome_chave = normalizar_nome_relatorio(nome_relatorio) or None
+
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(
+                (
+                    "INSERT IGNORE INTO envios_idempotencia "
+                    "(chave, nome_relatorio, equipe, status, tentativas, criado_em, atualizado_em) "
+                    "VALUES (%s, %s, %s, 'enviando', 1, %s, %s)"
+                ),
+                (chave, nome_chave, equipe, agora, agora),
+            )
+            if cursor.rowcount == 1:
+                conn.commit()
+                return RESERVA_CONCEDIDA
+
+            cursor.execute(
+                "SELECT status, atualizado_em FROM envios_idempotencia WHERE chave = %s FOR UPDATE",
+                (chave,),
+            )
+            status, atualizado_em = cursor.fetchone()
+            if status == "enviado":
+                conn.commit()
+                return RESERVA_JA_ENVIADO
+            if status == "enviando" and atualizado_em > agora - timedelta(seconds=prazo_segundos):
+                conn.commit()
+                return RESERVA_EM_ANDAMENTO
+
+            cursor.execute(
+                (
+                    "UPDATE envios_idempotencia SET status = 'enviando', "
+                    "tentativas = tentativas + 1, atualizado_em = %s WHERE chave = %s"
+                ),
+                (agora, chave),
+            )
+            conn.commit()
+            return RESERVA_CONCEDIDA
+        except MySQLError as exc:  # noqa: BLE001
+            conn.rollback()
+            logging.error("Erro ao reservar envio %s: %s", chave, exc)
+            raise
+        finally:
+            cursor.close()
+
+
+def concluir_envio(chave: str, sucesso: bool) -> None:
+    """Registra o resultado final de um envio reservado."""
+
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(
+                "UPDATE envios_idempotencia SET status = %s, atualizado_em = %s WHERE chave = %s",
+                ("enviado" if sucesso else "falhou", datetime.now(), chave),
+            )
+            conn.commit()
+        except MySQLError as exc:  # noqa: BLE001
+            conn.rollback()
+            logging.error("Erro ao concluir envio %s: %s", chave, exc)
+            raise
+        finally:
+            cursor.close()
+
+
 class EnvioRegistro(TypedDict, total=False):
     """Estrutura padrao para registrar um envio no historico."""
 
@@ -455,6 +763,34 @@ def _executar_batches(
         lote = registros[inicio : inicio + batch_size]
         cursor.executemany(sql, lote)
 
+def _acumular_envios_diarios(cursor: MySQLCursor, registros: Sequence[PreparedEnvio]) -> None:
+    """Soma os registros recém-inseridos em ``envios_diarios``, na mesma transação."""
+    contagem = Counter(
+        (data_envio.date(), equipe, tipo_relatorio, status, motivo)
+        for data_envio, equipe, tipo_relatorio, status, _, motivo, _ in registros
+    )
+    cursor.executemany(
+        (
+            "INSERT INTO envios_diarios "
+            "(dia, equipe, tipo_relatorio, status, status_hash, motivo_hash, motivo, quantidade) "
+            "VALUES (%s, %s, %s, %s, %s, %s, %s, %s) "
+            "ON DUPLICATE KEY UPDATE quantidade = quantidade + VALUES(quantidade)"
+        ),
+        [
+            (
+                dia,
+                equipe,
+                tipo,
+                status,
+                hashlib.md5(status.encode("utf-8")).hexdigest(),
+                hashlib.md5((motivo or "").encode("utf-8")).hexdigest(),
+                motivo,
+                quantidade,
+            )
+            for (dia, equipe, tipo, status, motivo), quantidade in contagem.items()
+        ],
+    )
+
 def _executar_load_data(cursor: MySQLCursor, arquivo: Path, local: bool) -> None:
     """Importa registros via LOAD DATA (LOCAL) INFILE."""
     if not arquivo.is_file():
@@ -476,10 +812,19 @@ def _executar_load_data(cursor: MySQLCursor, arquivo: Path, local: bool) -> None
     )
     cursor.execute(sql)
 
+def _reivindicar_registro(cursor: MySQLCursor, chave: str) -> bool:
+    """Marca ``chave`` como registrada na transação atual; ``False`` se já estava."""
+    cursor.execute(
+        "INSERT IGNORE INTO envios_registros (chave, registrado_em) VALUES (%s, %s)",
+        (chave, datetime.now()),
+    )
+    return cursor.rowcount == 1
+
 def _inserir_individualmente(
     conn: MySQLConnection,
     registros: Sequence[PreparedEnvio],
     sql: str,
+    chave_registro: Optional[str] = None,
 
 ) -> None:
     """Fallback para inserir registros um a um quando o lote falha."""
@@ -489,8 +834,13 @@ def _inserir_individualmente(
     )
     cursor = conn.cursor()
     try:
+        if chave_registro and not _reivindicar_registro(cursor, chave_registro):
+            conn.rollback()
+            logging.info("Envios de '%s' já estavam no histórico; registro ignorado.", chave_registro)
+            return
         for item in registros:
             cursor.execute(sql, item)
+        _acumular_envios_diarios(cursor, registros)
         conn.commit()
     except MySQLError as exc:  # noqa: BLE001
         conn.rollback()
@@ -512,6 +862,7 @@ def registrar_envio(
     arquivo_csv: Optional[Union[str, Path]] = None,
     load_data_local: bool = True,
     fallback_para_individual: bool = True,
+    chave_registro: Optional[str] = None,
 
 ) -> None:
     """Registra envios no historico utilizando insercoes em lote.
@@ -523,6 +874,10 @@ def registrar_envio(
     para executar ``LOAD DATA`` (ou ``LOAD DATA LOCAL``) quando ja houver um
     arquivo com os dados.
 
+    Com ``chave_registro`` a gravação acontece no máximo uma vez por chave:
+    uma nova chamada com a mesma chave (por exemplo, o despachante
+    finalizando de novo um lote interrompido) não insere nada.
+
     Exemplo:
         >>> envios = [
         ...     {"equipe": "Equipe Financeiro", "tipo_relatorio": "fechamento", "status": "sucesso"}
@@ -530,7 +885,6 @@ def registrar_envio(
         ... ]
         >>> registrar_envio(envios, batch_size=200)
     """
-    init_db()
     if batch_size <= 0:
         raise ValueError("batch_size deve ser um inteiro positivo.")
     if isinstance(envios, dict):
@@ -595,14 +949,30 @@ def registrar_envio(
     with get_connection() as conn:
         cursor = conn.cursor()
         try:
+            if chave_registro and not _reivindicar_registro(cursor, chave_registro):
+                conn.rollback()
+                logging.info("Envios de '%s' já estavam no histórico; registro ignorado.", chave_registro)
+                return
             if usar_load:
                 if caminho_csv is None:
                     raise ValueError(
                         "Informe 'arquivo_csv' para utilizar LOAD DATA no registrar_envio."
                     )
+                # As linhas vêm do arquivo: o agregado é feito pelos ids inseridos.
+                # Com inserções concorrentes intercaladas, corrija com --reconstruir-agregado.
+                cursor.execute("SELECT COALESCE(MAX(id), 0) FROM envios")
+                (ultimo_id,) = cursor.fetchone()
                 _executar_load_data(cursor, caminho_csv, load_data_local)
+                cursor.execute(
+                    _SQL_AGREGAR_ENVIOS
+                    + "WHERE id > %s"
+                    + _SQL_AGRUPAR_ENVIOS
+                    + " ON DUPLICATE KEY UPDATE quantidade = quantidade + VALUES(quantidade)",
+                    (ultimo_id,),
+                )
             else:
                 _executar_batches(cursor, registros, batch_size, sql_insert)
+                _acumular_envios_diarios(cursor, registros)
         except MySQLError as exc:  # noqa: BLE001
             conn.rollback()
             logging.error(
@@ -611,7 +981,7 @@ def registrar_envio(
                 exc,
             )
             if not usar_load and fallback_para_individual:
-                _inserir_individualmente(conn, registros, sql_insert)
+                _inserir_individualmente(conn, registros, sql_insert, chave_registro)
                 return
             raise
         else:
@@ -619,17 +989,57 @@ def registrar_envio(
         finally:
             cursor.close()
 
-def listar_envios(
+# Formatos aceitos nos filtros de período: o do <input type="date"> e o brasileiro
+FORMATOS_DATA_FILTRO = ("%Y-%m-%d", "%d/%m/%Y")
+
+
+def interpretar_data_filtro(valor: Optional[Union[str, date]], campo: str) -> Optional[date]:
+    """Converte o filtro de data em ``date``; ``ValueError`` se for inválido."""
+
+    if valor is None:
+        return None
+    if isinstance(valor, datetime):
+        return valor.date()
+    if isinstance(valor, date):
+        return valor
+    texto = str(valor).strip()
+    if not texto:
+        return None
+    for formato in FORMATOS_DATA_FILTRO:
+        try:
+            return datetime.strptime(texto, formato).date()
+        except ValueError:
+            continue
+    raise ValueError(f"Data inválida em '{campo}': {texto!r}. Use AAAA-MM-DD.")
+
+
+# Tamanho das páginas de /historico/dados
+LIMITE_PAGINA_PADRAO = 200
+LIMITE_PAGINA_MAXIMO = 1000
+LIMITE_EQUIPES_PADRAO = 50
+LIMITE_EQUIPES_MAXIMO = 500
+
+_COLUNAS_ENVIO = "id, data_envio, equipe, tipo_relatorio, status, pessoa, motivo_envio, nome_relatorio"
+
+
+def _filtros_envios(
     equipe: Optional[object] = None,
     tipo: Optional[object] = None,
-    inicio: Optional[str] = None,
-    fim: Optional[str] = None,
-) -> List[Dict[str, Any]]:
-    """Retorna uma lista de envios aplicando filtros quando informados."""
-    init_db()
-    query = [
-        "SELECT data_envio, equipe, tipo_relatorio, status, pessoa, motivo_envio, nome_relatorio FROM envios WHERE 1=1"
-    ]
+    inicio: Optional[Union[str, date]] = None,
+    fim: Optional[Union[str, date]] = None,
+    coluna_data: str = "data_envio",
+) -> Tuple[List[str], List[Any]]:
+    """Condições ``AND ...`` dos filtros do histórico e seus parâmetros.
+
+    ``coluna_data`` é ``data_envio`` (DATETIME) em ``envios`` e ``dia``
+    (DATE) em ``envios_diarios``.
+    """
+    data_inicio = interpretar_data_filtro(inicio, "inicio")
+    data_fim = interpretar_data_filtro(fim, "fim")
+    if data_inicio and data_fim and data_inicio > data_fim:
+        raise ValueError("A data inicial não pode ser posterior à data final.")
+
+    query: List[str] = []
     params: List[Any] = []
 
     def _prepare_lista(valor: object) -> List[str]:
@@ -661,52 +1071,269 @@ def listar_envios(
             query.append(f"AND tipo_relatorio IN ({placeholders})")
             params.extend(tipos)
 
-    if inicio:
-        query.append("AND DATE(data_envio) >= %s")
-        params.append(inicio)
-    if fim:
-        query.append("AND DATE(data_envio) <= %s")
-        params.append(fim)
-    query.append("ORDER BY id DESC")
-    sql = " ".join(query)
+    # Intervalo semiaberto sobre a coluna pura, para que os índices em
+    # data_envio sejam usados (DATE(data_envio) obrigaria a ler a tabela toda)
+    def _limite(dia: date) -> Union[date, datetime]:
+        return dia if coluna_data == "dia" else datetime.combine(dia, datetime.min.time())
+
+    if data_inicio:
+        query.append(f"AND {coluna_data} >= %s")
+        params.append(_limite(data_inicio))
+    if data_fim:
+        query.append(f"AND {coluna_data} < %s")
+        params.append(_limite(data_fim + timedelta(days=1)))
+    return query, params
+
+
+def _montar_consulta_envios(
+    equipe: Optional[object] = None,
+    tipo: Optional[object] = None,
+    inicio: Optional[Union[str, date]] = None,
+    fim: Optional[Union[str, date]] = None,
+) -> Tuple[str, List[Any]]:
+    """Monta o SQL da listagem do histórico e seus parâmetros."""
+    filtros, params = _filtros_envios(equipe, tipo, inicio, fim)
+    sql = " ".join([f"SELECT {_COLUNAS_ENVIO} FROM envios WHERE 1=1", *filtros, "ORDER BY id DESC"])
+    return sql, params
+
+
+def explicar_consulta_envios(
+    equipe: Optional[object] = None,
+    tipo: Optional[object] = None,
+    inicio: Optional[Union[str, date]] = None,
+    fim: Optional[Union[str, date]] = None,
+) -> List[Dict[str, Any]]:
+    """Plano do MySQL (``EXPLAIN``) para a listagem com os filtros informados."""
+    sql, params = _montar_consulta_envios(equipe, tipo, inicio, fim)
+    with get_connection() as conn:
+        cursor = conn.cursor(dictionary=True)
+        try:
+            cursor.execute(f"EXPLAIN {sql}", params)
+            return cursor.fetchall()
+        finally:
+            cursor.close()
+
+
+def _formatar_envio(row: Dict[str, Any]) -> Dict[str, Any]:
+    data = row.get("data_envio")
+    if isinstance(data, datetime):
+        data_envio_formatado = data.strftime(DATETIME_FORMAT)
+    elif data:
+        data_envio_formatado = str(data)
+    else:
+        data_envio_formatado = ""
+    return {
+        "data_envio": data_envio_formatado,
+        "equipe": row.get("equipe", ""),
+        "tipo_relatorio": row.get("tipo_relatorio", ""),
+        "status": row.get("status", ""),
+        "pessoa": row.get("pessoa") or "",
+        "motivo_envio": row.get("motivo_envio") or "",
+        "nome_relatorio": row.get("nome_relatorio") or "",
+    }
+
+
+def _consultar(sql: str, params: Sequence[Any]) -> List[Dict[str, Any]]:
     with get_connection() as conn:
         cursor = conn.cursor(dictionary=True)
         try:
             cursor.execute(sql, params)
-            rows = cursor.fetchall()
+            return cursor.fetchall()
         except MySQLError as exc:  # noqa: BLE001
             logging.error("Erro ao consultar historico: %s", exc)
             raise
         finally:
             cursor.close()
-    registros: List[Dict[str, Any]] = []
-    for row in rows:
-        data = row.get("data_envio")
-        if isinstance(data, datetime):
-            data_envio_formatado = data.strftime(DATETIME_FORMAT)
-        elif data:
-            data_envio_formatado = str(data)
-        else:
-            data_envio_formatado = ""
-        registros.append(
-            {
-                "data_envio": data_envio_formatado,
-                "equipe": row.get("equipe", ""),
-                "tipo_relatorio": row.get("tipo_relatorio", ""),
-                "status": row.get("status", ""),
-                "pessoa": row.get("pessoa") or "",
-                "motivo_envio": row.get("motivo_envio") or "",
-                "nome_relatorio": row.get("nome_relatorio") or "",
-            }
-        )
-    return registros
 
 
+def listar_envios(
+    equipe: Optional[object] = None,
+    tipo: Optional[object] = None,
+    inicio: Optional[Union[str, date]] = None,
+    fim: Optional[Union[str, date]] = None,
+) -> List[Dict[str, Any]]:
+    """Retorna uma lista de envios aplicando filtros quando informados.
+
+    ``inicio`` e ``fim`` são datas (``AAAA-MM-DD`` ou ``dd/mm/aaaa``),
+    ambas inclusivas; valores inválidos levantam ``ValueError``.
+    """
+    sql, params = _montar_consulta_envios(equipe, tipo, inicio, fim)
+    return [_formatar_envio(row) for row in _consultar(sql, params)]
+
+
+def listar_envios_pagina(
+    equipe: Optional[object] = None,
+    tipo: Optional[object] = None,
+    inicio: Optional[Union[str, date]] = None,
+    fim: Optional[Union[str, date]] = None,
+    limite: int = LIMITE_PAGINA_PADRAO,
+    apos_id: Optional[int] = None,
+) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+    """Uma página do histórico, do envio mais recente para o mais antigo.
+
+    A paginação é por chave (``id < apos_id``) e não por ``OFFSET``: cada
+    página custa o mesmo, não importa quão longe esteja. Retorna os
+    registros e o cursor da próxima página (``None`` na última).
+    """
+    if limite < 1 or limite > LIMITE_PAGINA_MAXIMO:
+        raise ValueError(f"O limite deve estar entre 1 e {LIMITE_PAGINA_MAXIMO}.")
+    filtros, params = _filtros_envios(equipe, tipo, inicio, fim)
+    if apos_id is not None:
+        filtros.append("AND id < %s")
+        params.append(apos_id)
+    sql = " ".join([f"SELECT {_COLUNAS_ENVIO} FROM envios WHERE 1=1", *filtros, "ORDER BY id DESC LIMIT %s"])
+    # Uma linha a mais indica se existe próxima página
+    rows = _consultar(sql, [*params, limite + 1])
+    proximo = rows[limite - 1]["id"] if len(rows) > limite else None
+    return [_formatar_envio(row) for row in rows[:limite]], proximo
+
+
+def resumir_envios(
+    equipe: Optional[object] = None,
+    tipo: Optional[object] = None,
+    inicio: Optional[Union[str, date]] = None,
+    fim: Optional[Union[str, date]] = None,
+) -> Dict[str, int]:
+    """Totais de envios, sucessos e erros, somados a partir de ``envios_diarios``."""
+    filtros, params = _filtros_envios(equipe, tipo, inicio, fim, coluna_data="dia")
+    sql = " ".join([
+        "SELECT COALESCE(SUM(quantidade), 0) AS total,",
+        "COALESCE(SUM(CASE WHEN status = 'sucesso' THEN quantidade ELSE 0 END), 0) AS sucessos,",
+        "COALESCE(SUM(CASE WHEN status = 'erro' THEN quantidade ELSE 0 END), 0) AS erros",
+        "FROM envios_diarios WHERE 1=1",
+        *filtros,
+    ])
+    row = _consultar(sql, params)[0]
+    return {chave: int(row[chave] or 0) for chave in ("total", "sucessos", "erros")}
+
+
+def contar_envios_por_equipe(
+    equipe: Optional[object] = None,
+    tipo: Optional[object] = None,
+    inicio: Optional[Union[str, date]] = None,
+    fim: Optional[Union[str, date]] = None,
+) -> List[Dict[str, Any]]:
+    """Sucessos e erros por equipe, a partir de ``envios_diarios`` (gráfico)."""
+    filtros, params = _filtros_envios(equipe, tipo, inicio, fim, coluna_data="dia")
+    sql = " ".join([
+        "SELECT equipe, SUM(quantidade) AS total,",
+        "SUM(CASE WHEN status = 'sucesso' THEN quantidade ELSE 0 END) AS sucessos,",
+        "SUM(CASE WHEN status = 'erro' THEN quantidade ELSE 0 END) AS erros",
+        "FROM envios_diarios WHERE 1=1",
+        *filtros,
+        "GROUP BY equipe ORDER BY equipe",
+    ])
+    return [
+        {
+            "equipe": row.get("equipe", ""),
+            "total": int(row["total"] or 0),
+            "sucessos": int(row["sucessos"] or 0),
+            "erros": int(row["erros"] or 0),
+        }
+        for row in _consultar(sql, params)
+    ]
+
+
+def reconstruir_envios_diarios(
+    inicio: Optional[Union[str, date]] = None,
+    fim: Optional[Union[str, date]] = None,
+) -> int:
+    """Refaz ``envios_diarios`` a partir de ``envios``, um dia por transação.
+
+    Sem período, cobre do primeiro ao último envio registrado. Retorna a
+    quantidade de dias reconstruídos.
+    """
+    data_inicio = interpretar_data_filtro(inicio, "inicio")
+    data_fim = interpretar_data_filtro(fim, "fim")
+    dias = 0
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        try:
+            if data_inicio is None or data_fim is None:
+                cursor.execute("SELECT MIN(data_envio), MAX(data_envio) FROM envios")
+                primeiro, ultimo = cursor.fetchone()
+                if primeiro is None:
+                    return 0
+                data_inicio = data_inicio or primeiro.date()
+                data_fim = data_fim or ultimo.date()
+            dia = data_inicio
+            while dia <= data_fim:
+                comeco = datetime.combine(dia, datetime.min.time())
+                cursor.execute("DELETE FROM envios_diarios WHERE dia = %s", (dia,))
+                cursor.execute(
+                    _SQL_AGREGAR_ENVIOS + "WHERE data_envio >= %s AND data_envio < %s" + _SQL_AGRUPAR_ENVIOS,
+                    (comeco, comeco + timedelta(days=1)),
+                )
+                conn.commit()
+                dias += 1
+                dia += timedelta(days=1)
+        except MySQLError as exc:  # noqa: BLE001
+            conn.rollback()
+            logging.error("Erro ao reconstruir o agregado diário: %s", exc)
+            raise
+        finally:
+            cursor.close()
+    return dias
+
+
+def agrupar_envios_por_equipe(
+    equipe: Optional[object] = None,
+    tipo: Optional[object] = None,
+    inicio: Optional[Union[str, date]] = None,
+    fim: Optional[Union[str, date]] = None,
+    limite_equipes: int = LIMITE_EQUIPES_PADRAO,
+    apos_equipe: Optional[str] = None,
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """Contagem por equipe, pessoa, tipo e motivo de uma página de equipes (tabela).
+
+    As equipes da página saem de ``envios_diarios`` em ordem alfabética,
+    depois de ``apos_equipe``; só elas são agrupadas em ``envios``. Retorna
+    os grupos e o cursor da próxima página (``None`` na última).
+    """
+    if limite_equipes < 1 or limite_equipes > LIMITE_EQUIPES_MAXIMO:
+        raise ValueError(f"O limite de equipes deve estar entre 1 e {LIMITE_EQUIPES_MAXIMO}.")
+    filtros_dia, params_dia = _filtros_envios(equipe, tipo, inicio, fim, coluna_data="dia")
+    if apos_equipe is not None:
+        filtros_dia.append("AND equipe > %s")
+        params_dia.append(apos_equipe)
+    sql_equipes = " ".join([
+        "SELECT DISTINCT equipe FROM envios_diarios WHERE 1=1",
+        *filtros_dia,
+        "ORDER BY equipe LIMIT %s",
+    ])
+    equipes = [row["equipe"] for row in _consultar(sql_equipes, [*params_dia, limite_equipes + 1])]
+    proxima = equipes[limite_equipes - 1] if len(equipes) > limite_equipes else None
+    equipes = equipes[:limite_equipes]
+    if not equipes:
+        return [], None
+
+    filtros, params = _filtros_envios(equipes, tipo, inicio, fim)
+    sql = " ".join([
+        "SELECT equipe, pessoa, tipo_relatorio, motivo_envio, COUNT(*) AS total,",
+        "SUM(CASE WHEN status = 'sucesso' THEN 1 ELSE 0 END) AS sucessos,",
+        "SUM(CASE WHEN status = 'erro' THEN 1 ELSE 0 END) AS erros",
+        "FROM envios WHERE 1=1",
+        *filtros,
+        "GROUP BY equipe, pessoa, tipo_relatorio, motivo_envio",
+    ])
+    grupos = [
+        {
+            "equipe": row.get("equipe", ""),
+            "pessoa": row.get("pessoa") or "",
+            "tipo_relatorio": row.get("tipo_relatorio", ""),
+            "motivo_envio": row.get("motivo_envio") or "",
+            "total": int(row["total"]),
+            "sucessos": int(row["sucessos"] or 0),
+            "erros": int(row["erros"] or 0),
+        }
+        for row in _consultar(sql, params)
+    ]
+    return grupos, proxima
+
 
 def listar_equipes_disponiveis() -> List[str]:
     """Retorna todas as equipes registradas no histórico."""
 
-    init_db()
     equipes: List[str] = []
     with get_connection() as conn:
         cursor = conn.cursor()
@@ -722,3 +1349,27 @@ def listar_equipes_disponiveis() -> List[str]:
         finally:
             cursor.close()
     return equipes
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Schema e manutenção do histórico de envios.")
+    parser.add_argument(
+        "--reconstruir-agregado",
+        action="store_true",
+        help="refaz envios_diarios a partir de envios (todo o período ou --inicio/--fim)",
+    )
+    parser.add_argument("--inicio", help="primeiro dia a reconstruir (AAAA-MM-DD)")
+    parser.add_argument("--fim", help="último dia a reconstruir (AAAA-MM-DD)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    # Etapa de deploy: cria o banco e as tabelas antes de subir os workers
+    init_db()
+    logging.info("Schema do histórico garantido em '%s'", DB_NAME)
+    if args.reconstruir_agregado:
+        dias = reconstruir_envios_diarios(args.inicio, args.fim)
+        logging.info("Agregado diário reconstruído para %d dia(s)", dias)
+
+
+if __name__ == "__main__":
+    main()
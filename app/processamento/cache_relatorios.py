@@ -0,0 +1,136 @@
+"""Cache em disco dos relatórios já processados.
+
+O mesmo CSV costuma ser lido até três vezes: em ``/equipes`` para listar as
+equipes, em ``/enviar`` dentro do ``processar_csv`` e, com ``debugMode``,
+para montar o ``debug_data``. Os ``DataFrames`` retornados por
+``carregar_dados`` são gravados em Parquet, indexados pelo SHA-256 do
+arquivo junto com ``tipo_relatorio`` e ``ignorar_sabados``. Assim, qualquer
+upload do mesmo conteúdo reaproveita o resultado, mesmo entre workers.
+
+Entradas sem uso há mais de ``CSV_CACHE_MAX_AGE_HOURS`` são descartadas e,
+quando o diretório passa de ``CSV_CACHE_MAX_MB``, as menos usadas saem
+primeiro. Sem ``pyarrow`` instalado o cache fica desativado.
+"""
+from __future__ import annotations
+
+import hashlib
+import importlib.util
+import logging
+import os
+import tempfile
+import time
+from pathlib import Path
+from typing import List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from app.config.settings import CSV_CACHE_DIR, CSV_CACHE_MAX_AGE_HOURS, CSV_CACHE_MAX_MB
+from app.processamento.csv_reader import carregar_dados
+
+VERSAO_CACHE = "1"
+
+CACHE_DIR = Path(CSV_CACHE_DIR)
+
+
+def _cache_disponivel() -> bool:
+    if CSV_CACHE_MAX_MB <= 0:
+        return False
+    return importlib.util.find_spec("pyarrow") is not None
+
+
+def calcular_hash_arquivo(caminho: str) -> str:
+    """Calcula o SHA-256 do conteúdo do arquivo."""
+    sha = hashlib.sha256()
+    with open(caminho, "rb") as arquivo:
+        for bloco in iter(lambda: arquivo.read(1024 * 1024), b""):
+            sha.update(bloco)
+    return sha.hexdigest()
+
+
+def _chave_cache(hash_arquivo: str, tipo_relatorio: str, ignorar_sabados: bool) -> str:
+    # Apenas a Auditoria depende de ``ignorar_sabados``
+    sabados = "sab" if ignorar_sabados and tipo_relatorio == "Auditoria" else "todos"
+    tipo = hashlib.sha1(tipo_relatorio.encode("utf-8")).hexdigest()[:8]
+    return f"v{VERSAO_CACHE}_{hash_arquivo}_{tipo}_{sabados}"
+
+
+def _restaurar_nulos(df: pd.DataFrame) -> pd.DataFrame:
+    """Converte os ``None`` vindos do Parquet em ``NaN``, como no ``read_csv``."""
+    for coluna in df.columns:
+        if df[coluna].dtype == object:
+            serie = df[coluna]
+            df[coluna] = serie.where(serie.notna(), np.nan)
+    return df
+
+
+def _gravar(destino: Path, df: pd.DataFrame) -> None:
+    temp_path = None
+    try:
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile(
+            delete=False, dir=CACHE_DIR, suffix=".parquet.tmp"
+        ) as tmp_file:
+            temp_path = Path(tmp_file.name)
+        df.to_parquet(temp_path, engine="pyarrow")
+        temp_path.replace(destino)
+    except Exception as exc:  # noqa: BLE001
+        logging.warning("Não foi possível gravar o relatório em cache (%s): %s", destino.name, exc)
+        if temp_path and temp_path.exists():
+            temp_path.unlink(missing_ok=True)
+
+
+def limpar_cache() -> None:
+    """Aplica as políticas de idade e tamanho máximo do cache."""
+    if not CACHE_DIR.exists():
+        return
+    agora = time.time()
+    idade_maxima = CSV_CACHE_MAX_AGE_HOURS * 3600
+    limite_bytes = CSV_CACHE_MAX_MB * 1024 * 1024
+
+    entradas: List[Tuple[float, int, Path]] = []
+    for arquivo in CACHE_DIR.glob("*.parquet"):
+        try:
+            stat = arquivo.stat()
+        except FileNotFoundError:
+            continue
+        if idade_maxima > 0 and agora - stat.st_mtime > idade_maxima:
+            arquivo.unlink(missing_ok=True)
+            continue
+        entradas.append((stat.st_mtime, stat.st_size, arquivo))
+
+    total = sum(tamanho for _, tamanho, _ in entradas)
+    for _, tamanho, arquivo in sorted(entradas):
+        if total <= limite_bytes:
+            break
+        arquivo.unlink(missing_ok=True)
+        total -= tamanho
+
+
+def carregar_dados_com_cache(caminho_csv, ignorar_sabados, tipo_relatorio):
+    """Versão de ``carregar_dados`` que reaproveita relatórios já processados.
+
+    Cada chamada devolve um ``DataFrame`` novo, que pode ser alterado
+    livremente pelo chamador.
+    """
+    if not _cache_disponivel():
+        return carregar_dados(caminho_csv, ignorar_sabados, tipo_relatorio)
+
+    chave = _chave_cache(calcular_hash_arquivo(caminho_csv), tipo_relatorio, ignorar_sabados)
+    destino = CACHE_DIR / f"{chave}.parquet"
+
+    if destino.exists():
+        try:
+            df = pd.read_parquet(destino, engine="pyarrow")
+            # Renova a entrada para a política de "menos usados"
+            os.utime(destino)
+            logging.info("Relatório carregado do cache: %s", chave)
+            return _restaurar_nulos(df)
+        except Exception as exc:  # noqa: BLE001
+            logging.warning("Entrada de cache inválida (%s): %s", chave, exc)
+            destino.unlink(missing_ok=True)
+
+    df = carregar_dados(caminho_csv, ignorar_sabados, tipo_relatorio)
+    _gravar(destino, df)
+    limpar_cache()
+    return df
@@ -0,0 +1,246 @@
+"""Leitura rápida dos CSVs exportados pelo PontoMais.
+
+Os relatórios do PontoMais trazem um cabeçalho e um rodapé com texto livre.
+O ``skipfooter`` do pandas resolve o rodapé, mas só funciona com o parser
+``engine="python"``, que é muito mais lento. Aqui o limite do rodapé é
+localizado varrendo apenas o final do arquivo. O corpo é entregue ao parser
+C (ou ao ``pyarrow``, quando disponível) já sem o rodapé.
+"""
+from __future__ import annotations
+
+import csv
+import io
+import logging
+import os
+from typing import Any, Iterator, Optional
+
+import numpy as np
+import pandas as pd
+from pandas._libs.parsers import STR_NA_VALUES
+
+from app.config.settings import CSV_ENGINE
+
+# Tamanho do bloco lido a partir do fim do arquivo na busca pelo rodapé
+TAMANHO_BLOCO_RODAPE = 64 * 1024
+
+ENGINES_SUPORTADAS = {"c", "pyarrow"}
+
+
+class _ArquivoTruncado(io.RawIOBase):
+    """Expõe apenas o trecho ``[inicio, fim)`` de um arquivo binário."""
+
+    def __init__(self, caminho: str, inicio: int, fim: int) -> None:
+        super().__init__()
+        self._arquivo = open(caminho, "rb")
+        self._arquivo.seek(inicio)
+        self._restante = fim - inicio
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        if self._restante <= 0:
+            return 0
+        visao = memoryview(buffer)[: self._restante]
+        lidos = self._arquivo.readinto(visao)
+        self._restante -= lidos or 0
+        return lidos or 0
+
+    def close(self) -> None:
+        try:
+            self._arquivo.close()
+        finally:
+            super().close()
+
+
+def localizar_inicio_rodape(caminho_csv: str, linhas_rodape: int) -> Optional[int]:
+    """Retorna o offset (em bytes) onde começam as ``linhas_rodape`` finais.
+
+    Replica a contagem do ``skipfooter`` do pandas: linhas em branco contam
+    como linhas e campos entre aspas com quebra de linha formam uma única
+    linha lógica. Retorna ``None`` quando o arquivo não tem linhas
+    suficientes.
+    """
+    if linhas_rodape <= 0:
+        return os.path.getsize(caminho_csv)
+
+    with open(caminho_csv, "rb") as arquivo:
+        arquivo.seek(0, os.SEEK_END)
+        tamanho = arquivo.tell()
+        fim = tamanho
+        # Uma quebra de linha no fim do arquivo apenas encerra a última linha
+        if tamanho:
+            arquivo.seek(tamanho - 1)
+            if arquivo.read(1) == b"\n":
+                fim -= 1
+
+        inicio_bloco = fim
+        cauda = b""
+        while True:
+            novo_inicio = max(0, inicio_bloco - TAMANHO_BLOCO_RODAPE)
+            arquivo.seek(novo_inicio)
+            cauda = arquivo.read(inicio_bloco - novo_inicio) + cauda
+            inicio_bloco = novo_inicio
+
+            offset = _contar_linhas_do_fim(cauda, fim - inicio_bloco, linhas_rodape)
+            if offset is not None:
+                return inicio_bloco + offset
+            if inicio_bloco == 0:
+                return None
+
+
+def _contar_linhas_do_fim(cauda: bytes, fim: int, linhas_rodape: int) -> Optional[int]:
+    """Procura, dentro de ``cauda``, o início da n-ésima linha lógica final."""
+    encontradas = 0
+    aspas = 0
+    posicao = fim
+    while True:
+        quebra = cauda.rfind(b"\n", 0, posicao)
+        if quebra < 0:
+            # A linha pode continuar antes do bloco lido; o chamador amplia a cauda
+            return None
+        aspas += cauda.count(b'"', quebra + 1, posicao)
+        posicao = quebra
+        if aspas % 2:
+            continue
+        aspas = 0
+        encontradas += 1
+        if encontradas == linhas_rodape:
+            return quebra + 1
+
+
+def _localizar_fim_preambulo(caminho_csv: str, linhas: int) -> int:
+    """Retorna o offset logo após as ``linhas`` iniciais do arquivo."""
+    with open(caminho_csv, "rb") as arquivo:
+        for _ in range(linhas):
+            if not arquivo.readline():
+                break
+        return arquivo.tell()
+
+
+def _ler_com_pyarrow(caminho_csv: str, inicio: int, fim: int):
+    """Lê o trecho ``[inicio, fim)`` com ``pyarrow.csv`` e replica os tipos do parser C.
+
+    Todas as colunas são lidas como texto, pois o pyarrow converteria valores
+    como "04:00" em ``datetime.time``. Depois, colunas inteiramente numéricas
+    são convertidas e os nulos viram ``NaN``, como no ``pd.read_csv``.
+    Retorna ``None`` quando não há linhas, deixando o caso para o parser C.
+    """
+    import pyarrow as pa
+    from pyarrow import csv as pa_csv
+
+    with open(caminho_csv, "rb") as arquivo:
+        arquivo.seek(inicio)
+        cabecalho = arquivo.readline().decode("utf-8-sig").rstrip("\r\n")
+    colunas = next(csv.reader([cabecalho]), [])
+
+    with io.BufferedReader(_ArquivoTruncado(caminho_csv, inicio, fim)) as corpo:
+        tabela = pa_csv.read_csv(
+            corpo,
+            convert_options=pa_csv.ConvertOptions(
+                column_types={coluna: pa.string() for coluna in colunas},
+                null_values=sorted(STR_NA_VALUES),
+                strings_can_be_null=True,
+            ),
+        )
+    if tabela.num_rows == 0:
+        return None
+
+    df = tabela.to_pandas()
+    for coluna in df.columns:
+        serie = df[coluna]
+        serie = serie.where(serie.notna(), np.nan)
+        try:
+            serie = pd.to_numeric(serie)
+        except (ValueError, TypeError):
+            pass
+        df[coluna] = serie
+    return df
+
+
+def ler_csv_pontomais(
+    caminho_csv: str,
+    skiprows: int,
+    skipfooter: int,
+    engine: Optional[str] = None,
+    **kwargs: Any,
+):
+    """Lê um CSV do PontoMais ignorando cabeçalho e rodapé sem ``engine="python"``.
+
+    Produz o mesmo ``DataFrame`` que
+    ``pd.read_csv(caminho_csv, skiprows=skiprows, skipfooter=skipfooter, engine="python")``.
+    Argumentos extras são repassados ao ``pd.read_csv``. Sem ``engine``
+    explícito usa ``CSV_ENGINE`` (``"c"`` por padrão). Caso o rodapé não
+    possa ser localizado, recorre ao parser Python como antes.
+    """
+    engine = (engine or CSV_ENGINE or "c").strip().lower()
+    if engine not in ENGINES_SUPORTADAS:
+        raise ValueError(f"Engine de leitura inválida: {engine!r}")
+
+    inicio_rodape = localizar_inicio_rodape(caminho_csv, skipfooter)
+    if inicio_rodape is None:
+        logging.warning(
+            "Rodapé não localizado em %s; usando o parser Python.", caminho_csv
+        )
+        return pd.read_csv(
+            caminho_csv, skiprows=skiprows, skipfooter=skipfooter, engine="python", **kwargs
+        )
+
+    if engine == "pyarrow" and not kwargs:
+        try:
+            import pyarrow as pa
+        except ImportError:
+            logging.info("pyarrow não instalado; usando o parser C.")
+        else:
+            inicio = _localizar_fim_preambulo(caminho_csv, skiprows)
+            df = None
+            if inicio < inicio_rodape:
+                try:
+                    df = _ler_com_pyarrow(caminho_csv, inicio, inicio_rodape)
+                except pa.ArrowInvalid as exc:
+                    logging.warning("pyarrow falhou em %s (%s); usando o parser C.", caminho_csv, exc)
+            if df is not None:
+                return df
+
+    try:
+        with io.BufferedReader(_ArquivoTruncado(caminho_csv, 0, inicio_rodape)) as corpo:
+            return pd.read_csv(corpo, skiprows=skiprows, engine="c", **kwargs)
+    except pd.errors.EmptyDataError:
+        # Rodapé sobreposto ao cabeçalho: o parser Python devolve só as colunas
+        return pd.read_csv(
+            caminho_csv, skiprows=skiprows, skipfooter=skipfooter, engine="python", **kwargs
+        )
+
+
+def ler_csv_pontomais_em_blocos(
+    caminho_csv: str,
+    skiprows: int,
+    skipfooter: int,
+    tamanho_bloco: int,
+    **kwargs: Any,
+) -> Iterator[pd.DataFrame]:
+    """Versão em blocos de :func:`ler_csv_pontomais`.
+
+    Gera ``DataFrames`` de até ``tamanho_bloco`` linhas sem carregar o
+    arquivo inteiro. Usa sempre o parser C, o único com suporte a
+    ``chunksize`` sem perder o tratamento do rodapé. Quando o rodapé não
+    pode ser localizado, o arquivo é lido de uma vez como fallback.
+    """
+    if tamanho_bloco <= 0:
+        raise ValueError("tamanho_bloco deve ser um inteiro positivo.")
+
+    inicio_rodape = localizar_inicio_rodape(caminho_csv, skipfooter)
+    if inicio_rodape is None:
+        yield ler_csv_pontomais(caminho_csv, skiprows, skipfooter, engine="c", **kwargs)
+        return
+
+    with io.BufferedReader(_ArquivoTruncado(caminho_csv, 0, inicio_rodape)) as corpo:
+        try:
+            leitor = pd.read_csv(
+                corpo, skiprows=skiprows, engine="c", chunksize=tamanho_bloco, **kwargs
+            )
+        except pd.errors.EmptyDataError:
+            yield ler_csv_pontomais(caminho_csv, skiprows, skipfooter, engine="c", **kwargs)
+            return
+        with leitor:
+            yield from leitor
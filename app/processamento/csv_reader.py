@@ -1,52 +1,99 @@
 import pandas as pd
-from app.processamento.mapear_gerencia import mapear_equipe
+from app.config.settings import CSV_CHUNK_ROWS
+from app.processamento.csv_pontomais import ler_csv_pontomais, ler_csv_pontomais_em_blocos
+from app.processamento.mapear_gerencia import mapear_equipes
 from app.processamento.csv_reader_ocorrencias import carregar_dados_ocorrencias
 from app.processamento.csv_reader_assinaturas import carregar_dados_assinaturas
 from app.whatsapp.mensagem import validar_ocorrencia
 
-def carregar_dados(caminho_csv, ignorar_sabados, tipo_relatorio):
-    if tipo_relatorio == "Auditoria":
-        df = pd.read_csv(caminho_csv, skiprows=3, skipfooter=12, engine="python")
+def _preparar_bloco_auditoria(df, ignorar_sabados):
+    """Aplica a um bloco do relatório de Auditoria as regras de carregamento.
 
-        # === Ignorar determinados registros de sábado
-        if ignorar_sabados:
-            # Limpar e identificar sábados
-            data_col = df["Data"].astype(str).str.replace("\"", "").str.strip().str.lower()
-            df["DataLimpa"] = data_col
-            df["DataFormatada"] = df["DataLimpa"].str[5:]
-
-            # Filtro 1: Sábados com "Falta"
-            is_sabado = data_col.str.startswith("sáb,")
-            is_falta = df["Ocorrência"] == "Falta"
-            is_sabado_falta = is_sabado & is_falta
-
-            # Filtro 2: Sábados com "Horas Faltantes" == 04:00
-            is_horas_faltantes = (df["Ocorrência"] == "Horas Faltantes") & (df["Valor"].astype(str).str.strip() == "04:00")
-            is_sabado_horas_4 = is_sabado & is_horas_faltantes
-
-            # Combinar datas e nomes para remoção
-            remover_linhas = df[is_sabado_falta | is_sabado_horas_4][["Nome", "DataFormatada"]].drop_duplicates()
-            df = df.merge(remover_linhas, on=["Nome", "DataFormatada"], how="left", indicator=True)
-            df = df[df["_merge"] == "left_only"].drop(columns=["_merge"])
-
-            # Atualizar a coluna final de Data
-            df["Data"] = df["DataFormatada"]
-        else:
-            df["Data"] = df["Data"].astype(str).str.replace("\"", "").str[5:].str.strip()
+    Retorna o bloco já filtrado e as chaves (Nome, Data) de sábado que devem
+    ser removidas. As chaves são devolvidas em vez de aplicadas porque um
+    mesmo (Nome, Data) pode estar dividido entre blocos.
+    """
+    remover_linhas = None
+
+    # === Ignorar determinados registros de sábado
+    if ignorar_sabados:
+        # Limpar e identificar sábados
+        data_col = df["Data"].astype(str).str.replace("\"", "").str.strip().str.lower()
+        df["DataLimpa"] = data_col
+        df["DataFormatada"] = df["DataLimpa"].str[5:]
+
+        # Filtro 1: Sábados com "Falta"
+        is_sabado = data_col.str.startswith("sáb,")
+        is_falta = df["Ocorrência"] == "Falta"
+        is_sabado_falta = is_sabado & is_falta
+
+        # Filtro 2: Sábados com "Horas Faltantes" == 04:00
+        is_horas_faltantes = (df["Ocorrência"] == "Horas Faltantes") & (df["Valor"].astype(str).str.strip() == "04:00")
+        is_sabado_horas_4 = is_sabado & is_horas_faltantes
+
+        # Combinar datas e nomes para remoção
+        remover_linhas = df[is_sabado_falta | is_sabado_horas_4][["Nome", "DataFormatada"]].drop_duplicates()
+        remover_linhas = remover_linhas.rename(columns={"DataFormatada": "Data"})
+
+        # Atualizar a coluna final de Data
+        df["Data"] = df["DataFormatada"]
+    else:
+        df["Data"] = df["Data"].astype(str).str.replace("\"", "").str[5:].str.strip()
 
-        # === Marcar faltas abonadas/justificadas em vez de removê-las ===
-        # Adiciona uma coluna temporária para indicar se a falta é abonada/justificada
-        df["FaltaAbonadaJustificada"] = ((df["Ocorrência"] == "Falta") & 
-        (df["Valor"].astype(str).str.lower().isin(["abonada", "justificada"])))
+    # === Marcar faltas abonadas/justificadas em vez de removê-las ===
+    # Adiciona uma coluna temporária para indicar se a falta é abonada/justificada
+    df["FaltaAbonadaJustificada"] = ((df["Ocorrência"] == "Falta") & 
+    (df["Valor"].astype(str).str.lower().isin(["abonada", "justificada"])))
 
-        df["EquipeTratada"] = df["Equipe"].apply(mapear_equipe)
+    df["EquipeTratada"] = mapear_equipes(df["Equipe"])
 
-        # Remover colunas temporárias se existirem
-        df.drop(columns=["DataLimpa", "DataFormatada"], errors="ignore", inplace=True)
+    # Remover colunas temporárias se existirem
+    df.drop(columns=["DataLimpa", "DataFormatada"], errors="ignore", inplace=True)
 
-        df = df[df["Ocorrência"].apply(validar_ocorrencia)]
+    df = df[df["Ocorrência"].apply(validar_ocorrencia)]
+    return df, remover_linhas
+
+
+def carregar_dados(caminho_csv, ignorar_sabados, tipo_relatorio, tamanho_bloco=None):
+    """Carrega o relatório informado e devolve o ``DataFrame`` tratado.
+
+    A Auditoria é lida em blocos de ``tamanho_bloco`` linhas (padrão
+    ``CSV_CHUNK_ROWS``), filtrando cada bloco antes de juntá-los. Assim o pico
+    de memória depende do tamanho do bloco, não do arquivo. Use
+    ``tamanho_bloco=0`` para ler o arquivo de uma vez.
+    """
+    if tipo_relatorio == "Auditoria":
+        if tamanho_bloco is None:
+            tamanho_bloco = CSV_CHUNK_ROWS
+        if tamanho_bloco and tamanho_bloco > 0:
+            blocos = ler_csv_pontomais_em_blocos(
+                caminho_csv, skiprows=3, skipfooter=12, tamanho_bloco=tamanho_bloco
+            )
+        else:
+            blocos = [ler_csv_pontomais(caminho_csv, skiprows=3, skipfooter=12)]
+
+        partes = []
+        chaves_remover = []
+        for bloco in blocos:
+            parte, remover_linhas = _preparar_bloco_auditoria(bloco, ignorar_sabados)
+            partes.append(parte)
+            if remover_linhas is not None and not remover_linhas.empty:
+                chaves_remover.append(remover_linhas)
+
+        if ignorar_sabados:
+            # A remoção é feita depois de ler todos os blocos para cobrir
+            # grupos (Nome, Data) divididos entre eles
+            if chaves_remover:
+                remover_linhas = pd.concat(chaves_remover).drop_duplicates()
+            else:
+                remover_linhas = pd.DataFrame(columns=["Nome", "Data"])
+            for indice, parte in enumerate(partes):
+                parte = parte.merge(remover_linhas, on=["Nome", "Data"], how="left", indicator=True)
+                partes[indice] = parte[parte["_merge"] == "left_only"].drop(columns=["_merge"])
+            df = pd.concat(partes, ignore_index=True) if len(partes) > 1 else partes[0]
+        else:
+            df = pd.concat(partes) if len(partes) > 1 else partes[0]
 
-        equipes_validas = sorted(df["EquipeTratada"].dropna().unique().tolist())
         return df
     elif tipo_relatorio == "Ocorrências":
         return carregar_dados_ocorrencias(caminho_csv)
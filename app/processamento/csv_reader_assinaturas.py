@@ -1,5 +1,5 @@
-import pandas as pd
-from app.processamento.mapear_gerencia import mapear_equipe
+from app.processamento.csv_pontomais import ler_csv_pontomais
+from app.processamento.mapear_gerencia import mapear_equipes
 
 
 def carregar_dados_assinaturas(caminho_csv):
@@ -8,12 +8,12 @@ def carregar_dados_assinaturas(caminho_csv):
     - Ignora as 4 primeiras linhas e as 3 últimas.
     - Valida colunas necessárias.
     - Renomeia 'Colaborador' para 'Nome'.
-    - Cria coluna 'EquipeTratada' usando ``mapear_equipe``.
+    - Cria coluna 'EquipeTratada' usando ``mapear_equipes``.
     - Filtra apenas colaboradores com 'Assinado?' == 'Não'.
     - Mantém 'Período (Fechamento)' para composição das mensagens.
     """
     # Leitura do CSV considerando linhas a pular
-    df = pd.read_csv(caminho_csv, skiprows=4, skipfooter=3, engine="python")
+    df = ler_csv_pontomais(caminho_csv, skiprows=4, skipfooter=3)
 
     # Validação de colunas obrigatórias
     colunas_necessarias = [
@@ -32,7 +32,7 @@ def carregar_dados_assinaturas(caminho_csv):
         df[coluna] = df[coluna].astype(str).str.strip()
 
     # Mapear equipes
-    df["EquipeTratada"] = df["Equipe"].apply(mapear_equipe)
+    df["EquipeTratada"] = mapear_equipes(df["Equipe"])
 
     # Filtrar apenas colaboradores não assinados
     df = df[df["Assinado?"].str.lower() == "não"]
@@ -1,5 +1,5 @@
-import pandas as pd
-from app.processamento.mapear_gerencia import mapear_equipe
+from app.processamento.csv_pontomais import ler_csv_pontomais
+from app.processamento.mapear_gerencia import mapear_equipes
 from app.processamento.motivos_ocorrencias import validar_motivo, validar_acao_pendente
 
 def carregar_dados_ocorrencias(caminho_csv):
@@ -10,7 +10,7 @@ def carregar_dados_ocorrencias(caminho_csv):
     """
     
     # Ler o CSV ignorando as primeiras 4 linhas e as últimas 5
-    df = pd.read_csv(caminho_csv, skiprows=4, skipfooter=5, engine='python')
+    df = ler_csv_pontomais(caminho_csv, skiprows=4, skipfooter=5)
     
     # Verificar se as colunas necessárias existem
     colunas_esperadas = ['Nome', 'Equipe', 'Data', 'Motivo', 'Ação pendente']
@@ -26,7 +26,7 @@ def carregar_dados_ocorrencias(caminho_csv):
     df['Ação pendente'] = df['Ação pendente'].astype(str).str.strip()
     
     # Mapear equipes
-    df['EquipeTratada'] = df['Equipe'].apply(mapear_equipe)
+    df['EquipeTratada'] = mapear_equipes(df['Equipe'])
     
     # Remover linhas com dados vazios ou inválidos
     df = df.dropna(subset=['Nome', 'Data', 'Motivo', 'Ação pendente'])
@@ -1,24 +1,75 @@
 import re
 import logging
+from functools import lru_cache
 
-# === Mapeamento de equipe ===
-def mapear_equipe(txt):
+import numpy as np
+import pandas as pd
+
+_REGEX_LOJA = re.compile(r"\b(?:loja|filial)[^\da-zA-Z]*(?:nova)?\s*([a-z]?\d{1,3}[a-z]?)\b", re.IGNORECASE)
+
+# Linhas resolvidas reaproveitando o resultado de outro valor idêntico
+_linhas_reaproveitadas = 0
+
+
+def _normalizar_texto_equipe(txt):
     txt = str(txt).lower()
 
     # Correção para erros como "Loja l 66"
     txt = txt.replace("loja l ", "loja ")
     txt = txt.replace("loja  l ", "loja ")
     txt = txt.replace("loja  ", "loja ")
+    return txt
+
+
+@lru_cache(maxsize=4096)
+def _analisar_equipe(txt):
+    """Resolve uma única vez a equipe tratada e se o texto é de uma loja.
+
+    O cache é compartilhado por ``mapear_equipe`` e ``eh_loja``.
+    """
+    txt = _normalizar_texto_equipe(txt)
+    loja = _REGEX_LOJA.search(txt)
+    return _classificar_equipe(txt, loja), bool(loja)
+
+
+# === Mapeamento de equipe ===
+def mapear_equipe(txt):
+    return _analisar_equipe(str(txt))[0]
+
+
+def mapear_equipes(serie):
+    """Aplica ``mapear_equipe`` a uma ``Series`` resolvendo cada valor distinto uma vez.
+
+    Equivale a ``serie.apply(mapear_equipe)``, mas os relatórios têm milhares
+    de linhas e poucas centenas de equipes distintas.
+    """
+    global _linhas_reaproveitadas
+    codigos, unicos = pd.factorize(serie, use_na_sentinel=False)
+    resolvidos = np.array([mapear_equipe(valor) for valor in unicos], dtype=object)
+    _linhas_reaproveitadas += len(codigos) - len(unicos)
+    return pd.Series(resolvidos[codigos], index=serie.index, name=serie.name, dtype=object)
+
+
+def estatisticas_cache_equipes():
+    """Retorna os contadores do cache de mapeamento de equipes."""
+    info = _analisar_equipe.cache_info()
+    return {
+        "hits": info.hits,
+        "misses": info.misses,
+        "tamanho": info.currsize,
+        "linhas_reaproveitadas": _linhas_reaproveitadas,
+    }
 
+
+def _classificar_equipe(txt, loja):
     if "departamento pessoal" in txt: return "DP"
     if any(x in txt for x in ["cd10", "cd 10", "cd-10"]): return "CD10"
     if any(x in txt for x in ["cd20", "cd 20", "cd-20"]): return "CD20"
     if any(x in txt for x in ["cd30", "cd 30", "cd-30", "cd - 30"]): return "CD30"
 
     # Captura códigos como 75, A1, B4 — mesmo com "Loja Nova", "LojaNova", "Filial Nova", etc.
-    match = re.search(r"\b(?:loja|filial)[^\da-zA-Z]*(?:nova)?\s*([a-z]?\d{1,3}[a-z]?)\b", txt, re.IGNORECASE)
-    if match:
-        loja_codigo = match.group(1).upper()
+    if loja:
+        loja_codigo = loja.group(1).upper()
         return loja_codigo  # Apenas o código: ex. "75", "B2", "A1"
 
     if "comercial" in txt or "expansão" in txt: return "Comercial"
@@ -44,9 +95,4 @@ def mapear_equipe(txt):
     return "Outro"
 
 def eh_loja(txt):
-    txt = str(txt).lower()
-    txt = txt.replace("loja l ", "loja ")
-    txt = txt.replace("loja  l ", "loja ")
-    txt = txt.replace("loja  ", "loja ")
-    return bool(re.search(r"\b(?:loja|filial)[^\da-zA-Z]*(?:nova)?\s*([a-z]?\d{1,3}[a-z]?)\b", txt, re.IGNORECASE))
-
+    return _analisar_equipe(str(txt))[1]
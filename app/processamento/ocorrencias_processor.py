@@ -1,72 +1,70 @@
-from typing import List, Optional
+from typing import List
 
+import numpy as np
 import pandas as pd
 from app.types import MensagemDetalhada
 
-from .motivos_ocorrencias import validar_motivo
+from .motivos_ocorrencias import MOTIVOS_OCORRENCIAS
 
 
-def processar_ocorrencias(df: pd.DataFrame) -> pd.Series:
-    # Lógica para processar as colunas 'Motivo' e 'Ação pendente'
-    # e gerar as mensagens específicas para o relatório de ocorrências.
-    # Esta função será chamada pelo controller.
-    
-    def gerar_linha_ocorrencia(row) -> Optional[str]:
-        nome = row["Nome"]
-        motivo = row["Motivo"]
-        acao_pendente = row["Ação pendente"]
+def gerar_linhas_ocorrencias(validos: pd.DataFrame) -> pd.Series:
+    """Monta a linha de mensagem de cada ocorrência.
+
+    Versão vetorizada de ``gerar_linha_ocorrencia``: o trecho que depende de
+    ``Motivo``/``Ação pendente`` é escolhido com ``np.select`` sobre o
+    ``DataFrame`` inteiro, que já deve conter apenas motivos válidos.
+    """
+    motivo = validos["Motivo"]
+    acao = validos["Ação pendente"]
+    motivo_minusculo = "_" + motivo.str.lower() + "_"
 
-        if not validar_motivo(motivo):
-            return None
-        
-        if motivo == "Número de pontos menor que o previsto" and acao_pendente == "Gestor aprovar solicitação de ajuste":
-            return (
-                f"*{nome}* solicitou ajuste.\n"
-                f"Ação pendente: *{acao_pendente}*."
-            )
-        elif motivo == "Número de pontos menor que o previsto" and acao_pendente == "Gestor corrigir lançamento de exceção":
-            return (
-                f"*{nome}* apresentou _{motivo.lower()}_.\n"
-                f"Ação pendente: *{acao_pendente}*."
-            )
-        elif motivo == "Número de pontos menor que o previsto":
-            return (
-                f"*{nome}* está com o _{motivo.lower()}_.\n"
-                f"Ação pendente: *{acao_pendente}*."
-            )
-        elif motivo == "Número errado de pontos":
-            return (
-                f"*{nome}* apresentou _{motivo.lower()}_.\n"
-                f"Ação pendente: *{acao_pendente}*."
-            )
-        else:
-            return (
-                f"*{nome}* _{motivo.lower()}_.\n"
-                f"Ação pendente: *{acao_pendente}*."
-            )
+    menor_que_previsto = (motivo == "Número de pontos menor que o previsto").to_numpy()
+    descricao = np.select(
+        [
+            menor_que_previsto & (acao == "Gestor aprovar solicitação de ajuste").to_numpy(),
+            menor_que_previsto & (acao == "Gestor corrigir lançamento de exceção").to_numpy(),
+            menor_que_previsto,
+            (motivo == "Número errado de pontos").to_numpy(),
+        ],
+        [
+            "solicitou ajuste",
+            "apresentou " + motivo_minusculo,
+            "está com o " + motivo_minusculo,
+            "apresentou " + motivo_minusculo,
+        ],
+        default=motivo_minusculo,
+    )
+    return (
+        "*" + validos["Nome"].astype(str) + "* " + descricao
+        + ".\nAção pendente: *" + acao.astype(str) + "*."
+    )
 
-    # Agrupar por Nome e Data para consolidar as mensagens por ocorrência
-    def compilar_mensagens(grupo: pd.DataFrame) -> Optional[MensagemDetalhada]:
-        textos: List[str] = []
-        motivos: List[str] = []
-        for _, row in grupo.iterrows():
-            mensagem = gerar_linha_ocorrencia(row)
-            if not mensagem:
-                continue
-            textos.append(mensagem)
-            motivo = row.get("Motivo")
-            if isinstance(motivo, str):
-                motivo_limpo = motivo.strip()
-                if motivo_limpo and motivo_limpo not in motivos:
-                    motivos.append(motivo_limpo)
 
-        if not textos:
-            return None
+def _motivos_unicos(motivos: pd.Series) -> List[str]:
+    limpos = (m.strip() for m in motivos if isinstance(m, str))
+    return [m for m in dict.fromkeys(limpos) if m]
 
-        return MensagemDetalhada(
-            texto="\n".join(textos),
-            motivos=motivos,
-        )
 
-    mensagens_ocorrencias = df.groupby(["Nome", "Data"], group_keys=False).apply(compilar_mensagens)
-    return mensagens_ocorrencias.dropna()
+def processar_ocorrencias(df: pd.DataFrame) -> pd.Series:
+    """Gera as mensagens de Ocorrências agrupadas por ``(Nome, Data)``.
+
+    As linhas são montadas de uma vez com :func:`gerar_linhas_ocorrencias` e
+    juntadas com uma única agregação por grupo, sem ``iterrows``. Grupos sem
+    nenhum motivo válido não geram mensagem.
+    """
+    validos = df[df["Motivo"].isin(list(MOTIVOS_OCORRENCIAS))]
+    dados = validos[["Nome", "Data", "Motivo"]].assign(
+        Linha=gerar_linhas_ocorrencias(validos).to_numpy()
+    )
+    agregado = dados.groupby(["Nome", "Data"], sort=True).agg(
+        texto=("Linha", "\n".join),
+        motivos=("Motivo", _motivos_unicos),
+    )
+    return pd.Series(
+        [
+            MensagemDetalhada(texto=texto, motivos=motivos)
+            for texto, motivos in zip(agregado["texto"], agregado["motivos"])
+        ],
+        index=agregado.index,
+        dtype=object,
+    )
@@ -4,170 +4,44 @@ import os
 import json
 import logging
 import uuid
-import random
-import time
-from datetime import datetime
-import requests
-from urllib.parse import urljoin
-from app.processamento.mapear_gerencia import mapear_equipe
-from app.processamento.csv_reader import carregar_dados
+from datetime import date, datetime, timedelta
+from app.processamento.mapear_gerencia import mapear_equipes
+from app.processamento.cache_relatorios import carregar_dados_com_cache
 from app.config.settings import (
     EVOLUTION_INSTANCE,
-    EVOLUTION_TOKEN,
     EVOLUTION_URL,
+    HISTORICO_PERIODO_PADRAO_DIAS,
 )
 from app.history import (
+    agrupar_envios_por_equipe,
+    contar_envios_por_equipe,
+    LIMITE_EQUIPES_PADRAO,
+    LIMITE_PAGINA_PADRAO,
     listar_envios,
+    listar_envios_pagina,
     listar_equipes_disponiveis,
     normalizar_nome_relatorio,
     obter_status_relatorio,
+    resumir_envios,
     STATUS_SUCESSO_TOTAL,
     STATUS_ENVIO_PARCIAL,
 )
 from app.history_export import gerar_planilha_historico
+from app.whatsapp.evolution_client import obter_cliente
+from app.whatsapp.instancias import nomes_instancias
+from app.whatsapp.numeros_equipes import diretorio_equipes
+from app.whatsapp.sessao import obter_sessao
 
 api_bp = Blueprint('api', __name__)
 UPLOAD_FOLDER = 'uploads'
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
-def _evo_headers():
-    return {"Content-Type": "application/json", "apikey": EVOLUTION_TOKEN}
-
-def verificar_sessao() -> bool:
-    """Garante que a sessão do WhatsApp esteja ativa.
-
-    A Evolution pode retornar lista de instâncias ou um objeto.
-    Esta função trata ambos para evitar erros do tipo 'list' não possui 'get'.
-    """
-    url = urljoin(
-        EVOLUTION_URL,
-        f"/instance/fetchInstances?instanceName={EVOLUTION_INSTANCE}",
-    )
-    try:
-        resp = requests.get(url, headers=_evo_headers(), timeout=30)
-        resp.raise_for_status()
-        data = resp.json()
-
-        estado = None
-        if isinstance(data, list):
-            try:
-                alvo = next(
-                    (
-                        item for item in data
-                        if isinstance(item, dict)
-                        and (
-                            item.get("instanceName") == EVOLUTION_INSTANCE
-                            or item.get("instance", {}).get("instanceName") == EVOLUTION_INSTANCE
-                        )
-                    ),
-                    data[0] if data else {},
-                )
-            except Exception:  # noqa: BLE001
-                alvo = {}
-            if isinstance(alvo, dict):
-                estado = (
-                    alvo.get("state")
-                    or alvo.get("connectionState")
-                    or alvo.get("instance", {}).get("state")
-                )
-        elif isinstance(data, dict):
-            estado = (
-                data.get("state")
-                or data.get("connectionState")
-                or data.get("instance", {}).get("state")
-            )
-
-        if isinstance(estado, str) and estado.lower() == "open":
-            return True
-    except Exception as exc:  # noqa: BLE001
-        logging.error("Erro ao verificar instâncias: %s", exc)
-
-    url = urljoin(EVOLUTION_URL, f"/instance/connect/{EVOLUTION_INSTANCE}")
-    try:
-        resp = requests.get(url, headers=_evo_headers(), timeout=30)
-        resp.raise_for_status()
-        data = resp.json()
-        estado = None
-        if isinstance(data, dict):
-            estado = (
-                data.get("state")
-                or data.get("connectionState")
-                or data.get("instance", {}).get("state")
-            )
-        return isinstance(estado, str) and estado.lower() == "open"
-    except Exception as exc:  # noqa: BLE001
-        logging.error("Erro ao conectar instância: %s", exc)
-        return False
-
-def enviar_whatsapp(numero, mensagem, equipe=None):
-    if not verificar_sessao():
-        logging.error("Sessão do WhatsApp desconectada")
-        raise RuntimeError("Sessão do WhatsApp desconectada")
-
-    numero_formatado = numero.replace("+", "").replace("-", "").replace(" ", "")
-    url = urljoin(EVOLUTION_URL, f"/message/sendText/{EVOLUTION_INSTANCE}")
-
-    payload = {
-        "number": numero_formatado,
-        "text": mensagem,
-        "delay": 250,
-    }
-
-    try:
-        logging.info("⏳ Enviando para %s (Equipe: %s)", numero_formatado, equipe)
-        logging.info("Payload: %s", payload)
-
-        response = requests.post(
-            url, json=payload, headers=_evo_headers(), timeout=30
-        )
-
-        logging.info("Evolution API status: %s", response.status_code)
-        logging.info("Evolution API response: %s", response.text)
-
-        if 400 <= response.status_code < 500:
-            req = response.request
-            logging.error(
-                "Falha 4xx ao chamar Evolution API - endpoint=%s método=%s body=%s",
-                req.url,
-                req.method,
-                req.body,
-            )
-
-        if response.status_code not in [200, 201]:
-            raise Exception(
-                f"Erro Evolution API: {response.status_code} - {response.text}"
-            )
-
-        response_data = response.json()
-        if not response_data.get("success", True):
-            raise Exception(
-                f"Erro na resposta: {response_data.get('message', 'Erro desconhecido')}"
-            )
-
-        logging.info(
-            "✅ Mensagem enviada para %s (Equipe: %s)", numero_formatado, equipe
-        )
-
-        time.sleep(random.uniform(0.25, 0.5))
-
-    except SystemExit as se:
-        logging.error(
-            "🚨 SYSTEMEXIT CAPTURADO - Worker sendo morto pelo Gunicorn!"
-        )
-        logging.error("🚨 Exit code: %s", se.code)
-        raise
-    except Exception as e:  # noqa: BLE001
-        logging.error("❌ Falha ao enviar para %s - %s", numero_formatado, e)
-        raise
-    except BaseException as be:  # noqa: BLE001
-        logging.error("🚨 BASEEXCEPTION CAPTURADA: %s", type(be).__name__)
-        raise
-
 @api_bp.route('/config', methods=['GET'])
 def get_config():
     return jsonify({
         "EVOLUTION_URL": EVOLUTION_URL,
         "EVOLUTION_INSTANCE": EVOLUTION_INSTANCE,
+        "EVOLUTION_INSTANCES": nomes_instancias(),
     })
 
 @api_bp.route('/enviar', methods=['POST'])
@@ -344,9 +218,9 @@ def obter_equipes():
     file.save(filepath)
 
     try:
-        df = carregar_dados(filepath, ignorar_sabados, tipo_relatorio)
+        df = carregar_dados_com_cache(filepath, ignorar_sabados, tipo_relatorio)
 
-        df['EquipeTratada'] = df['Equipe'].apply(mapear_equipe)
+        df['EquipeTratada'] = mapear_equipes(df['Equipe'])
 
         equipes = sorted(df['EquipeTratada'].dropna().unique().tolist())
         logging.info(f"Equipes extraídas: {len(equipes)}")
@@ -366,21 +240,35 @@ def well_known(subpath):
     # Não serve nada; só evita poluir o log com 404
     return ("", 204)
 
+def _instancia_solicitada():
+    """Lê ``?instancia=``; vazio indica a instância principal do pool."""
+    instancia = (request.args.get('instancia') or '').strip() or None
+    if instancia and instancia not in nomes_instancias():
+        return instancia, (jsonify({"error": f"Instância desconhecida: {instancia}"}), 404)
+    return instancia, None
+
 @api_bp.route('/whatsapp/status', methods=['GET'])
 def whatsapp_status():
     try:
-        url = urljoin(EVOLUTION_URL, f"/instance/connectionState/{EVOLUTION_INSTANCE}")
-        resp = requests.get(url, headers=_evo_headers(), timeout=30)
-        return jsonify(resp.json()), resp.status_code
+        # "instance" é a instância principal; "instances" traz o pool inteiro
+        estados = [
+            {"instanceName": nome, "state": obter_sessao(nome).estado()}
+            for nome in nomes_instancias()
+        ]
+        if all(estado["state"] is None for estado in estados):
+            return jsonify({"error": "Não foi possível consultar a Evolution API"}), 502
+        return jsonify({"instance": estados[0], "instances": estados}), 200
     except Exception as exc:  # noqa: BLE001
         logging.exception("Erro ao obter status do WhatsApp")
         return jsonify({"error": str(exc)}), 500
 
 @api_bp.route('/whatsapp/qr', methods=['GET'])
 def whatsapp_qr():
+    instancia, erro = _instancia_solicitada()
+    if erro:
+        return erro
     try:
-        url = urljoin(EVOLUTION_URL, f"/instance/connect/{EVOLUTION_INSTANCE}")
-        resp = requests.get(url, headers=_evo_headers(), timeout=30)
+        resp = obter_cliente(instancia).conectar()
         return jsonify(resp.json()), resp.status_code
     except Exception as exc:  # noqa: BLE001
         logging.exception("Erro ao obter QR Code do WhatsApp")
@@ -388,12 +276,11 @@ def whatsapp_qr():
 
 @api_bp.route('/whatsapp/instance', methods=['GET'])
 def whatsapp_instance():
+    instancia, erro = _instancia_solicitada()
+    if erro:
+        return erro
     try:
-        url = urljoin(
-            EVOLUTION_URL,
-            f"/instance/fetchInstances?instanceName={EVOLUTION_INSTANCE}",
-        )
-        resp = requests.get(url, headers=_evo_headers(), timeout=30)
+        resp = obter_cliente(instancia).buscar_instancias()
         return jsonify(resp.json()), resp.status_code
     except Exception as exc:  # noqa: BLE001
         logging.exception("Erro ao obter dados da instância")
@@ -401,17 +288,40 @@ def whatsapp_instance():
 
 @api_bp.route('/whatsapp/logout', methods=['DELETE'])
 def whatsapp_logout():
+    instancia, erro = _instancia_solicitada()
+    if erro:
+        return erro
     try:
-        url = urljoin(EVOLUTION_URL, f"/instance/logout/{EVOLUTION_INSTANCE}")
-        resp = requests.delete(url, headers=_evo_headers(), timeout=30)
+        resp = obter_cliente(instancia).logout()
+        obter_sessao(instancia).invalidar()
         return jsonify(resp.json()), resp.status_code
     except Exception as exc:  # noqa: BLE001
         logging.exception("Erro ao desconectar WhatsApp")
         return jsonify({"error": str(exc)}), 500
 
-@api_bp.route('/historico/dados', methods=['GET'])
-def historico_envios():
-    """Retorna o historico de envios com filtros opcionais."""
+@api_bp.route('/admin/numeros-equipes', methods=['GET', 'POST'])
+def admin_numeros_equipes():
+    """Situação do diretório de números das equipes; ``POST`` força a revalidação."""
+    if request.method == 'GET':
+        return jsonify(diretorio_equipes.status()), 200
+    try:
+        alterado = diretorio_equipes.atualizar()
+    except Exception as exc:  # noqa: BLE001
+        logging.exception("Erro ao atualizar os números das equipes")
+        return jsonify(dict(diretorio_equipes.status(), error=str(exc))), 502
+    status = diretorio_equipes.status()
+    if status["ultimo_erro"]:
+        # A planilha falhou, mas o diretório anterior continua em uso
+        return jsonify(dict(status, alterado=False, error=status["ultimo_erro"])), 502
+    return jsonify(dict(status, alterado=alterado)), 200
+
+def _filtros_historico(periodo_padrao=False):
+    """Filtros de equipe, tipo e periodo enviados pela tela de historico.
+
+    Com ``periodo_padrao``, a falta de ``inicio`` e ``fim`` vira o periodo
+    dos ultimos ``HISTORICO_PERIODO_PADRAO_DIAS`` dias, para que as consultas
+    da tela nao leiam o historico inteiro. A exportacao nao usa o padrao.
+    """
     equipes_param = [valor.strip() for valor in request.args.getlist('equipes') if valor and valor.strip()]
     tipos_param = [valor.strip() for valor in request.args.getlist('tipos') if valor and valor.strip()]
 
@@ -423,50 +333,102 @@ def historico_envios():
     if single_tipo and not tipos_param:
         tipos_param = [single_tipo]
 
-    inicio = request.args.get('inicio')
-    fim = request.args.get('fim')
-    dados = listar_envios(
-        equipe=equipes_param or None,
-        tipo=tipos_param or None,
-        inicio=inicio,
-        fim=fim,
-    )
-    resumo = {
-        "total": len(dados),
-        "sucessos": sum(1 for item in dados if item.get('status') == 'sucesso'),
-        "erros": sum(1 for item in dados if item.get('status') == 'erro'),
+    inicio = (request.args.get('inicio') or '').strip() or None
+    fim = (request.args.get('fim') or '').strip() or None
+    if periodo_padrao and not inicio and not fim:
+        hoje = date.today()
+        inicio = (hoje - timedelta(days=HISTORICO_PERIODO_PADRAO_DIAS - 1)).isoformat()
+        fim = hoje.isoformat()
+
+    return {
+        "equipe": equipes_param or None,
+        "tipo": tipos_param or None,
+        "inicio": inicio,
+        "fim": fim,
     }
+
+def _inteiro_param(nome, padrao=None):
+    valor = (request.args.get(nome) or '').strip()
+    if not valor:
+        return padrao
+    try:
+        return int(valor)
+    except ValueError:
+        raise ValueError(f"Parametro '{nome}' deve ser um numero inteiro.") from None
+
+@api_bp.route('/historico/dados', methods=['GET'])
+def historico_envios():
+    """Retorna uma pagina do historico de envios com filtros opcionais.
+
+    ``limite`` define o tamanho da pagina e ``apos`` recebe o cursor
+    ``proximo`` da resposta anterior. ``resumo`` cobre todos os envios
+    filtrados, nao so a pagina.
+    """
+    try:
+        filtros = _filtros_historico(periodo_padrao=True)
+        dados, proximo = listar_envios_pagina(
+            limite=_inteiro_param('limite', LIMITE_PAGINA_PADRAO),
+            apos_id=_inteiro_param('apos'),
+            **filtros,
+        )
+        resumo = resumir_envios(**filtros)
+    except ValueError as exc:
+        return jsonify({"success": False, "error": str(exc)}), 400
     equipes_disponiveis = listar_equipes_disponiveis()
     return jsonify({
         "success": True,
         "dados": dados,
+        "proximo": proximo,
         "resumo": resumo,
         "equipes": equipes_disponiveis,
     })
 
-@api_bp.route('/historico/exportar', methods=['GET'])
-def exportar_historico():
-    """Gera um arquivo Excel com o historico no formato hierarquico."""
-    equipes_param = [valor.strip() for valor in request.args.getlist('equipes') if valor and valor.strip()]
-    tipos_param = [valor.strip() for valor in request.args.getlist('tipos') if valor and valor.strip()]
-
-    single_equipe = (request.args.get('equipe') or '').strip()
-    if single_equipe and not equipes_param:
-        equipes_param = [single_equipe]
+@api_bp.route('/historico/resumo', methods=['GET'])
+def historico_resumo():
+    """Totais e contagens agrupadas do historico, calculados no banco.
 
-    single_tipo = (request.args.get('tipo') or '').strip()
-    if single_tipo and not tipos_param:
-        tipos_param = [single_tipo]
+    ``grupos`` traz ``limite`` equipes por pagina; ``apos`` recebe o cursor
+    ``proximo`` da resposta anterior. ``inicio`` e ``fim`` devolvem o
+    periodo aplicado, inclusive o padrao.
+    """
+    try:
+        filtros = _filtros_historico(periodo_padrao=True)
+        resumo = resumir_envios(**filtros)
+        grupos, proximo = agrupar_envios_por_equipe(
+            limite_equipes=_inteiro_param('limite', LIMITE_EQUIPES_PADRAO),
+            apos_equipe=(request.args.get('apos') or None),
+            **filtros,
+        )
+    except ValueError as exc:
+        return jsonify({"success": False, "error": str(exc)}), 400
+    return jsonify({
+        "success": True,
+        "resumo": resumo,
+        "grupos": grupos,
+        "proximo": proximo,
+        "inicio": filtros["inicio"],
+        "fim": filtros["fim"],
+        "equipes": listar_equipes_disponiveis(),
+    })
 
-    inicio = request.args.get('inicio')
-    fim = request.args.get('fim')
+@api_bp.route('/historico/grafico', methods=['GET'])
+def historico_grafico():
+    """Sucessos e erros por equipe para o grafico, lidos do agregado diario."""
+    try:
+        filtros = _filtros_historico(periodo_padrao=True)
+        por_equipe = contar_envios_por_equipe(**filtros)
+        resumo = resumir_envios(**filtros)
+    except ValueError as exc:
+        return jsonify({"success": False, "error": str(exc)}), 400
+    return jsonify({"success": True, "resumo": resumo, "por_equipe": por_equipe})
 
-    registros = listar_envios(
-        equipe=equipes_param or None,
-        tipo=tipos_param or None,
-        inicio=inicio,
-        fim=fim,
-    )
+@api_bp.route('/historico/exportar', methods=['GET'])
+def exportar_historico():
+    """Gera um arquivo Excel com o historico no formato hierarquico."""
+    try:
+        registros = listar_envios(**_filtros_historico())
+    except ValueError as exc:
+        return jsonify({"success": False, "error": str(exc)}), 400
     arquivo = gerar_planilha_historico(registros)
 
     nome_arquivo = f"historico-envios_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
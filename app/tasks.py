@@ -8,7 +8,8 @@ from datetime import datetime
 from pathlib import Path
 from typing import Any, Dict, Optional
 
-from app.controller import processar_csv
+from app.config.settings import ENVIO_MODO
+from app.controller import preparar_envios, processar_csv
 
 # Executor global por processo
 _executor = ThreadPoolExecutor(max_workers=4)
@@ -98,9 +99,33 @@ def enqueue_csv_processing(
     task_id = uuid.uuid4().hex
     _persist_task_state(task_id, status='queued', result=None, error=None)
 
+    def _debug_data() -> str:
+        from app.processamento.cache_relatorios import carregar_dados_com_cache
+
+        # Reaproveita o relatório já processado por ``processar_csv``
+        return carregar_dados_com_cache(
+            filepath, ignorar_sabados, tipo_relatorio
+        ).to_json(orient='records', force_ascii=False)
+
     def _run() -> None:
         _persist_task_state(task_id, status='running', result=None, error=None)
         try:
+            if ENVIO_MODO == 'fila':
+                from app.despachante import enfileirar
+
+                # O despachante envia o lote e conclui a tarefa
+                lote = preparar_envios(
+                    filepath,
+                    ignorar_sabados,
+                    tipo_relatorio,
+                    equipes_selecionadas,
+                    nome_relatorio=nome_relatorio,
+                    nome_relatorio_original=nome_relatorio_original,
+                    equipes_permitidas=equipes_permitidas,
+                )
+                enfileirar(task_id, lote, _debug_data() if debug_mode else None)
+                return
+
             logs, stats, nome_arquivo_log = processar_csv(
                 filepath,
                 ignorar_sabados,
@@ -111,20 +136,7 @@ def enqueue_csv_processing(
                 equipes_permitidas=equipes_permitidas,
             )
 
-            debug_data = None
-            if debug_mode:
-                if tipo_relatorio == 'Ocorrências':
-                    from app.processamento.csv_reader_ocorrencias import carregar_dados_ocorrencias
-
-                    debug_data = carregar_dados_ocorrencias(filepath).to_json(
-                        orient='records', force_ascii=False
-                    )
-                else:
-                    from app.processamento.csv_reader import carregar_dados
-
-                    debug_data = carregar_dados(
-                        filepath, ignorar_sabados, tipo_relatorio
-                    ).to_json(orient='records', force_ascii=False)
+            debug_data = _debug_data() if debug_mode else None
 
             result_payload = {
                 'logs': logs,
@@ -144,9 +156,24 @@ def enqueue_csv_processing(
     return task_id
 
 
+def concluir_tarefa(
+    task_id: str,
+    result: Optional[Dict[str, Any]] = None,
+    error: Optional[str] = None,
+) -> None:
+    """Marca a tarefa como concluída; usado pelo despachante da fila."""
+    _persist_task_state(
+        task_id,
+        status='error' if error else 'done',
+        result=result,
+        error=error,
+    )
+
+
 def get_task_status(task_id: str):
     """Obtém o dicionário de status/resultado da tarefa."""
     task = _tasks.get(task_id)
-    if task is not None:
+    if task is not None and task.get('status') in {'done', 'error'}:
         return task
-    return _load_task_from_disk(task_id)
+    # Tarefas em andamento podem ser concluídas por outro processo (despachante)
+    return _load_task_from_disk(task_id) or task
@@ -0,0 +1,97 @@
+"""Controle adaptativo (AIMD) de envios simultâneos à Evolution.
+
+A janela começa em ``EVOLUTION_INITIAL_CONCURRENCY`` e cresce de forma
+aditiva (cerca de +1 a cada janela de respostas rápidas) enquanto a latência
+fica abaixo de ``EVOLUTION_LATENCY_TARGET``. Latência acima do alvo reduz a
+janela em 25%; 429, 5xx e timeouts a reduzem pela metade. Reduções
+seguidas são ignoradas por um intervalo igual ao alvo de latência, para que
+as respostas de uma mesma rajada não derrubem a janela várias vezes.
+"""
+from __future__ import annotations
+
+import asyncio
+import time
+from typing import Dict, List
+
+from app.config.settings import (
+    EVOLUTION_INITIAL_CONCURRENCY,
+    EVOLUTION_LATENCY_TARGET,
+    EVOLUTION_MAX_CONCURRENCY,
+    EVOLUTION_MIN_CONCURRENCY,
+)
+
+
+def _percentil(ordenados: List[float], percentil: float) -> float:
+    """Percentil pelo método do posto mais próximo; 0 sem amostras."""
+    if not ordenados:
+        return 0.0
+    posicao = max(0, -(-len(ordenados) * percentil // 100) - 1)
+    return ordenados[int(posicao)]
+
+
+class JanelaAdaptativa:
+    """Semáforo assíncrono cujo limite segue a saúde da Evolution."""
+
+    def __init__(
+        self,
+        inicial: int = EVOLUTION_INITIAL_CONCURRENCY,
+        minimo: int = EVOLUTION_MIN_CONCURRENCY,
+        maximo: int = EVOLUTION_MAX_CONCURRENCY,
+        latencia_alvo: float = EVOLUTION_LATENCY_TARGET,
+    ):
+        self.minimo = max(1, minimo)
+        self.maximo = max(self.minimo, maximo)
+        self.latencia_alvo = latencia_alvo
+        self.janela = float(min(self.maximo, max(self.minimo, inicial)))
+        self.janela_minima = self.janela
+        self.janela_maxima = self.janela
+        self.em_andamento = 0
+        self.reducoes = 0
+        self._ultima_reducao = 0.0
+        self._latencias: List[float] = []
+        self._condicao = asyncio.Condition()
+
+    async def __aenter__(self) -> "JanelaAdaptativa":
+        async with self._condicao:
+            await self._condicao.wait_for(lambda: self.em_andamento < int(self.janela))
+            self.em_andamento += 1
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        async with self._condicao:
+            self.em_andamento -= 1
+            self._condicao.notify_all()
+
+    def _reduzir(self, fator: float) -> None:
+        agora = time.monotonic()
+        if agora - self._ultima_reducao < self.latencia_alvo:
+            return
+        self._ultima_reducao = agora
+        self.janela = max(float(self.minimo), self.janela * fator)
+        self.reducoes += 1
+        self.janela_minima = min(self.janela_minima, self.janela)
+
+    def registrar(self, latencia: float, sobrecarga: bool) -> None:
+        """Ajusta a janela com a latência e o resultado de uma chamada."""
+        self._latencias.append(latencia)
+        if sobrecarga:
+            self._reduzir(0.5)
+        elif latencia > self.latencia_alvo:
+            self._reduzir(0.75)
+        else:
+            self.janela = min(float(self.maximo), self.janela + 1 / self.janela)
+            self.janela_maxima = max(self.janela_maxima, self.janela)
+
+    def estatisticas(self) -> Dict[str, float]:
+        latencias = sorted(self._latencias)
+        latencia_media = sum(latencias) / len(latencias) if latencias else 0.0
+        return {
+            "janela": int(self.janela),
+            "janela_minima": int(self.janela_minima),
+            "janela_maxima": int(self.janela_maxima),
+            "reducoes": self.reducoes,
+            "latencia_media": round(latencia_media, 3),
+            "latencia_p50": round(_percentil(latencias, 50), 3),
+            "latencia_p95": round(_percentil(latencias, 95), 3),
+            "latencia_p99": round(_percentil(latencias, 99), 3),
+        }
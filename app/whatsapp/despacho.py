@@ -0,0 +1,406 @@
+"""Despacho assíncrono das mensagens de WhatsApp.
+
+Os envios de uma execução rodam como corrotinas em um único event loop,
+sobre um ``httpx.AsyncClient`` por instância da Evolution. Cada número de
+destino vai para a instância escolhida pelo anel de
+:mod:`app.whatsapp.instancias`, ou para a seguinte se a sessão dela estiver
+fechada. O número de envios em andamento segue a
+janela adaptativa de :mod:`app.whatsapp.concorrencia` e o ritmo segue o
+limitador compartilhado (:mod:`app.whatsapp.limitador`), cuja espera não
+prende nenhuma thread. A cada ``EVOLUTION_STATS_SECONDS`` a janela, as
+latências e o andamento do lote vão para o log.
+Cada envio exige sessão ativa, resposta 200/201 e ``success`` diferente de
+``False``.
+
+Respostas 429/5xx e falhas de conexão (antes de a requisição sair) são
+repetidas com backoff exponencial e jitter, até ``EVOLUTION_RETRY_ATTEMPTS``
+vezes por mensagem e dentro do orçamento ``EVOLUTION_RETRY_BUDGET`` da
+execução. Falhas depois do envio (timeout de leitura, conexão encerrada)
+deixam o resultado desconhecido: o envio não é repetido e a reserva de
+idempotência fica ativa até o prazo vencer.
+
+Com ``ENVIO_CONSOLIDAR_POR_NUMERO`` as mensagens de equipes que apontam para
+o mesmo número são unidas em uma só, dividida apenas quando passaria de
+``WHATSAPP_MAX_BYTES``. O resultado continua sendo informado por equipe,
+e cada equipe reunida mantém sua própria chave de idempotência: as que já
+foram entregues em uma execução anterior saem da mensagem unida.
+Mensagens acima desse limite são enviadas em partes numeradas, em ordem
+(:mod:`app.whatsapp.montagem`). Cada parte tem chave de idempotência
+própria, derivada das chaves das equipes, do índice e do texto: um reenvio
+após falha no meio pula as partes já entregues.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import random
+import time
+from collections import Counter
+from contextlib import AsyncExitStack
+from dataclasses import dataclass
+from typing import Callable, Dict, Hashable, Iterable, List, Optional, Tuple
+
+import httpx
+
+from app.config.settings import (
+    ENVIO_CONSOLIDAR_POR_NUMERO,
+    EVOLUTION_IDEMPOTENCY_LEASE_SECONDS,
+    EVOLUTION_RETRY_ATTEMPTS,
+    EVOLUTION_RETRY_BASE_SECONDS,
+    EVOLUTION_RETRY_BUDGET,
+    EVOLUTION_RETRY_MAX_SECONDS,
+    EVOLUTION_STATS_SECONDS,
+    WHATSAPP_MAX_BYTES,
+)
+from app.history import (
+    RESERVA_EM_ANDAMENTO,
+    RESERVA_JA_ENVIADO,
+    concluir_envio,
+    gerar_chave_idempotencia,
+    reservar_envio,
+)
+from app.whatsapp.evolution_client import (
+    EntregaIncerta,
+    ErroTransitorio,
+    formatar_numero,
+    montar_payload_texto,
+    obter_cliente,
+    registrar_falha_4xx,
+    validar_resposta_envio,
+)
+from app.whatsapp.concorrencia import JanelaAdaptativa
+from app.whatsapp.instancias import INSTANCIAS, instancias_para
+from app.whatsapp.limitador import obter_limitador
+from app.whatsapp.montagem import dividir_mensagem, tamanho_mensagem
+from app.whatsapp.sessao import obter_sessao
+
+ResultadoEnvio = Tuple[Hashable, Optional[Exception]]
+ConexoesInstancias = Dict[str, Tuple[httpx.AsyncClient, str]]
+
+# Falhas de rede em que a requisição com certeza não chegou à Evolution
+ERROS_ANTES_DO_ENVIO = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+ERROS_TRANSITORIOS = (ErroTransitorio,) + ERROS_ANTES_DO_ENVIO
+
+SEPARADOR_CONSOLIDADO = "\n\n"
+
+
+@dataclass(frozen=True)
+class Envio:
+    """Mensagem a enviar; ``chave`` identifica o envio no resultado.
+
+    Com ``chave_idempotencia`` o envio é reservado no histórico antes da
+    chamada à Evolution e concluído depois dela, para que nem as novas
+    tentativas nem os reenvios entreguem a mesma mensagem duas vezes.
+    """
+
+    chave: Hashable
+    numero: str
+    mensagem: str
+    equipe: Optional[str] = None
+    nome_relatorio: Optional[str] = None
+    chave_idempotencia: Optional[str] = None
+
+
+def _unir(membros: List[Envio], chave: Hashable) -> Envio:
+    """Mensagem única para os membros; a idempotência fica nas chaves deles."""
+    if len(membros) == 1:
+        return membros[0]
+    mensagem = SEPARADOR_CONSOLIDADO.join(membro.mensagem for membro in membros)
+    equipes = ", ".join(str(membro.equipe) for membro in membros if membro.equipe)
+    return Envio(chave, membros[0].numero, mensagem, equipes, membros[0].nome_relatorio)
+
+
+def consolidar_por_numero(envios: List[Envio], limite_bytes: int = WHATSAPP_MAX_BYTES) -> List[Tuple[Envio, List[Envio]]]:
+    """Une os envios destinados ao mesmo número.
+
+    As mensagens de cada número seguem a ordem original e são agrupadas em
+    partes de até ``limite_bytes``; uma mensagem que sozinha passa do limite
+    segue separada. Retorna cada envio resultante com os envios que ele cobre.
+    """
+    por_numero: Dict[str, List[Envio]] = {}
+    for envio in envios:
+        por_numero.setdefault(formatar_numero(envio.numero), []).append(envio)
+
+    separador = tamanho_mensagem(SEPARADOR_CONSOLIDADO)
+    consolidados = []
+    for numero, grupo in por_numero.items():
+        partes: List[List[Envio]] = []
+        tamanho = 0
+        for envio in grupo:
+            tamanho_envio = tamanho_mensagem(envio.mensagem)
+            if partes and tamanho + separador + tamanho_envio <= limite_bytes:
+                partes[-1].append(envio)
+                tamanho += separador + tamanho_envio
+            else:
+                partes.append([envio])
+                tamanho = tamanho_envio
+        for indice, membros in enumerate(partes):
+            consolidados.append((_unir(membros, ("consolidado", numero, indice)), membros))
+    return consolidados
+
+
+async def _escolher_instancia(numero_formatado: str) -> str:
+    """Primeira instância com sessão ativa na ordem do anel para o número."""
+    preferencia = instancias_para(numero_formatado)
+    for instancia in preferencia:
+        sessao = obter_sessao(instancia)
+        # A consulta à Evolution é síncrona; só sai do loop quando o cache expirou
+        if sessao.precisa_consultar():
+            await asyncio.to_thread(sessao.estado)
+        if sessao.sessao_ativa():
+            if instancia != preferencia[0]:
+                logging.warning(
+                    "Sessão %s indisponível; envio para %s segue pela instância %s",
+                    preferencia[0], numero_formatado, instancia,
+                )
+            return instancia
+    logging.error("Sessão do WhatsApp desconectada")
+    raise RuntimeError("Sessão do WhatsApp desconectada")
+
+
+def _sobrecarga(status_code: int) -> bool:
+    return status_code == 429 or status_code >= 500
+
+
+async def _enviar(conexoes: ConexoesInstancias, envio: Envio, texto: str, janela: JanelaAdaptativa) -> str:
+    """Envia ``texto`` e retorna o nome da instância usada."""
+    numero_formatado = formatar_numero(envio.numero)
+    instancia = await _escolher_instancia(numero_formatado)
+    await obter_limitador(instancia).aguardar_async()
+
+    http, caminho = conexoes[instancia]
+    payload = montar_payload_texto(numero_formatado, texto)
+    try:
+        logging.info("⏳ Enviando para %s (Equipe: %s, instância: %s)", numero_formatado, envio.equipe, instancia)
+        logging.info("Payload: %s", payload)
+
+        inicio = time.monotonic()
+        try:
+            response = await http.post(caminho, json=payload)
+        except ERROS_ANTES_DO_ENVIO as exc:
+            janela.registrar(time.monotonic() - inicio, sobrecarga=isinstance(exc, httpx.TimeoutException))
+            raise
+        except httpx.TransportError as exc:
+            janela.registrar(time.monotonic() - inicio, sobrecarga=isinstance(exc, httpx.TimeoutException))
+            raise EntregaIncerta(
+                f"Sem resposta da Evolution após o envio ({type(exc).__name__}); a mensagem pode ter sido entregue"
+            ) from exc
+        janela.registrar(time.monotonic() - inicio, sobrecarga=_sobrecarga(response.status_code))
+
+        logging.info("Evolution API status: %s", response.status_code)
+        logging.info("Evolution API response: %s", response.text)
+
+        req = response.request
+        registrar_falha_4xx(response.status_code, str(req.url), req.method, req.content)
+        if _sobrecarga(response.status_code):
+            raise ErroTransitorio(f"Erro Evolution API: {response.status_code} - {response.text}")
+        dados = response.json() if response.status_code in [200, 201] else None
+        validar_resposta_envio(response.status_code, response.text, dados)
+
+        logging.info("✅ Mensagem enviada para %s (Equipe: %s)", numero_formatado, envio.equipe)
+    except Exception as e:  # noqa: BLE001
+        logging.error("❌ Falha ao enviar para %s - %s", numero_formatado, e)
+        # A falha pode ser queda da sessão: o próximo envio volta a consultá-la
+        obter_sessao(instancia).invalidar()
+        raise
+    return instancia
+
+
+async def _despachar(
+    envios: List[Envio],
+    estatisticas: Optional[Dict],
+    ao_concluir: Optional[Callable[[Hashable, Optional[Exception]], None]],
+) -> List[ResultadoEnvio]:
+    if ENVIO_CONSOLIDAR_POR_NUMERO:
+        grupos = consolidar_por_numero(envios)
+        logging.info("%d envios consolidados em %d mensagens", len(envios), len(grupos))
+    else:
+        grupos = [(envio, [envio]) for envio in envios]
+
+    janela = JanelaAdaptativa()
+    # Orçamento de novas tentativas da execução inteira, para não insistir com a Evolution fora do ar
+    orcamento = max(EVOLUTION_RETRY_ATTEMPTS, int(len(grupos) * EVOLUTION_RETRY_BUDGET))
+    retentativas = 0
+    concluidas = 0
+    envios_por_instancia: Counter = Counter()
+
+    async def publicar_estatisticas() -> None:
+        while True:
+            await asyncio.sleep(EVOLUTION_STATS_SECONDS)
+            logging.info(
+                "Concorrência parcial (%d de %d mensagens): %s",
+                concluidas,
+                len(grupos),
+                dict(janela.estatisticas(), retentativas=retentativas),
+            )
+
+    async with AsyncExitStack() as pilha:
+        conexoes: ConexoesInstancias = {}
+        for instancia in INSTANCIAS:
+            cliente = obter_cliente(instancia.nome)
+            http = await pilha.enter_async_context(cliente.cliente_assincrono(janela.maximo))
+            conexoes[instancia.nome] = (http, cliente.caminho_envio_texto())
+
+        async def enviar_com_retentativas(envio: Envio, texto: str) -> None:
+            nonlocal orcamento, retentativas
+            tentativa = 1
+            while True:
+                try:
+                    async with janela:
+                        instancia = await _enviar(conexoes, envio, texto, janela)
+                    envios_por_instancia[instancia] += 1
+                    return
+                except ERROS_TRANSITORIOS as exc:
+                    if tentativa >= EVOLUTION_RETRY_ATTEMPTS or orcamento <= 0:
+                        raise
+                    orcamento -= 1
+                    retentativas += 1
+                    # Backoff exponencial com jitter completo
+                    espera = random.uniform(
+                        0, min(EVOLUTION_RETRY_MAX_SECONDS, EVOLUTION_RETRY_BASE_SECONDS * 2 ** (tentativa - 1))
+                    )
+                    logging.warning(
+                        "Nova tentativa %d para %s em %.1fs: %s", tentativa + 1, envio.equipe, espera, exc
+                    )
+                    tentativa += 1
+                    await asyncio.sleep(espera)
+
+        async def concluir(chaves: List[str], sucesso: bool) -> None:
+            def concluir_todas() -> None:
+                for chave in chaves:
+                    concluir_envio(chave, sucesso)
+
+            try:
+                await asyncio.to_thread(concluir_todas)
+            except Exception:  # noqa: BLE001
+                if sucesso:
+                    # A mensagem foi entregue; a reserva expira sozinha após o prazo
+                    logging.exception("Não foi possível confirmar a reserva dos envios %s", chaves)
+                else:
+                    logging.exception("Não foi possível liberar a reserva dos envios %s", chaves)
+
+        async def enviar_partes(envio: Envio, chaves_membros: List[Optional[str]]) -> None:
+            # As partes saem em sequência para chegarem na ordem; cada uma tem suas tentativas
+            partes = dividir_mensagem(envio.mensagem)
+            if len(partes) > 1:
+                logging.info("Mensagem para %s dividida em %d partes", envio.equipe, len(partes))
+            usar_chaves = len(partes) > 1 and all(chaves_membros)
+            for indice, parte in enumerate(partes, 1):
+                chave_parte = None
+                if usar_chaves:
+                    chave_parte = gerar_chave_idempotencia(
+                        envio.nome_relatorio, f"{'|'.join(chaves_membros)}#{indice}", parte
+                    )
+                    reserva = await asyncio.to_thread(
+                        reservar_envio, chave_parte, envio.nome_relatorio,
+                        (envio.equipe or "")[:255], EVOLUTION_IDEMPOTENCY_LEASE_SECONDS,
+                    )
+                    if reserva == RESERVA_JA_ENVIADO:
+                        logging.info("Parte %d/%d para %s já havia sido entregue", indice, len(partes), envio.equipe)
+                        continue
+                    if reserva == RESERVA_EM_ANDAMENTO:
+                        raise RuntimeError(f"A parte {indice} desta mensagem já está sendo enviada por outra execução")
+                try:
+                    await enviar_com_retentativas(envio, parte)
+                except EntregaIncerta:
+                    raise
+                except Exception:  # noqa: BLE001
+                    if chave_parte:
+                        await concluir([chave_parte], False)
+                    raise
+                if chave_parte:
+                    await concluir([chave_parte], True)
+
+        async def executar(envio: Envio, membros: List[Envio]) -> List[ResultadoEnvio]:
+            """Reserva a chave de cada membro, envia os pendentes e conclui as reservas."""
+            resultados: Dict[Hashable, Optional[Exception]] = {}
+            pendentes: List[Envio] = []
+            reservadas: List[str] = []
+            try:
+                for membro in membros:
+                    if not membro.chave_idempotencia:
+                        pendentes.append(membro)
+                        continue
+                    reserva = await asyncio.to_thread(
+                        reservar_envio, membro.chave_idempotencia, membro.nome_relatorio,
+                        (membro.equipe or "")[:255], EVOLUTION_IDEMPOTENCY_LEASE_SECONDS,
+                    )
+                    if reserva == RESERVA_JA_ENVIADO:
+                        logging.info("Mensagem para %s já havia sido entregue; envio ignorado", membro.equipe)
+                        resultados[membro.chave] = None
+                    elif reserva == RESERVA_EM_ANDAMENTO:
+                        resultados[membro.chave] = RuntimeError(
+                            "Esta mensagem já está sendo enviada por outra execução"
+                        )
+                    else:
+                        reservadas.append(membro.chave_idempotencia)
+                        pendentes.append(membro)
+                if pendentes:
+                    # Membros já entregues ou em andamento saem da mensagem unida
+                    alvo = envio if len(pendentes) == len(membros) else _unir(pendentes, envio.chave)
+                    await enviar_partes(alvo, [membro.chave_idempotencia for membro in pendentes])
+            except EntregaIncerta as exc:
+                # Sem liberar a reserva: outra execução só reenvia depois do prazo
+                logging.warning("Entrega para %s incerta; envio não repetido: %s", envio.equipe, exc)
+                return [(membro.chave, resultados.get(membro.chave, exc)) for membro in membros]
+            except Exception as exc:  # noqa: BLE001
+                if reservadas:
+                    await concluir(reservadas, False)
+                return [(membro.chave, resultados.get(membro.chave, exc)) for membro in membros]
+
+            if reservadas:
+                await concluir(reservadas, True)
+            return [(membro.chave, resultados.get(membro.chave)) for membro in membros]
+
+        async def executar_e_registrar(envio: Envio, membros: List[Envio]) -> List[ResultadoEnvio]:
+            nonlocal concluidas
+            # Uma mensagem consolidada responde por todas as equipes que reúne
+            resultados = await executar(envio, membros)
+            concluidas += 1
+            if ao_concluir is not None:
+
+                def registrar() -> None:
+                    for resultado in resultados:
+                        ao_concluir(*resultado)
+
+                await asyncio.to_thread(registrar)
+            return resultados
+
+        publicador = asyncio.create_task(publicar_estatisticas()) if EVOLUTION_STATS_SECONDS > 0 else None
+        try:
+            tarefas = [asyncio.create_task(executar_e_registrar(envio, membros)) for envio, membros in grupos]
+            resultados = [resultado for tarefa in asyncio.as_completed(tarefas) for resultado in await tarefa]
+        finally:
+            if publicador is not None:
+                publicador.cancel()
+
+    resumo = dict(
+        janela.estatisticas(),
+        retentativas=retentativas,
+        mensagens=len(grupos),
+        instancias=dict(envios_por_instancia),
+    )
+    logging.info("Concorrência de envio: %s", resumo)
+    if estatisticas is not None:
+        estatisticas.update(resumo)
+    return resultados
+
+
+def despachar(
+    envios: Iterable[Envio],
+    estatisticas: Optional[Dict] = None,
+    ao_concluir: Optional[Callable[[Hashable, Optional[Exception]], None]] = None,
+) -> List[ResultadoEnvio]:
+    """Envia as mensagens e retorna ``(chave, erro)`` na ordem de conclusão.
+
+    ``erro`` é ``None`` quando o envio foi confirmado pela Evolution. Se
+    ``estatisticas`` for informado, recebe a janela de concorrência final e
+    seus extremos. ``ao_concluir(chave, erro)`` é chamada (fora do event
+    loop) assim que cada envio termina. Mesmo com a consolidação por número,
+    há um resultado para cada envio recebido. Deve ser chamada fora de um event
+    loop (por exemplo, na thread da tarefa).
+    """
+    envios = list(envios)
+    if not envios:
+        return []
+    return asyncio.run(_despachar(envios, estatisticas, ao_concluir))
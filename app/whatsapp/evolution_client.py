@@ -0,0 +1,164 @@
+"""Cliente HTTP da Evolution API.
+
+Cada processo mantém um :class:`EvolutionClient` por instância, dono de uma
+``requests.Session`` com pool de conexões e keep-alive. Assim os envios de um
+relatório reaproveitam poucas conexões já abertas em vez de abrir TCP/TLS a
+cada chamada. URL base, instância, cabeçalhos e timeouts ficam todos aqui.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import threading
+from typing import Any, Dict, Optional
+from urllib.parse import urljoin
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+from app.config.settings import (
+    EVOLUTION_CONNECT_TIMEOUT,
+    EVOLUTION_INSTANCE,
+    EVOLUTION_POOL_SIZE,
+    EVOLUTION_READ_TIMEOUT,
+    EVOLUTION_TOKEN,
+    EVOLUTION_URL,
+)
+from app.whatsapp.instancias import INSTANCIA_PRINCIPAL, obter_instancia
+
+
+class ErroTransitorio(Exception):
+    """Falha que pode ser repetida com segurança (429 ou 5xx da Evolution)."""
+
+
+class EntregaIncerta(Exception):
+    """A requisição de envio saiu, mas a resposta não chegou.
+
+    A Evolution pode ter entregue a mensagem; repetir o envio arriscaria
+    duplicá-la.
+    """
+
+
+def formatar_numero(numero: str) -> str:
+    return numero.replace("+", "").replace("-", "").replace(" ", "")
+
+
+def montar_payload_texto(numero_formatado: str, mensagem: str) -> dict:
+    return {
+        "number": numero_formatado,
+        "text": mensagem,
+        "delay": 250,
+    }
+
+
+def validar_resposta_envio(status_code: int, texto: str, dados: Any) -> None:
+    """Levanta exceção se a Evolution não confirmou o envio da mensagem."""
+    if status_code not in [200, 201]:
+        raise Exception(f"Erro Evolution API: {status_code} - {texto}")
+    if isinstance(dados, dict) and not dados.get("success", True):
+        raise Exception(
+            f"Erro na resposta: {dados.get('message', 'Erro desconhecido')}"
+        )
+
+
+def registrar_falha_4xx(status_code: int, url: str, metodo: str, corpo: Any) -> None:
+    if 400 <= status_code < 500:
+        logging.error(
+            "Falha 4xx ao chamar Evolution API - endpoint=%s método=%s body=%s",
+            url,
+            metodo,
+            corpo,
+        )
+
+
+class EvolutionClient:
+    """Acesso à Evolution API através de uma sessão HTTP persistente."""
+
+    def __init__(
+        self,
+        base_url: str = EVOLUTION_URL,
+        instancia: str = EVOLUTION_INSTANCE,
+        token: str = EVOLUTION_TOKEN,
+        pool_size: int = EVOLUTION_POOL_SIZE,
+        timeout: tuple = (EVOLUTION_CONNECT_TIMEOUT, EVOLUTION_READ_TIMEOUT),
+    ):
+        self.base_url = base_url
+        self.instancia = instancia
+        self.timeout = timeout
+
+        self.session = requests.Session()
+        self.session.headers.update({"Content-Type": "application/json", "apikey": token})
+        # Sem retries aqui: uma mensagem reenviada pelo adapter poderia ser entregue duas vezes
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def url(self, caminho: str) -> str:
+        return urljoin(self.base_url, caminho)
+
+    def requisitar(self, metodo: str, caminho: str, **kwargs) -> requests.Response:
+        kwargs.setdefault("timeout", self.timeout)
+        return self.session.request(metodo, self.url(caminho), **kwargs)
+
+    def estado_conexao(self) -> requests.Response:
+        return self.requisitar("GET", f"/instance/connectionState/{self.instancia}")
+
+    def conectar(self) -> requests.Response:
+        return self.requisitar("GET", f"/instance/connect/{self.instancia}")
+
+    def buscar_instancias(self) -> requests.Response:
+        return self.requisitar("GET", f"/instance/fetchInstances?instanceName={self.instancia}")
+
+    def logout(self) -> requests.Response:
+        return self.requisitar("DELETE", f"/instance/logout/{self.instancia}")
+
+    def caminho_envio_texto(self) -> str:
+        return f"/message/sendText/{self.instancia}"
+
+    def cliente_assincrono(self, max_conexoes: int) -> httpx.AsyncClient:
+        """Cria um ``httpx.AsyncClient`` com a mesma configuração da sessão.
+
+        O cliente deve ser usado dentro de um único event loop e fechado ao
+        final do despacho.
+        """
+        conectar, ler = self.timeout
+        return httpx.AsyncClient(
+            base_url=self.base_url,
+            headers=dict(self.session.headers),
+            timeout=httpx.Timeout(ler, connect=conectar),
+            limits=httpx.Limits(
+                max_connections=max_conexoes,
+                max_keepalive_connections=max_conexoes,
+            ),
+        )
+
+    def fechar(self) -> None:
+        self.session.close()
+
+
+_clientes: Dict[str, EvolutionClient] = {}
+_clientes_pid: Optional[int] = None
+_cliente_lock = threading.Lock()
+
+
+def obter_cliente(instancia: Optional[str] = None) -> EvolutionClient:
+    """Retorna o cliente da instância no processo atual, criando-o na primeira chamada.
+
+    Sem ``instancia``, usa a principal do pool. O PID é conferido para que
+    um worker criado por ``fork`` nunca herde as conexões abertas pelo
+    processo pai.
+    """
+    global _clientes, _clientes_pid
+    nome = instancia or INSTANCIA_PRINCIPAL
+    pid = os.getpid()
+    if _clientes_pid == pid and nome in _clientes:
+        return _clientes[nome]
+    with _cliente_lock:
+        if _clientes_pid != pid:
+            _clientes = {}
+            _clientes_pid = pid
+        if nome not in _clientes:
+            config = obter_instancia(nome)
+            _clientes[nome] = EvolutionClient(instancia=config.nome, token=config.token)
+        return _clientes[nome]
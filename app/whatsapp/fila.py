@@ -0,0 +1,220 @@
+"""Fila durável de envios em SQLite.
+
+Com ``ENVIO_MODO=fila`` o worker web só gera as mensagens e grava o lote
+aqui. O despachante (``python -m app.despachante``) roda em outro processo: ele
+reserva um lote por vez, envia os itens pendentes e grava o resultado de cada
+equipe assim que ele chega. Se o despachante cair, a reserva expira após
+``FILA_LEASE_SECONDS`` e o lote é retomado a partir dos itens ainda
+pendentes. Os itens que estavam em voo são protegidos pelas chaves de
+idempotência do histórico.
+
+Enquanto processa, o despachante renova a reserva com o token recebido em
+:func:`reservar_lote`, para que um lote demorado não seja pego por outro
+despachante. Cada reserva conta uma tentativa; um lote reservado
+``FILA_MAX_TENTATIVAS`` vezes sem ser concluído é marcado como falho.
+"""
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from app.config.settings import FILA_ENVIOS_PATH, FILA_LEASE_SECONDS, FILA_MAX_TENTATIVAS
+
+ITEM_PENDENTE = "pendente"
+ITEM_ENVIADO = "enviado"
+ITEM_ERRO = "erro"
+
+
+_schema_pronto = False
+_schema_lock = threading.Lock()
+
+
+def _garantir_schema(conn: sqlite3.Connection) -> None:
+    """Cria as tabelas e ativa o WAL uma única vez por processo."""
+    global _schema_pronto
+    if _schema_pronto:
+        return
+    with _schema_lock:
+        if _schema_pronto:
+            return
+        # O modo WAL fica gravado no arquivo; não precisa ser repetido por conexão
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS lotes ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            "task_id TEXT NOT NULL,"
+            "dados TEXT NOT NULL,"
+            "extra TEXT NULL,"
+            "status TEXT NOT NULL DEFAULT 'pendente',"
+            "reservado_ate REAL NOT NULL DEFAULT 0,"
+            "criado_em REAL NOT NULL,"
+            "tentativas INTEGER NOT NULL DEFAULT 0,"
+            "dono TEXT NULL)"
+        )
+        # Filas criadas antes do controle de tentativas e de dono da reserva
+        colunas = {linha[1] for linha in conn.execute("PRAGMA table_info(lotes)")}
+        if "tentativas" not in colunas:
+            conn.execute("ALTER TABLE lotes ADD COLUMN tentativas INTEGER NOT NULL DEFAULT 0")
+        if "dono" not in colunas:
+            conn.execute("ALTER TABLE lotes ADD COLUMN dono TEXT NULL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS itens ("
+            "lote_id INTEGER NOT NULL REFERENCES lotes(id),"
+            "posicao INTEGER NOT NULL,"
+            "envio TEXT NOT NULL,"
+            "status TEXT NOT NULL DEFAULT 'pendente',"
+            "erro TEXT NULL,"
+            "PRIMARY KEY (lote_id, posicao))"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_lotes_status ON lotes (status, id)")
+        _schema_pronto = True
+
+
+@contextmanager
+def _conectar() -> Iterator[sqlite3.Connection]:
+    if not _schema_pronto:
+        diretorio = os.path.dirname(FILA_ENVIOS_PATH)
+        if diretorio:
+            os.makedirs(diretorio, exist_ok=True)
+    conn = sqlite3.connect(FILA_ENVIOS_PATH, timeout=30, isolation_level=None)
+    try:
+        _garantir_schema(conn)
+        # Configuração da conexão, não do arquivo: vale só para esta conexão
+        conn.execute("PRAGMA synchronous=NORMAL")
+        yield conn
+    finally:
+        conn.close()
+
+
+def enfileirar_lote(task_id: str, dados: Dict[str, Any], envios: List[Dict[str, Any]], extra: Optional[Dict[str, Any]] = None) -> int:
+    """Grava um lote e seus itens em uma única transação e retorna o id do lote."""
+    with _conectar() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            cursor = conn.execute(
+                "INSERT INTO lotes (task_id, dados, extra, criado_em) VALUES (?, ?, ?, ?)",
+                (task_id, json.dumps(dados, ensure_ascii=False), json.dumps(extra or {}, ensure_ascii=False), time.time()),
+            )
+            lote_id = cursor.lastrowid
+            conn.executemany(
+                "INSERT INTO itens (lote_id, posicao, envio) VALUES (?, ?, ?)",
+                [(lote_id, posicao, json.dumps(envio, ensure_ascii=False)) for posicao, envio in enumerate(envios)],
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+    return lote_id
+
+
+def reservar_lote() -> Optional[Tuple[int, str, Dict[str, Any], Dict[str, Any], str]]:
+    """Reserva o lote pendente mais antigo (ou um com reserva vencida).
+
+    Retorna ``(lote_id, task_id, dados, extra, dono)`` ou ``None`` se a fila
+    estiver vazia. ``dono`` identifica esta reserva em :func:`renovar_reserva`.
+    """
+    agora = time.time()
+    dono = uuid.uuid4().hex
+    with _conectar() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT id, task_id, dados, extra FROM lotes "
+                "WHERE (status = 'pendente' OR (status = 'processando' AND reservado_ate < ?)) "
+                "AND tentativas < ? ORDER BY id LIMIT 1",
+                (agora, FILA_MAX_TENTATIVAS),
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            conn.execute(
+                "UPDATE lotes SET status = 'processando', reservado_ate = ?, dono = ?, "
+                "tentativas = tentativas + 1 WHERE id = ?",
+                (agora + FILA_LEASE_SECONDS, dono, row[0]),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+    return row[0], row[1], json.loads(row[2]), json.loads(row[3] or "{}"), dono
+
+
+def renovar_reserva(lote_id: int, dono: str) -> bool:
+    """Estende a reserva; ``False`` se ela já passou para outro despachante."""
+    with _conectar() as conn:
+        cursor = conn.execute(
+            "UPDATE lotes SET reservado_ate = ? WHERE id = ? AND dono = ? AND status = 'processando'",
+            (time.time() + FILA_LEASE_SECONDS, lote_id, dono),
+        )
+        return cursor.rowcount == 1
+
+
+def descartar_lotes_esgotados() -> List[Tuple[int, str]]:
+    """Marca como falhos os lotes que esgotaram as tentativas; retorna ``(lote_id, task_id)``."""
+    with _conectar() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute(
+                "SELECT id, task_id FROM lotes WHERE status = 'processando' "
+                "AND reservado_ate < ? AND tentativas >= ?",
+                (time.time(), FILA_MAX_TENTATIVAS),
+            ).fetchall()
+            conn.executemany(
+                "UPDATE lotes SET status = 'falhou', reservado_ate = 0 WHERE id = ?",
+                [(lote_id,) for lote_id, _ in rows],
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+    return [(lote_id, task_id) for lote_id, task_id in rows]
+
+
+def itens_do_lote(lote_id: int) -> List[Tuple[int, Dict[str, Any], str, Optional[str]]]:
+    """Lista ``(posicao, envio, status, erro)`` de todos os itens do lote."""
+    with _conectar() as conn:
+        rows = conn.execute(
+            "SELECT posicao, envio, status, erro FROM itens WHERE lote_id = ? ORDER BY posicao",
+            (lote_id,),
+        ).fetchall()
+    return [(posicao, json.loads(envio), status, erro) for posicao, envio, status, erro in rows]
+
+
+def registrar_item(lote_id: int, posicao: int, erro: Optional[str], dono: str) -> None:
+    """Grava o resultado de um item e renova a reserva do lote, se ainda for de ``dono``.
+
+    O resultado é gravado mesmo com a reserva perdida: o item já saiu, e
+    assim o novo dono não o reenvia.
+    """
+    with _conectar() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "UPDATE itens SET status = ?, erro = ? WHERE lote_id = ? AND posicao = ?",
+                (ITEM_ENVIADO if erro is None else ITEM_ERRO, erro, lote_id, posicao),
+            )
+            conn.execute(
+                "UPDATE lotes SET reservado_ate = ? WHERE id = ? AND dono = ?",
+                (time.time() + FILA_LEASE_SECONDS, lote_id, dono),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+
+def concluir_lote(lote_id: int, dono: str) -> bool:
+    """Marca o lote como concluído; ``False`` se a reserva já passou para outro despachante."""
+    with _conectar() as conn:
+        cursor = conn.execute(
+            "UPDATE lotes SET status = 'concluido', reservado_ate = 0 "
+            "WHERE id = ? AND dono = ? AND status = 'processando'",
+            (lote_id, dono),
+        )
+        return cursor.rowcount == 1
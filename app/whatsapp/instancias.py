@@ -0,0 +1,99 @@
+"""Pool de instâncias da Evolution e roteamento dos envios entre elas.
+
+``EVOLUTION_INSTANCES`` lista as instâncias (cada uma é uma sessão de
+WhatsApp com token e limite de envio próprios). Sem ela, o pool tem só
+``EVOLUTION_INSTANCE``. O número de destino é distribuído por hash
+consistente: o mesmo destinatário sempre recebe da mesma instância, e
+incluir ou remover uma instância só move os números dela. Se a sessão da
+instância escolhida estiver fechada, o envio segue para a próxima do anel.
+"""
+from __future__ import annotations
+
+import bisect
+import hashlib
+from dataclasses import dataclass
+from typing import List
+
+from app.config.settings import (
+    EVOLUTION_INSTANCE,
+    EVOLUTION_INSTANCES,
+    EVOLUTION_RATE_PER_SECOND,
+    EVOLUTION_TOKEN,
+)
+
+# Pontos de cada instância no anel; mais pontos equilibram melhor a divisão
+REPLICAS_POR_INSTANCIA = 100
+
+
+@dataclass(frozen=True)
+class InstanciaEvolution:
+    nome: str
+    token: str
+    taxa: float = EVOLUTION_RATE_PER_SECOND
+
+
+def carregar_instancias(config: str = EVOLUTION_INSTANCES) -> List[InstanciaEvolution]:
+    """Lê ``nome:token[:mensagens_por_segundo]`` separados por vírgula."""
+    instancias: List[InstanciaEvolution] = []
+    for item in config.split(","):
+        if not item.strip():
+            continue
+        nome, _, resto = item.strip().partition(":")
+        token, _, taxa = resto.partition(":")
+        instancias.append(InstanciaEvolution(
+            nome.strip(),
+            token.strip() or EVOLUTION_TOKEN,
+            float(taxa) if taxa.strip() else EVOLUTION_RATE_PER_SECOND,
+        ))
+    if not instancias:
+        instancias.append(InstanciaEvolution(EVOLUTION_INSTANCE, EVOLUTION_TOKEN))
+    return instancias
+
+
+def _hash(texto: str) -> int:
+    return int(hashlib.md5(texto.encode("utf-8")).hexdigest()[:16], 16)
+
+
+class AnelInstancias:
+    """Hash consistente dos números de destino sobre as instâncias."""
+
+    def __init__(self, nomes: List[str], replicas: int = REPLICAS_POR_INSTANCIA):
+        self._nomes = list(dict.fromkeys(nomes))
+        self._pontos = sorted((_hash(f"{nome}#{i}"), nome) for nome in self._nomes for i in range(replicas))
+        self._posicoes = [ponto for ponto, _ in self._pontos]
+
+    def preferencia(self, numero: str) -> List[str]:
+        """Instâncias na ordem em que devem ser tentadas para ``numero``."""
+        if len(self._nomes) == 1:
+            return list(self._nomes)
+        inicio = bisect.bisect(self._posicoes, _hash(numero))
+        ordem: List[str] = []
+        for deslocamento in range(len(self._pontos)):
+            nome = self._pontos[(inicio + deslocamento) % len(self._pontos)][1]
+            if nome not in ordem:
+                ordem.append(nome)
+                if len(ordem) == len(self._nomes):
+                    break
+        return ordem
+
+
+INSTANCIAS = carregar_instancias()
+INSTANCIA_PRINCIPAL = INSTANCIAS[0].nome
+_por_nome = {instancia.nome: instancia for instancia in INSTANCIAS}
+_anel = AnelInstancias(list(_por_nome))
+
+
+def nomes_instancias() -> List[str]:
+    return list(_por_nome)
+
+
+def obter_instancia(nome: str) -> InstanciaEvolution:
+    try:
+        return _por_nome[nome]
+    except KeyError:
+        raise ValueError(f"Instância da Evolution desconhecida: {nome}") from None
+
+
+def instancias_para(numero: str) -> List[str]:
+    """Ordem de preferência das instâncias para um número de destino já formatado."""
+    return _anel.preferencia(numero)
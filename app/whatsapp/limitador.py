@@ -0,0 +1,108 @@
+"""Limite de envios à Evolution compartilhado entre os workers.
+
+Os workers do gunicorn e as tarefas de cada um disputam a mesma instância
+da Evolution. O ``TokenBucket`` guarda seu estado (fichas disponíveis e
+momento da última reposição) em um arquivo pequeno por instância, protegido
+por ``flock``. Assim todos os processos da máquina respeitam juntos
+``EVOLUTION_RATE_PER_SECOND`` mensagens por segundo, com rajadas de até
+``EVOLUTION_RATE_BURST``. Sem ``fcntl`` (Windows) o limite vale por processo.
+Cada instância do pool tem seu próprio bucket e taxa.
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+import re
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - só em plataformas sem flock
+    fcntl = None
+
+from app.config.settings import (
+    EVOLUTION_RATE_BURST,
+    EVOLUTION_RATE_DIR,
+)
+from app.whatsapp.instancias import INSTANCIA_PRINCIPAL, INSTANCIAS
+
+
+class TokenBucket:
+    """Token bucket com estado em arquivo, seguro entre threads e processos."""
+
+    def __init__(self, caminho: str, taxa: float, rajada: float):
+        self.caminho = caminho
+        self.taxa = taxa
+        self.rajada = max(1.0, rajada)
+        self._lock = threading.Lock()
+        self._estado_local: Tuple[float, float] = (self.rajada, time.time())
+
+    def _ler(self, fd: int) -> Tuple[float, float]:
+        conteudo = os.pread(fd, 64, 0).decode("ascii", "ignore").split()
+        try:
+            return float(conteudo[0]), float(conteudo[1])
+        except (IndexError, ValueError):
+            return self.rajada, time.time()
+
+    def _gravar(self, fd: int, fichas: float, instante: float) -> None:
+        dados = f"{fichas:.6f} {instante:.6f}".encode("ascii")
+        os.ftruncate(fd, 0)
+        os.pwrite(fd, dados, 0)
+
+    def _consumir(self, fichas: float, instante: float, agora: float) -> Tuple[float, float, float]:
+        # ``max`` protege contra o relógio voltando no tempo
+        fichas = min(self.rajada, fichas + max(0.0, agora - instante) * self.taxa)
+        if fichas >= 1:
+            return fichas - 1, agora, 0.0
+        return fichas, agora, (1 - fichas) / self.taxa
+
+    def tentar_consumir(self) -> float:
+        """Consome uma ficha se houver; senão retorna quantos segundos esperar."""
+        if self.taxa <= 0:
+            return 0.0
+        with self._lock:
+            agora = time.time()
+            if fcntl is None:
+                fichas, instante, espera = self._consumir(*self._estado_local, agora)
+                self._estado_local = (fichas, instante)
+                return espera
+
+            os.makedirs(os.path.dirname(self.caminho) or ".", exist_ok=True)
+            fd = os.open(self.caminho, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                fichas, instante, espera = self._consumir(*self._ler(fd), agora)
+                self._gravar(fd, fichas, instante)
+                return espera
+            finally:
+                os.close(fd)
+
+    async def aguardar_async(self) -> None:
+        """Espera uma ficha sem prender o event loop.
+
+        A leitura do arquivo sob ``flock`` roda em uma thread: com vários
+        workers disputando o bucket, a espera pela trava não atrasa os demais
+        envios em andamento (nem infla as latências vistas pela janela).
+        """
+        while True:
+            espera = await asyncio.to_thread(self.tentar_consumir)
+            if espera <= 0:
+                return
+            await asyncio.sleep(espera)
+
+
+def _caminho_bucket(instancia: str) -> str:
+    nome = re.sub(r"[^A-Za-z0-9_.-]", "_", instancia) or "padrao"
+    return os.path.join(EVOLUTION_RATE_DIR, f"evolution_{nome}.bucket")
+
+
+limitadores: Dict[str, TokenBucket] = {
+    instancia.nome: TokenBucket(_caminho_bucket(instancia.nome), instancia.taxa, EVOLUTION_RATE_BURST)
+    for instancia in INSTANCIAS
+}
+
+
+def obter_limitador(instancia: Optional[str] = None) -> TokenBucket:
+    return limitadores[instancia or INSTANCIA_PRINCIPAL]
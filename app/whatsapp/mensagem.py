@@ -1,5 +1,8 @@
 import unicodedata
-from typing import List, Optional
+from typing import Callable, Dict
+
+import numpy as np
+import pandas as pd
 
 from app.processamento.ocorrencias_processor import processar_ocorrencias
 from app.types import MensagemDetalhada
@@ -49,101 +52,142 @@ def normalizar(texto):
         return ""
     return unicodedata.normalize("NFKD", texto).encode("ASCII", "ignore").decode().strip().lower()
 
-# === Geração de mensagem individual por grupo (Nome + Data) ===
-
-
-def gerar_mensagem(grupo) -> Optional[MensagemDetalhada]:
-    nome = grupo["Nome"].iloc[0]
-    data = grupo["Data"].iloc[0]
-    ocorrencias = grupo.set_index("Ocorrência")["Valor"].astype(str).to_dict()
+# === Mensagens de Auditoria agrupadas por (Nome, Data) ===
 
-    # Normaliza as chaves e valores
-    ocorrencias_norm = {normalizar(k): normalizar(v) for k, v in ocorrencias.items()}
+MOTIVOS_FALTA_COM_HORAS = ["Falta", "Horas Faltantes"]
 
-    msgs: List[str] = []
-    mensagens_set = set()
-    motivos_utilizados: List[str] = []
 
-    # Verifica se há falta justificada/abonada para a mesma pessoa e data
-    # Agora, verifica a nova coluna 'FaltaAbonadaJustificada' no grupo
-    falta_justificada_ou_abonada = grupo["FaltaAbonadaJustificada"].any()
-
-    # Ignora duplicidade entre duas ocorrências iguais
-    tem_ambas_horas_extras = (
-        "horas extras" in ocorrencias_norm and
-        "mais de duas horas extras" in ocorrencias_norm and
-        ocorrencias.get("Horas extras") == ocorrencias.get("Mais de duas horas extras")
+def _minutos_horas_extras(valor) -> float:
+    try:
+        h, m = map(int, valor.strip().split(":"))
+    except Exception:  # noqa: BLE001
+        return np.nan
+    return h * 60 + m
+
+
+def _mapear_unicos(serie: pd.Series, funcao: Callable) -> np.ndarray:
+    """Aplica ``funcao`` uma vez por valor distinto e replica o resultado."""
+    codigos, unicos = pd.factorize(serie, use_na_sentinel=False)
+    resultados = np.empty(len(unicos), dtype=object)
+    resultados[:] = [funcao(valor) for valor in unicos]
+    return resultados[codigos]
+
+
+def _ultimo_valor_por_grupo(grupos: np.ndarray, valores: pd.Series, mascara: np.ndarray) -> Dict[int, str]:
+    """Último valor (como texto) de cada grupo entre as linhas de ``mascara``.
+
+    Com várias linhas da mesma ocorrência no grupo, a última prevalece.
+    """
+    if not mascara.any():
+        return {}
+    return pd.Series(valores[mascara].to_numpy()).groupby(grupos[mascara]).last().to_dict()
+
+
+def gerar_mensagens_auditoria(df: pd.DataFrame) -> pd.Series:
+    """Gera as mensagens de Auditoria agrupadas por ``(Nome, Data)``.
+
+    Aplica as regras sobre o ``DataFrame`` inteiro, com máscaras booleanas.
+    Normalização e conversão de horas são calculadas uma única vez por valor
+    distinto; só a montagem final do texto é feita por grupo.
+    """
+    indice_vazio = pd.MultiIndex.from_arrays([[], []], names=["Nome", "Data"])
+    dados = df[df["Nome"].notna() & df["Data"].notna()]
+    if dados.empty:
+        return pd.Series([], index=indice_vazio, dtype=object)
+
+    grupos = dados.groupby(["Nome", "Data"], sort=True).ngroup().to_numpy()
+    total_grupos = int(grupos.max()) + 1
+    _, primeira_linha = np.unique(grupos, return_index=True)
+    nomes = dados["Nome"].to_numpy()
+    datas = dados["Data"].to_numpy()
+
+    def qualquer_no_grupo(mascara: np.ndarray) -> np.ndarray:
+        return np.bincount(grupos, weights=mascara, minlength=total_grupos) > 0
+
+    ocorrencias = dados["Ocorrência"]
+    valores = dados["Valor"]
+    ocorr_norm = _mapear_unicos(ocorrencias, normalizar)
+    ocorr_limpa = _mapear_unicos(ocorrencias, lambda v: v.strip() if isinstance(v, str) else "")
+    abonada = dados["FaltaAbonadaJustificada"].fillna(False).astype(bool).to_numpy()
+    abonada_grupo = qualquer_no_grupo(abonada)
+
+    eh_falta = ocorr_norm == "falta"
+    eh_horas_faltantes = ocorr_norm == "horas faltantes"
+    eh_horas_extras = ocorr_norm == "horas extras"
+    eh_mais_duas_extras = ocorr_norm == "mais de duas horas extras"
+
+    # Combinação especial: falta + horas faltantes não justificadas
+    combinacao = qualquer_no_grupo(eh_falta) & qualquer_no_grupo(eh_horas_faltantes) & ~abonada_grupo
+
+    # Ignora duplicidade entre "Horas extras" e "Mais de duas horas extras"
+    ambas_extras = qualquer_no_grupo(eh_horas_extras) & qualquer_no_grupo(eh_mais_duas_extras)
+    if ambas_extras.any():
+        texto_valores = valores.astype(str)
+        extras = _ultimo_valor_por_grupo(grupos, texto_valores, (ocorrencias == "Horas extras").to_numpy())
+        mais_duas = _ultimo_valor_por_grupo(
+            grupos, texto_valores, (ocorrencias == "Mais de duas horas extras").to_numpy()
+        )
+        for grupo in np.flatnonzero(ambas_extras):
+            ambas_extras[grupo] = extras.get(grupo) == mais_duas.get(grupo)
+
+    templates = _mapear_unicos(ocorrencias, lambda v: TEMPLATES.get(v.strip()) if isinstance(v, str) else None)
+    minutos_faltantes = _mapear_unicos(valores, converter_horas_para_minutos).astype(float)
+    minutos_extras = _mapear_unicos(valores, _minutos_horas_extras).astype(float)
+
+    manter = (
+        (ocorr_limpa != "")
+        & ~combinacao[grupos]
+        & ~(eh_horas_faltantes & abonada_grupo[grupos])
+        & ~(eh_falta & abonada)
+        & ~(eh_mais_duas_extras & ambas_extras[grupos])
+        & ~(eh_horas_faltantes & (minutos_faltantes < 60))
+        & ~(eh_horas_extras & ~(minutos_extras >= 120))
+        & (templates != None)  # noqa: E711
     )
 
-    # ✅ Combinação especial: falta + horas faltantes não justificadas
-    tem_falta = "falta" in ocorrencias_norm and not grupo["FaltaAbonadaJustificada"].any()
-    tem_horas_faltantes = "horas faltantes" in ocorrencias_norm and not grupo["FaltaAbonadaJustificada"].any()
-
-    if tem_falta and tem_horas_faltantes:
-        valor_faltante = ocorrencias.get("Horas Faltantes") or ocorrencias.get("horas faltantes")
-        msg = f"*{nome}* _faltou_ e _ficou devendo_ *{formatar_horas(valor_faltante)}*. Por favor *ajustar*."
-        return MensagemDetalhada(
-            texto=msg,
-            motivos=["Falta", "Horas Faltantes"],
+    linhas = np.flatnonzero(manter)
+    horas = _mapear_unicos(valores.iloc[linhas], formatar_horas)
+    valores_linhas = valores.to_numpy()[linhas]
+    textos = [
+        tpl.format(nome=nome, data=data, valor=valor, horas=h).strip()
+        for tpl, nome, data, valor, h in zip(
+            templates[linhas], nomes[linhas], datas[linhas], valores_linhas, horas
         )
+    ]
+    selecionadas = pd.DataFrame(
+        {"grupo": grupos[linhas], "texto": textos, "motivo": ocorr_limpa[linhas]}
+    )
+    selecionadas = selecionadas[selecionadas["texto"] != ""].drop_duplicates(["grupo", "texto"])
+    textos_por_grupo = selecionadas.groupby("grupo", sort=True)["texto"].agg("\n".join)
+    motivos_por_grupo = (
+        selecionadas.drop_duplicates(["grupo", "motivo"]).groupby("grupo", sort=True)["motivo"].agg(list)
+    )
 
-    
-    for index, row in grupo.iterrows(): # Itera sobre as linhas do grupo, não apenas as chaves de ocorrencias
-        ocorr = row["Ocorrência"]
-        valor = row["Valor"]
-
-        if not isinstance(ocorr, str) or ocorr.strip() == "":
-            continue
-
-        ocorr_norm = normalizar(ocorr)
-        valor_norm = normalizar(valor)
-
-        # ✅ Regra principal: ignora mensagem de horas faltantes se houver falta justificada
-        if ocorr_norm == "horas faltantes" and falta_justificada_ou_abonada:
-            continue
-
-        # Ignora a própria ocorrência de Falta se ela for abonada/justificada
-        if ocorr_norm == "falta" and row["FaltaAbonadaJustificada"]:
-            continue
-
-        if tem_ambas_horas_extras and ocorr_norm == "mais de duas horas extras":
-            continue
-
-        if ocorr_norm == "horas faltantes":
-            if converter_horas_para_minutos(valor) < 60:
-                continue
-
-        if ocorr_norm == "horas extras":
-            try:
-                h, m = map(int, valor.strip().split(":"))
-                if h * 60 + m < 120:
-                    continue
-            except:
-                continue
-
-        tpl = TEMPLATES.get(ocorr.strip())
-        if not tpl:
-            continue
-
-        msg = tpl.format(
-            nome=nome,
-            data=data,
-            valor=valor,
-            horas=formatar_horas(valor)
-        ).strip()
-
-        if msg and msg not in mensagens_set:
-            msgs.append(msg)
-            mensagens_set.add(msg)
-            motivo = ocorr.strip()
-            if motivo and motivo not in motivos_utilizados:
-                motivos_utilizados.append(motivo)
-
-    if not msgs:
-        return None
-
-    motivos = [m for m in motivos_utilizados if m]
-    return MensagemDetalhada(texto="\n".join(msgs), motivos=motivos)
+    resultado: Dict[int, MensagemDetalhada] = {
+        grupo: MensagemDetalhada(texto=texto, motivos=motivos_por_grupo[grupo])
+        for grupo, texto in textos_por_grupo.items()
+    }
+
+    grupos_combinacao = np.flatnonzero(combinacao)
+    if len(grupos_combinacao):
+        texto_valores = valores.astype(str)
+        faltantes = _ultimo_valor_por_grupo(grupos, texto_valores, (ocorrencias == "Horas Faltantes").to_numpy())
+        faltantes_min = _ultimo_valor_por_grupo(grupos, texto_valores, (ocorrencias == "horas faltantes").to_numpy())
+        for grupo in grupos_combinacao:
+            nome = nomes[primeira_linha[grupo]]
+            valor_faltante = faltantes.get(grupo) or faltantes_min.get(grupo)
+            resultado[grupo] = MensagemDetalhada(
+                texto=f"*{nome}* _faltou_ e _ficou devendo_ *{formatar_horas(valor_faltante)}*. Por favor *ajustar*.",
+                motivos=list(MOTIVOS_FALTA_COM_HORAS),
+            )
+
+    if not resultado:
+        return pd.Series([], index=indice_vazio, dtype=object)
+
+    ordem = sorted(resultado)
+    posicoes = primeira_linha[ordem]
+    indice = pd.MultiIndex.from_arrays([nomes[posicoes], datas[posicoes]], names=["Nome", "Data"])
+    return pd.Series([resultado[grupo] for grupo in ordem], index=indice, dtype=object)
 
 # === Gera todas as mensagens agrupadas por Nome + Data ===
 
@@ -153,7 +197,7 @@ def gerar_mensagens(df, tipo_relatorio):
     if tipo_normalizado == "auditoria":
         if 'FaltaAbonadaJustificada' not in df.columns:
             df['FaltaAbonadaJustificada'] = False
-        mensagens = df.groupby(["Nome", "Data"], group_keys=False).apply(lambda g: gerar_mensagem(g))
+        mensagens = gerar_mensagens_auditoria(df)
 
     elif tipo_normalizado in {"ocorrencias", "ocorrências"}:
         mensagens = processar_ocorrencias(df)
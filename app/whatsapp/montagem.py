@@ -0,0 +1,108 @@
+"""Montagem e divisão das mensagens de WhatsApp por equipe.
+
+A mensagem de uma equipe é formada por seções separadas por linha em branco:
+o título (``*LOJA 75*``) e uma seção por dia (``*NO DIA dd/mm/aaaa:*``
+seguido dos itens ``• ...``). Quando o texto passa de ``WHATSAPP_MAX_BYTES``,
+:func:`dividir_mensagem` o corta nessas fronteiras (dia e, se preciso,
+item) em partes numeradas que repetem o título.
+"""
+from __future__ import annotations
+
+from datetime import datetime
+from typing import Dict, List
+
+from app.config.settings import WHATSAPP_MAX_BYTES
+
+# Início de um item da lista; linhas sem marcador continuam o item anterior
+MARCADORES_ITEM = ("• ", "- ")
+
+# Espaço reservado para a numeração " (12/34)" de cada parte
+_RESERVA_NUMERACAO = len(" (999/999)")
+
+
+def tamanho_mensagem(texto: str) -> int:
+    """Tamanho do texto em bytes UTF-8, como trafega no payload."""
+    return len(texto.encode("utf-8"))
+
+
+def montar_mensagem_equipe(titulo: str, mensagens_por_data: Dict[str, List[str]]) -> str:
+    """Monta a mensagem de uma equipe com uma seção por dia, em ordem de data."""
+    secoes = [f"*{titulo}*"]
+    for data in sorted(mensagens_por_data, key=lambda d: datetime.strptime(d, "%d/%m/%Y")):
+        itens = [m.strip() for m in mensagens_por_data[data] if m and m.strip()]
+        if itens:
+            secoes.append("\n".join([f"*NO DIA {data}:*"] + [f"• {m}" for m in itens]))
+    return "\n\n".join(secoes)
+
+
+def _cortar(texto: str, limite_bytes: int) -> List[str]:
+    """Último recurso: corta o texto em pedaços de até ``limite_bytes``."""
+    pedacos = []
+    dados = texto.encode("utf-8")
+    while dados:
+        pedaco = dados[:limite_bytes].decode("utf-8", "ignore")
+        pedacos.append(pedaco)
+        dados = dados[len(pedaco.encode("utf-8")):]
+    return pedacos
+
+
+def _dividir_secao(secao: str, limite_bytes: int) -> List[str]:
+    """Divide uma seção nos itens, repetindo a linha de cabeçalho em cada bloco."""
+    if tamanho_mensagem(secao) <= limite_bytes:
+        return [secao]
+
+    cabecalho, *linhas = secao.split("\n")
+    itens: List[str] = []
+    for linha in linhas:
+        if itens and not linha.startswith(MARCADORES_ITEM):
+            itens[-1] += "\n" + linha
+        else:
+            itens.append(linha)
+
+    blocos: List[str] = []
+    atual = cabecalho
+    for item in itens:
+        candidato = f"{atual}\n{item}"
+        if tamanho_mensagem(candidato) <= limite_bytes:
+            atual = candidato
+            continue
+        if atual != cabecalho:
+            blocos.append(atual)
+        atual = f"{cabecalho}\n{item}"
+        if tamanho_mensagem(atual) > limite_bytes:
+            blocos.extend(_cortar(atual, limite_bytes))
+            atual = cabecalho
+    if atual != cabecalho or not blocos:
+        blocos.extend(_cortar(atual, limite_bytes))
+    return blocos
+
+
+def dividir_mensagem(mensagem: str, limite_bytes: int = WHATSAPP_MAX_BYTES) -> List[str]:
+    """Divide a mensagem em partes de até ``limite_bytes``.
+
+    Mensagens dentro do limite voltam inalteradas. As demais são cortadas
+    entre seções e, se uma seção sozinha não couber, entre seus itens; cada
+    parte começa pelo título seguido da numeração, como ``*LOJA 75* (2/3)``.
+    """
+    if tamanho_mensagem(mensagem) <= limite_bytes:
+        return [mensagem]
+
+    titulo, _, corpo = mensagem.partition("\n\n")
+    if not corpo:
+        titulo, _, corpo = mensagem.partition("\n")
+    if not corpo:
+        titulo, corpo = "", mensagem
+
+    orcamento = max(16, limite_bytes - tamanho_mensagem(titulo) - _RESERVA_NUMERACAO - 2)
+    blocos = [bloco for secao in corpo.split("\n\n") for bloco in _dividir_secao(secao, orcamento)]
+
+    partes: List[str] = []
+    for bloco in blocos:
+        if partes and tamanho_mensagem(partes[-1]) + 2 + tamanho_mensagem(bloco) <= orcamento:
+            partes[-1] += "\n\n" + bloco
+        else:
+            partes.append(bloco)
+
+    total = len(partes)
+    prefixo = f"{titulo} " if titulo else ""
+    return [f"{prefixo}({indice}/{total})\n\n{parte}" for indice, parte in enumerate(partes, 1)]
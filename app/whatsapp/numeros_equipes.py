@@ -1,6 +1,39 @@
-import pandas as pd
+"""Diretório de números das equipes, lido da planilha do Google Sheets.
+
+A planilha (``PLANILHA_EQUIPES_URL``, link CSV) era baixada inteira a cada
+relatório, antes de qualquer envio. Agora cada worker mantém o diretório em
+memória e o revalida em segundo plano quando passa de
+``NUMEROS_EQUIPES_TTL`` segundos, com ``If-None-Match``/``If-Modified-Since``
+(uma resposta 304 não traz a planilha de novo). A última versão baixada fica
+em ``NUMEROS_EQUIPES_SNAPSHOT``: os workers partem dela sem esperar a rede e
+continuam enviando com ela se a planilha estiver fora do ar.
+
+Passado ``NUMEROS_EQUIPES_IDADE_MAXIMA`` a cópia não é mais servida enquanto
+a revalidação corre: a chamada espera a planilha e só usa a cópia se o
+download falhar. Depois de uma falha, a próxima espera só acontece após
+outro ``NUMEROS_EQUIPES_TTL``, para que a planilha fora do ar não atrase
+cada relatório pelo timeout.
+"""
+from __future__ import annotations
+
+import io
+import json
+import logging
 import os
 import re
+import tempfile
+import threading
+import time
+from email.utils import formatdate
+from typing import Any, Dict, Optional, Tuple
+
+import pandas as pd
+import requests
+
+from app.config.settings import NUMEROS_EQUIPES_IDADE_MAXIMA, NUMEROS_EQUIPES_SNAPSHOT, NUMEROS_EQUIPES_TTL
+
+# Timeouts (conexão, leitura) do download da planilha
+TIMEOUT_PLANILHA = (5, 30)
 
 def limpar_numero_br(numero):
     # Remove tudo que não for dígito
@@ -27,9 +60,9 @@ def limpar_numero_br(numero):
     # Se não for válido, retorna vazio
     return ''
 
-def carregar_numeros_equipes():
-    url = os.getenv("PLANILHA_EQUIPES_URL")  # Deve ser o link CSV do Google Sheets
-    df = pd.read_csv(url, usecols=[0, 1], skiprows=1)
+def interpretar_planilha(origem) -> Dict[str, str]:
+    """Lê o CSV da planilha (caminho, URL ou arquivo aberto) como ``{equipe: numero}``."""
+    df = pd.read_csv(origem, usecols=[0, 1], skiprows=1)
 
     # Renomear colunas
     df.columns = ['Equipe', 'Numero']
@@ -48,3 +81,196 @@ def carregar_numeros_equipes():
 
     # Retorna um dicionário: {'OPS': '556399999999', 'LOJA 75': '556398887777'}
     return dict(zip(df['Equipe'], df['Numero']))
+
+
+class DiretorioEquipes:
+    """Números das equipes em memória, com revalidação condicional e snapshot em disco."""
+
+    def __init__(
+        self,
+        caminho_snapshot: str = NUMEROS_EQUIPES_SNAPSHOT,
+        ttl: float = NUMEROS_EQUIPES_TTL,
+        idade_maxima: float = NUMEROS_EQUIPES_IDADE_MAXIMA,
+    ):
+        self.caminho_snapshot = caminho_snapshot
+        self.ttl = ttl
+        self.idade_maxima = max(idade_maxima, ttl)
+        self._numeros: Optional[Dict[str, str]] = None
+        self._validadores: Dict[str, Optional[str]] = {}
+        self._url: Optional[str] = None
+        self._atualizado_em = 0.0
+        self._ultimo_erro: Optional[str] = None
+        self._falhou_em = 0.0
+        self._lock = threading.Lock()
+        self._atualizando = threading.Lock()
+
+    # --- snapshot em disco ---
+
+    def _ler_snapshot(self, url: str) -> bool:
+        try:
+            with open(self.caminho_snapshot, encoding="utf-8") as arquivo:
+                dados = json.load(arquivo)
+        except FileNotFoundError:
+            return False
+        except (OSError, ValueError) as exc:
+            logging.warning("Snapshot de números das equipes inválido: %s", exc)
+            return False
+        # Um snapshot de outra planilha (ex.: teste de carga) não serve
+        if dados.get("url") != url or not dados.get("atualizado_em", 0) > self._atualizado_em:
+            return False
+        self._numeros = dados["numeros"]
+        self._validadores = dados.get("validadores") or {}
+        self._url = url
+        self._atualizado_em = dados["atualizado_em"]
+        return True
+
+    def _gravar_snapshot(self) -> None:
+        dados = {
+            "url": self._url,
+            "atualizado_em": self._atualizado_em,
+            "validadores": self._validadores,
+            "numeros": self._numeros,
+        }
+        diretorio = os.path.dirname(self.caminho_snapshot) or "."
+        temp_path = None
+        try:
+            os.makedirs(diretorio, exist_ok=True)
+            with tempfile.NamedTemporaryFile(
+                "w", delete=False, dir=diretorio, suffix=".json.tmp", encoding="utf-8"
+            ) as tmp_file:
+                temp_path = tmp_file.name
+                json.dump(dados, tmp_file, ensure_ascii=False)
+            os.replace(temp_path, self.caminho_snapshot)
+        except Exception as exc:  # noqa: BLE001
+            logging.warning("Não foi possível gravar o snapshot de números das equipes: %s", exc)
+            if temp_path and os.path.exists(temp_path):
+                os.unlink(temp_path)
+
+    # --- planilha ---
+
+    def _baixar(self, url: str) -> Tuple[Optional[Dict[str, str]], Dict[str, Optional[str]]]:
+        """Baixa a planilha e retorna ``(numeros, validadores)``.
+
+        ``numeros`` é ``None`` quando a planilha não mudou desde a última leitura.
+        """
+        with self._lock:
+            validadores = dict(self._validadores) if self._url == url else {}
+        if not url.startswith(("http://", "https://")):
+            # Arquivo local: a data de modificação faz o papel do ETag
+            modificado = str(os.path.getmtime(url))
+            if modificado == validadores.get("mtime"):
+                return None, validadores
+            return interpretar_planilha(url), {"mtime": modificado}
+
+        cabecalhos = {}
+        if validadores.get("etag"):
+            cabecalhos["If-None-Match"] = validadores["etag"]
+        if validadores.get("last_modified"):
+            cabecalhos["If-Modified-Since"] = validadores["last_modified"]
+        resposta = requests.get(url, headers=cabecalhos, timeout=TIMEOUT_PLANILHA)
+        if resposta.status_code == 304:
+            return None, validadores
+        resposta.raise_for_status()
+        validadores = {
+            "etag": resposta.headers.get("ETag"),
+            "last_modified": resposta.headers.get("Last-Modified"),
+        }
+        return interpretar_planilha(io.BytesIO(resposta.content)), validadores
+
+    def atualizar(self, bloquear: bool = True) -> bool:
+        """Revalida a planilha agora. Retorna ``True`` se o diretório mudou.
+
+        Em caso de erro o diretório atual é mantido e o erro fica registrado
+        em :meth:`status`; sem nenhuma versão carregada, o erro é propagado.
+        Com ``bloquear=False`` não faz nada se outra atualização estiver em curso.
+        """
+        url = os.getenv("PLANILHA_EQUIPES_URL")  # Deve ser o link CSV do Google Sheets
+        if not url:
+            raise ValueError("A variável de ambiente PLANILHA_EQUIPES_URL deve ser configurada.")
+        if not self._atualizando.acquire(blocking=bloquear):
+            return False
+        try:
+            try:
+                numeros, validadores = self._baixar(url)
+            except Exception as exc:  # noqa: BLE001
+                self._ultimo_erro = f"{type(exc).__name__}: {exc}"
+                self._falhou_em = time.time()
+                if self._numeros is None or self._url != url:
+                    raise
+                logging.warning(
+                    "Planilha de equipes indisponível; usando a versão de %s: %s",
+                    formatdate(self._atualizado_em, localtime=True), exc,
+                )
+                return False
+            with self._lock:
+                self._ultimo_erro = None
+                self._atualizado_em = time.time()
+                self._validadores = validadores
+                self._url = url
+                if numeros is not None:
+                    self._numeros = numeros
+                    logging.info("Números das equipes atualizados: %d equipes", len(numeros))
+                self._gravar_snapshot()
+            return numeros is not None
+        finally:
+            self._atualizando.release()
+
+    def _atualizar_em_segundo_plano(self) -> None:
+        def executar() -> None:
+            try:
+                self.atualizar(bloquear=False)
+            except Exception:  # noqa: BLE001
+                logging.exception("Erro ao atualizar os números das equipes")
+
+        if not self._atualizando.locked():
+            threading.Thread(target=executar, name="numeros-equipes", daemon=True).start()
+
+    def numeros(self) -> Dict[str, str]:
+        """Retorna ``{equipe: numero}``, revalidando em segundo plano se estiver velho.
+
+        Acima de ``idade_maxima`` a revalidação é feita nesta chamada.
+        """
+        url = os.getenv("PLANILHA_EQUIPES_URL")
+        if self._numeros is None or self._url != url:
+            with self._lock:
+                if self._numeros is None or self._url != url:
+                    # Planilha nova (ou primeira chamada): nada do estado anterior vale
+                    self._numeros = None
+                    self._validadores = {}
+                    self._atualizado_em = 0.0
+                    self._ler_snapshot(url)
+            if self._numeros is None:
+                # Primeira carga sem snapshot: não há o que usar enquanto baixa
+                self.atualizar()
+        if time.time() - self._atualizado_em > self.ttl:
+            # Outro worker pode ter acabado de renovar o snapshot
+            with self._lock:
+                self._ler_snapshot(url)
+            agora = time.time()
+            if agora - self._atualizado_em > self.idade_maxima and agora - self._falhou_em > self.ttl:
+                # Velho demais para servir: espera a planilha (com erro, atualizar mantém a cópia)
+                self.atualizar()
+            elif agora - self._atualizado_em > self.ttl:
+                self._atualizar_em_segundo_plano()
+        return self._numeros
+
+    def status(self) -> Dict[str, Any]:
+        idade = time.time() - self._atualizado_em if self._atualizado_em else None
+        return {
+            "equipes": len(self._numeros or {}),
+            "atualizado_em": formatdate(self._atualizado_em, localtime=True) if self._atualizado_em else None,
+            "idade_segundos": round(idade, 1) if idade is not None else None,
+            "ttl_segundos": self.ttl,
+            "idade_maxima_segundos": self.idade_maxima,
+            "validadores": self._validadores,
+            "ultimo_erro": self._ultimo_erro,
+            "snapshot": self.caminho_snapshot,
+        }
+
+
+diretorio_equipes = DiretorioEquipes()
+
+
+def carregar_numeros_equipes():
+    """Números das equipes do diretório em cache (``{'LOJA 75': '556398887777'}``)."""
+    return diretorio_equipes.numeros()
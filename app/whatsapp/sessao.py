@@ -0,0 +1,146 @@
+"""Estado da sessão do WhatsApp compartilhado pelos envios do processo.
+
+Antes cada mensagem consultava a Evolution (``fetchInstances`` e, se preciso,
+``connect``) antes de ser enviada. Agora o estado fica em cache por
+``EVOLUTION_SESSION_TTL`` segundos e só uma thread por vez faz a consulta;
+as demais esperam e reaproveitam o resultado.
+
+Quando a instância é encontrada fechada, o circuito abre por
+``EVOLUTION_BREAKER_SECONDS``: nesse intervalo os envios falham na hora, sem
+novas chamadas à API, em vez de cada equipe restante esperar pelo timeout.
+Um envio com erro invalida o cache, e ``/whatsapp/status`` lê o mesmo estado.
+Cada instância do pool (:mod:`app.whatsapp.instancias`) tem seu próprio
+estado e circuito.
+"""
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from typing import Dict, Optional
+
+from app.config.settings import (
+    EVOLUTION_BREAKER_SECONDS,
+    EVOLUTION_SESSION_TTL,
+)
+from app.whatsapp.evolution_client import obter_cliente
+from app.whatsapp.instancias import INSTANCIA_PRINCIPAL, INSTANCIAS
+
+
+def _extrair_estado(data, instancia: str = INSTANCIA_PRINCIPAL) -> Optional[str]:
+    """Lê o estado da instância, aceitando lista de instâncias ou objeto.
+
+    A Evolution pode retornar qualquer um dos dois formatos; tratar ambos
+    evita erros do tipo 'list' não possui 'get'.
+    """
+    if isinstance(data, list):
+        alvo = next(
+            (
+                item for item in data
+                if isinstance(item, dict)
+                and (
+                    item.get("instanceName") == instancia
+                    or (item.get("instance") or {}).get("instanceName") == instancia
+                )
+            ),
+            data[0] if data else {},
+        )
+        data = alvo
+    if not isinstance(data, dict):
+        return None
+    estado = (
+        data.get("state")
+        or data.get("connectionState")
+        or (data.get("instance") or {}).get("state")
+    )
+    return estado.lower() if isinstance(estado, str) else None
+
+
+def consultar_estado(instancia: str = INSTANCIA_PRINCIPAL) -> Optional[str]:
+    """Consulta a Evolution e retorna o estado da instância (``open``, ``close``...).
+
+    Se a instância não estiver aberta, tenta reconectá-la. Retorna ``None``
+    quando nenhuma das chamadas responde.
+    """
+    cliente = obter_cliente(instancia)
+    estado = None
+    try:
+        resp = cliente.estado_conexao()
+        resp.raise_for_status()
+        estado = _extrair_estado(resp.json(), instancia)
+        if estado == "open":
+            return estado
+    except Exception as exc:  # noqa: BLE001
+        logging.error("Erro ao verificar estado da instância %s: %s", instancia, exc)
+
+    try:
+        resp = cliente.conectar()
+        resp.raise_for_status()
+        return _extrair_estado(resp.json(), instancia) or estado
+    except Exception as exc:  # noqa: BLE001
+        logging.error("Erro ao conectar instância %s: %s", instancia, exc)
+        return estado
+
+
+class EstadoSessao:
+    """Cache do estado da sessão com TTL, consulta única e circuit breaker."""
+
+    def __init__(
+        self,
+        instancia: str = INSTANCIA_PRINCIPAL,
+        ttl: float = EVOLUTION_SESSION_TTL,
+        pausa: float = EVOLUTION_BREAKER_SECONDS,
+    ):
+        self.instancia = instancia
+        self.ttl = ttl
+        self.pausa = pausa
+        self._estado: Optional[str] = None
+        self._consultado_em = 0.0
+        self._circuito_aberto_ate = 0.0
+        self._lock = threading.Lock()
+
+    def _valido(self, agora: float) -> bool:
+        return self._consultado_em > 0 and agora - self._consultado_em < self.ttl
+
+    def estado(self, forcar: bool = False) -> Optional[str]:
+        """Retorna o estado em cache, consultando a Evolution se ele expirou."""
+        if not forcar and self._valido(time.monotonic()):
+            return self._estado
+        with self._lock:
+            # Outra thread pode ter atualizado o estado enquanto esta esperava
+            if not forcar and self._valido(time.monotonic()):
+                return self._estado
+            estado = consultar_estado(self.instancia)
+            agora = time.monotonic()
+            self._estado = estado
+            self._consultado_em = agora
+            if estado == "open":
+                self._circuito_aberto_ate = 0.0
+            elif estado is not None:
+                self._circuito_aberto_ate = agora + self.pausa
+                logging.warning(
+                    "Sessão do WhatsApp %s em estado %r; envios suspensos por %.0fs",
+                    self.instancia, estado, self.pausa,
+                )
+            return estado
+
+    def precisa_consultar(self) -> bool:
+        return not self.circuito_aberto() and not self._valido(time.monotonic())
+
+    def circuito_aberto(self) -> bool:
+        return time.monotonic() < self._circuito_aberto_ate
+
+    def sessao_ativa(self) -> bool:
+        if self.circuito_aberto():
+            return False
+        return self.estado() == "open"
+
+    def invalidar(self) -> None:
+        self._consultado_em = 0.0
+
+
+sessoes: Dict[str, EstadoSessao] = {instancia.nome: EstadoSessao(instancia.nome) for instancia in INSTANCIAS}
+
+
+def obter_sessao(instancia: Optional[str] = None) -> EstadoSessao:
+    return sessoes[instancia or INSTANCIA_PRINCIPAL]
@@ -0,0 +1,87 @@
+"""Compara a leitura dos CSVs do PontoMais com ``engine="python"`` e o leitor rápido.
+
+Uso:
+    python -m scripts.benchmark_csv_reader
+    python -m scripts.benchmark_csv_reader --linhas 10000 100000
+
+Gera relatórios de Auditoria sintéticos (3 linhas de cabeçalho e 12 de
+rodapé, como o export real), confere que os DataFrames são idênticos e
+imprime o tempo de cada parser.
+"""
+from __future__ import annotations
+
+import argparse
+import importlib.util
+import os
+import random
+import tempfile
+import time
+
+import pandas as pd
+
+from app.processamento.csv_pontomais import ler_csv_pontomais
+
+OCORRENCIAS = [
+    "Falta",
+    "Horas Faltantes",
+    "Horas extras",
+    "Interjornada insuficiente",
+    "Intrajornada insuficiente",
+]
+DIAS = ["Seg", "Ter", "Qua", "Qui", "Sex", "Sáb", "Dom"]
+
+
+def gerar_auditoria(caminho: str, linhas: int) -> None:
+    """Escreve um relatório de Auditoria sintético com ``linhas`` registros."""
+    aleatorio = random.Random(42)
+    with open(caminho, "w", encoding="utf-8") as arquivo:
+        arquivo.write("Relatório de Auditoria\nEmpresa\nPeríodo\n")
+        arquivo.write("Nome,Equipe,Data,Ocorrência,Valor\n")
+        for indice in range(linhas):
+            dia = aleatorio.randint(1, 28)
+            arquivo.write(
+                f"Colaborador {indice % 5000},Loja {aleatorio.randint(1, 300)},"
+                f"\"{DIAS[dia % 7]}, {dia:02d}/01/2024\",{aleatorio.choice(OCORRENCIAS)},"
+                f"{aleatorio.randint(0, 5):02d}:{aleatorio.randint(0, 59):02d}\n"
+            )
+        for indice in range(12):
+            arquivo.write(f"Rodapé {indice}\n")
+
+
+def cronometrar(funcao) -> tuple:
+    inicio = time.perf_counter()
+    resultado = funcao()
+    return time.perf_counter() - inicio, resultado
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--linhas", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    args = parser.parse_args()
+
+    engines = ["c"]
+    if importlib.util.find_spec("pyarrow") is not None:
+        engines.append("pyarrow")
+
+    print(f"{'linhas':>10} {'python (s)':>11} " + " ".join(f"{e + ' (s)':>13}" for e in engines))
+    for linhas in args.linhas:
+        with tempfile.TemporaryDirectory() as pasta:
+            caminho = os.path.join(pasta, "auditoria.csv")
+            gerar_auditoria(caminho, linhas)
+
+            tempo_python, esperado = cronometrar(
+                lambda: pd.read_csv(caminho, skiprows=3, skipfooter=12, engine="python")
+            )
+            colunas = [f"{linhas:>10}", f"{tempo_python:>11.3f}"]
+            for engine in engines:
+                tempo, obtido = cronometrar(
+                    lambda: ler_csv_pontomais(caminho, skiprows=3, skipfooter=12, engine=engine)
+                )
+                if not esperado.equals(obtido):
+                    raise SystemExit(f"DataFrame divergente com engine={engine} ({linhas} linhas)")
+                colunas.append(f"{tempo:>6.3f} ({tempo_python / tempo:>4.1f}x)")
+            print(" ".join(colunas))
+
+
+if __name__ == "__main__":
+    main()
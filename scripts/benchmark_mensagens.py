@@ -0,0 +1,289 @@
+"""Confere e cronometra a geração de mensagens de Auditoria e Ocorrências.
+
+Uso:
+    python -m scripts.benchmark_mensagens
+    python -m scripts.benchmark_mensagens --tipo ocorrencias --linhas 10000 100000
+
+Gera ``DataFrames`` sintéticos (incluindo ocorrências fora dos templates,
+valores vazios e faltas abonadas), compara a versão vetorizada com a
+implementação original linha a linha (mantida aqui como referência) e
+imprime o tempo de cada uma. Termina com erro se as mensagens divergirem.
+"""
+from __future__ import annotations
+
+import argparse
+import random
+import time
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+
+from app.processamento.motivos_ocorrencias import validar_motivo
+from app.processamento.ocorrencias_processor import processar_ocorrencias
+from app.types import MensagemDetalhada
+from app.whatsapp.mensagem import (
+    TEMPLATES,
+    converter_horas_para_minutos,
+    formatar_horas,
+    gerar_mensagens_auditoria,
+    normalizar,
+)
+
+OCORRENCIAS = [
+    "Falta",
+    "Horas Faltantes",
+    "horas faltantes",
+    "Horas extras",
+    "Mais de duas horas extras",
+    "Interjornada insuficiente",
+    "Intrajornada insuficiente",
+    "Mais de 6 dias de trabalho consecutivos",
+    "Menos de 1 hora de intervalo",
+    " Falta ",
+    "",
+    None,
+]
+VALORES = ["00:00", "00:30", "00:59", "01:00", "01:45", "02:00", "03:10", "10", "abc", "", None]
+MOTIVOS = [
+    "Número de pontos menor que o previsto",
+    "Possui pontos durante exceção",
+    "Número errado de pontos",
+    "Outro motivo",
+    "nan",
+]
+ACOES = [
+    "Colaborador solicitar ajuste",
+    "Gestor aprovar solicitação de ajuste",
+    "Gestor corrigir lançamento de exceção",
+    "nan",
+]
+
+
+def gerar_auditoria(linhas: int, semente: int = 42) -> pd.DataFrame:
+    """Monta um ``DataFrame`` no formato de saída do ``carregar_dados``."""
+    aleatorio = random.Random(semente)
+    colaboradores = max(1, linhas // 8)
+    registros = []
+    for _ in range(linhas):
+        valor = aleatorio.choice(VALORES)
+        registros.append({
+            "Nome": f"Colaborador {aleatorio.randrange(colaboradores)}",
+            "Data": f"{aleatorio.randint(1, 5):02d}/01/2024",
+            "Ocorrência": aleatorio.choice(OCORRENCIAS),
+            "Valor": np.nan if valor is None else valor,
+            "FaltaAbonadaJustificada": aleatorio.random() < 0.1,
+        })
+    return pd.DataFrame(registros)
+
+
+def gerar_ocorrencias(linhas: int, semente: int = 42) -> pd.DataFrame:
+    """Monta um ``DataFrame`` no formato de saída do ``carregar_dados_ocorrencias``."""
+    aleatorio = random.Random(semente)
+    colaboradores = max(1, linhas // 4)
+    return pd.DataFrame({
+        "Nome": [f"Colaborador {aleatorio.randrange(colaboradores)}" for _ in range(linhas)],
+        "Data": [f"{aleatorio.randint(1, 5):02d}/01/2024" for _ in range(linhas)],
+        "Motivo": [aleatorio.choice(MOTIVOS) for _ in range(linhas)],
+        "Ação pendente": [aleatorio.choice(ACOES) for _ in range(linhas)],
+    })
+
+
+# === Implementações originais (referência de paridade) ===
+
+
+def gerar_mensagem_original(grupo) -> Optional[MensagemDetalhada]:
+    """Regras de Auditoria por grupo ``(Nome, Data)``, como eram antes da vetorização."""
+    nome = grupo["Nome"].iloc[0]
+    data = grupo["Data"].iloc[0]
+    ocorrencias = grupo.set_index("Ocorrência")["Valor"].astype(str).to_dict()
+
+    # Normaliza as chaves e valores
+    ocorrencias_norm = {normalizar(k): normalizar(v) for k, v in ocorrencias.items()}
+
+    msgs: List[str] = []
+    mensagens_set = set()
+    motivos_utilizados: List[str] = []
+
+    # Verifica se há falta justificada/abonada para a mesma pessoa e data
+    # Agora, verifica a nova coluna 'FaltaAbonadaJustificada' no grupo
+    falta_justificada_ou_abonada = grupo["FaltaAbonadaJustificada"].any()
+
+    # Ignora duplicidade entre duas ocorrências iguais
+    tem_ambas_horas_extras = (
+        "horas extras" in ocorrencias_norm and
+        "mais de duas horas extras" in ocorrencias_norm and
+        ocorrencias.get("Horas extras") == ocorrencias.get("Mais de duas horas extras")
+    )
+
+    # ✅ Combinação especial: falta + horas faltantes não justificadas
+    tem_falta = "falta" in ocorrencias_norm and not grupo["FaltaAbonadaJustificada"].any()
+    tem_horas_faltantes = "horas faltantes" in ocorrencias_norm and not grupo["FaltaAbonadaJustificada"].any()
+
+    if tem_falta and tem_horas_faltantes:
+        valor_faltante = ocorrencias.get("Horas Faltantes") or ocorrencias.get("horas faltantes")
+        msg = f"*{nome}* _faltou_ e _ficou devendo_ *{formatar_horas(valor_faltante)}*. Por favor *ajustar*."
+        return MensagemDetalhada(
+            texto=msg,
+            motivos=["Falta", "Horas Faltantes"],
+        )
+
+    for _, row in grupo.iterrows():
+        ocorr = row["Ocorrência"]
+        valor = row["Valor"]
+
+        if not isinstance(ocorr, str) or ocorr.strip() == "":
+            continue
+
+        ocorr_norm = normalizar(ocorr)
+
+        # ✅ Regra principal: ignora mensagem de horas faltantes se houver falta justificada
+        if ocorr_norm == "horas faltantes" and falta_justificada_ou_abonada:
+            continue
+
+        # Ignora a própria ocorrência de Falta se ela for abonada/justificada
+        if ocorr_norm == "falta" and row["FaltaAbonadaJustificada"]:
+            continue
+
+        if tem_ambas_horas_extras and ocorr_norm == "mais de duas horas extras":
+            continue
+
+        if ocorr_norm == "horas faltantes":
+            if converter_horas_para_minutos(valor) < 60:
+                continue
+
+        if ocorr_norm == "horas extras":
+            try:
+                h, m = map(int, valor.strip().split(":"))
+                if h * 60 + m < 120:
+                    continue
+            except Exception:  # noqa: BLE001
+                continue
+
+        tpl = TEMPLATES.get(ocorr.strip())
+        if not tpl:
+            continue
+
+        msg = tpl.format(
+            nome=nome,
+            data=data,
+            valor=valor,
+            horas=formatar_horas(valor)
+        ).strip()
+
+        if msg and msg not in mensagens_set:
+            msgs.append(msg)
+            mensagens_set.add(msg)
+            motivo = ocorr.strip()
+            if motivo and motivo not in motivos_utilizados:
+                motivos_utilizados.append(motivo)
+
+    if not msgs:
+        return None
+
+    motivos = [m for m in motivos_utilizados if m]
+    return MensagemDetalhada(texto="\n".join(msgs), motivos=motivos)
+
+
+def auditoria_original(df: pd.DataFrame) -> pd.Series:
+    return df.groupby(["Nome", "Data"], group_keys=False).apply(gerar_mensagem_original).dropna()
+
+
+def ocorrencias_original(df: pd.DataFrame) -> pd.Series:
+    """Mensagens de Ocorrências por ``(Nome, Data)``, linha a linha, como eram antes da vetorização."""
+
+    def gerar_linha_ocorrencia(row) -> Optional[str]:
+        nome = row["Nome"]
+        motivo = row["Motivo"]
+        acao_pendente = row["Ação pendente"]
+
+        if not validar_motivo(motivo):
+            return None
+
+        if motivo == "Número de pontos menor que o previsto" and acao_pendente == "Gestor aprovar solicitação de ajuste":
+            return (
+                f"*{nome}* solicitou ajuste.\n"
+                f"Ação pendente: *{acao_pendente}*."
+            )
+        elif motivo == "Número de pontos menor que o previsto" and acao_pendente == "Gestor corrigir lançamento de exceção":
+            return (
+                f"*{nome}* apresentou _{motivo.lower()}_.\n"
+                f"Ação pendente: *{acao_pendente}*."
+            )
+        elif motivo == "Número de pontos menor que o previsto":
+            return (
+                f"*{nome}* está com o _{motivo.lower()}_.\n"
+                f"Ação pendente: *{acao_pendente}*."
+            )
+        elif motivo == "Número errado de pontos":
+            return (
+                f"*{nome}* apresentou _{motivo.lower()}_.\n"
+                f"Ação pendente: *{acao_pendente}*."
+            )
+        else:
+            return (
+                f"*{nome}* _{motivo.lower()}_.\n"
+                f"Ação pendente: *{acao_pendente}*."
+            )
+
+    # Agrupar por Nome e Data para consolidar as mensagens por ocorrência
+    def compilar_mensagens(grupo: pd.DataFrame) -> Optional[MensagemDetalhada]:
+        textos: List[str] = []
+        motivos: List[str] = []
+        for _, row in grupo.iterrows():
+            mensagem = gerar_linha_ocorrencia(row)
+            if not mensagem:
+                continue
+            textos.append(mensagem)
+            motivo = row.get("Motivo")
+            if isinstance(motivo, str):
+                motivo_limpo = motivo.strip()
+                if motivo_limpo and motivo_limpo not in motivos:
+                    motivos.append(motivo_limpo)
+
+        if not textos:
+            return None
+
+        return MensagemDetalhada(
+            texto="\n".join(textos),
+            motivos=motivos,
+        )
+
+    mensagens_ocorrencias = df.groupby(["Nome", "Data"], group_keys=False).apply(compilar_mensagens)
+    return mensagens_ocorrencias.dropna()
+
+
+TIPOS = {
+    "auditoria": (gerar_auditoria, auditoria_original, gerar_mensagens_auditoria),
+    "ocorrencias": (gerar_ocorrencias, ocorrencias_original, processar_ocorrencias),
+}
+
+
+def cronometrar(funcao) -> tuple:
+    inicio = time.perf_counter()
+    resultado = funcao()
+    return time.perf_counter() - inicio, resultado
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tipo", choices=sorted(TIPOS), default="auditoria")
+    parser.add_argument("--linhas", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    args = parser.parse_args()
+    gerar_dados, versao_original, versao_vetorizada = TIPOS[args.tipo]
+
+    print(f"{'linhas':>10} {'grupos':>8} {'original (s)':>12} {'vetorizada (s)':>16}")
+    for linhas in args.linhas:
+        df = gerar_dados(linhas)
+        tempo_vetorizado, obtido = cronometrar(lambda: versao_vetorizada(df))
+        tempo_original, esperado = cronometrar(lambda: versao_original(df))
+        if esperado.index.tolist() != obtido.index.tolist() or esperado.tolist() != obtido.tolist():
+            raise SystemExit(f"Mensagens divergentes ({linhas} linhas)")
+        print(
+            f"{linhas:>10} {len(obtido):>8} {tempo_original:>12.3f} "
+            f"{tempo_vetorizado:>8.3f} ({tempo_original / tempo_vetorizado:>4.1f}x)"
+        )
+
+
+if __name__ == "__main__":
+    main()
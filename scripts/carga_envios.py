@@ -0,0 +1,168 @@
+"""Teste de carga do envio de relatórios contra uma Evolution local.
+
+Uso:
+    python -m scripts.carga_envios --csv relatorio.csv --tipo Auditoria --execucoes 3
+    python -m scripts.carga_envios --csv relatorio.csv --latencia-ms 300 --taxa-429 0.05 --taxa-envio 20
+
+Sobe :mod:`scripts.evolution_stub` em uma porta livre, aponta
+``EVOLUTION_URL`` para ele e roda ``processar_csv`` completo sobre o
+relatório informado. A planilha de números é trocada por um CSV temporário
+com um número fictício por equipe do relatório (``--equipes-por-numero``
+faz várias equipes dividirem o mesmo número). O histórico e as reservas de
+idempotência ficam em memória (:class:`HistoricoEmMemoria`): nada é gravado
+no MySQL do ``.env``. Sem instância configurada, usa ``carga``.
+
+Para cada execução imprime mensagens/s aceitas pelo servidor, latência
+p50/p95/p99 das chamadas de envio, novas tentativas e respostas por status.
+"""
+from __future__ import annotations
+
+import argparse
+import csv
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+from scripts.evolution_stub import adicionar_argumentos, configuracao_dos_argumentos, iniciar_servidor
+
+TIPOS = ["Auditoria", "Ocorrências", "Assinaturas"]
+
+
+class HistoricoEmMemoria:
+    """Substitui as gravações de :mod:`app.history` feitas durante o envio."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.envios = []
+        self.relatorios = {}
+        self.reservas = {}
+
+    def registrar_envio(self, envios, **_opcoes) -> None:
+        with self._lock:
+            self.envios.extend(envios)
+
+    def registrar_resultado_relatorio(self, nome_relatorio, nome_original, tipo_relatorio, total, sucesso, erro,
+                                      equipes_com_erro=None) -> None:
+        with self._lock:
+            self.relatorios[nome_relatorio] = (tipo_relatorio, total, sucesso, erro)
+
+    def reservar_envio(self, chave, nome_relatorio, equipe, prazo_segundos) -> str:
+        from app.history import RESERVA_CONCEDIDA, RESERVA_EM_ANDAMENTO, RESERVA_JA_ENVIADO
+
+        agora = datetime.now()
+        with self._lock:
+            status, atualizado_em = self.reservas.get(chave, (None, None))
+            if status == "enviado":
+                return RESERVA_JA_ENVIADO
+            if status == "enviando" and atualizado_em > agora - timedelta(seconds=prazo_segundos):
+                return RESERVA_EM_ANDAMENTO
+            self.reservas[chave] = ("enviando", agora)
+            return RESERVA_CONCEDIDA
+
+    def concluir_envio(self, chave, sucesso) -> None:
+        with self._lock:
+            self.reservas[chave] = ("enviado" if sucesso else "falhou", datetime.now())
+
+    def instalar(self) -> None:
+        """Aponta o controller e o despacho para esta instância."""
+        from app import controller
+        from app.whatsapp import despacho
+
+        controller.registrar_envio = self.registrar_envio
+        controller.registrar_resultado_relatorio = self.registrar_resultado_relatorio
+        despacho.reservar_envio = self.reservar_envio
+        despacho.concluir_envio = self.concluir_envio
+
+
+def gerar_planilha_numeros(equipes, equipes_por_numero: int, caminho: str) -> None:
+    """Grava o CSV no formato da planilha de equipes (linha de título + cabeçalho)."""
+    with open(caminho, "w", newline="", encoding="utf-8") as arquivo:
+        escritor = csv.writer(arquivo)
+        escritor.writerow(["Números das equipes (teste de carga)", ""])
+        escritor.writerow(["Equipe", "Numero"])
+        for indice, equipe in enumerate(sorted(equipes)):
+            escritor.writerow([equipe, f"5563{90000000 + indice // equipes_por_numero}"])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--csv", required=True, help="relatório do PontoMais usado nas execuções")
+    parser.add_argument("--tipo", choices=TIPOS, default="Auditoria")
+    parser.add_argument("--ignorar-sabados", action="store_true")
+    parser.add_argument("--execucoes", type=int, default=1)
+    parser.add_argument("--equipes-por-numero", type=int, default=1)
+    parser.add_argument("--taxa-envio", type=float, help="sobrepõe EVOLUTION_RATE_PER_SECOND")
+    parser.add_argument(
+        "--nome-relatorio",
+        help="ativa as chaves de idempotência; repetir o nome faz as execuções seguintes pularem os envios",
+    )
+    adicionar_argumentos(parser)
+    args = parser.parse_args()
+
+    servidor, estado, url = iniciar_servidor(configuracao_dos_argumentos(args))
+    diretorio = tempfile.mkdtemp(prefix="carga_envios_")
+
+    # As configurações são lidas na importação de app.config.settings
+    os.environ["EVOLUTION_URL"] = url
+    os.environ["EVOLUTION_RATE_DIR"] = diretorio
+    os.environ["NUMEROS_EQUIPES_SNAPSHOT"] = os.path.join(diretorio, "numeros_equipes.json")
+    # O stub aceita qualquer instância; o .env não sobrepõe o que já está no ambiente
+    if not os.environ.get("EVOLUTION_INSTANCES") and not os.environ.get("EVOLUTION_INSTANCE"):
+        os.environ["EVOLUTION_INSTANCE"] = "carga"
+        os.environ.setdefault("EVOLUTION_TOKEN", "carga")
+    if args.taxa_envio is not None:
+        os.environ["EVOLUTION_RATE_PER_SECOND"] = str(args.taxa_envio)
+
+    from app.controller import processar_csv
+    from app.processamento.cache_relatorios import carregar_dados_com_cache
+
+    historico = HistoricoEmMemoria()
+    historico.instalar()
+
+    df = carregar_dados_com_cache(args.csv, args.ignorar_sabados, args.tipo)
+    equipes = set(df["EquipeTratada"].astype(str).str.strip().str.upper())
+    planilha = os.path.join(diretorio, "numeros_equipes.csv")
+    gerar_planilha_numeros(equipes, max(1, args.equipes_por_numero), planilha)
+    os.environ["PLANILHA_EQUIPES_URL"] = planilha
+    print(f"Evolution local em {url}; {len(equipes)} equipes no relatório")
+
+    print(
+        f"{'exec':>4} {'tempo (s)':>9} {'ok':>5} {'erro':>5} {'msg/s':>7} "
+        f"{'p50 (s)':>8} {'p95 (s)':>8} {'p99 (s)':>8} {'retent.':>7}  respostas"
+    )
+    aceitas_total = 0
+    tempo_total = 0.0
+    try:
+        for execucao in range(1, args.execucoes + 1):
+            estado.zerar()
+            inicio = time.perf_counter()
+            _, stats, _ = processar_csv(
+                args.csv,
+                args.ignorar_sabados,
+                args.tipo,
+                nome_relatorio=args.nome_relatorio,
+            )
+            duracao = time.perf_counter() - inicio
+            respostas = estado.metricas()
+            aceitas = respostas.get("201", 0)
+            concorrencia = stats.get("concorrencia") or {}
+            aceitas_total += aceitas
+            tempo_total += duracao
+            print(
+                f"{execucao:>4} {duracao:>9.2f} {stats['sucesso']:>5} {stats['erro']:>5} "
+                f"{aceitas / duracao:>7.2f} {concorrencia.get('latencia_p50', 0):>8.3f} "
+                f"{concorrencia.get('latencia_p95', 0):>8.3f} {concorrencia.get('latencia_p99', 0):>8.3f} "
+                f"{concorrencia.get('retentativas', 0):>7}  {respostas}"
+            )
+    finally:
+        servidor.shutdown()
+
+    if tempo_total:
+        print(f"Total: {aceitas_total} mensagens em {tempo_total:.2f}s ({aceitas_total / tempo_total:.2f} msg/s)")
+    print(f"Histórico em memória: {len(historico.envios)} registros (nada gravado no MySQL)")
+
+
+if __name__ == "__main__":
+    main()
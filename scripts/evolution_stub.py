@@ -0,0 +1,213 @@
+"""Servidor local que imita a Evolution API para testes de carga.
+
+Uso:
+    python -m scripts.evolution_stub --porta 8099 --latencia-ms 150 --taxa-erro 0.01 --taxa-429 0.02
+
+Atende as rotas usadas pelo disparador:
+
+- ``POST /message/sendText/<instância>``
+- ``GET /instance/connectionState/<instância>``
+- ``GET /instance/fetchInstances``
+- ``GET /instance/connect/<instância>``
+- ``DELETE /instance/logout/<instância>``
+
+Cada envio espera a latência configurada (com variação) e pode responder
+500 ou 429 com as probabilidades informadas. ``--limite-por-segundo`` faz o
+servidor responder 429 sempre que a taxa de envios passar do limite, como a
+Evolution sob carga. Instâncias em ``--fechadas`` respondem ``close``.
+``GET /stub/metricas`` devolve a contagem de respostas por status.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Set, Tuple
+from urllib.parse import parse_qs, urlparse
+
+
+@dataclass
+class ConfiguracaoStub:
+    latencia_ms: float = 100.0
+    variacao_ms: float = 50.0
+    taxa_erro: float = 0.0
+    taxa_429: float = 0.0
+    limite_por_segundo: float = 0.0
+    fechadas: Set[str] = field(default_factory=set)
+
+
+class EstadoStub:
+    """Contadores e limite de taxa do servidor, compartilhados entre as threads."""
+
+    def __init__(self, config: ConfiguracaoStub):
+        self.config = config
+        self._lock = threading.Lock()
+        self._respostas: Counter = Counter()
+        self._janela_inicio = time.monotonic()
+        self._envios_na_janela = 0
+
+    def registrar(self, status: int) -> None:
+        with self._lock:
+            self._respostas[status] += 1
+
+    def excedeu_limite(self) -> bool:
+        """Janela fixa de um segundo: acima de ``limite_por_segundo`` responde 429."""
+        if self.config.limite_por_segundo <= 0:
+            return False
+        with self._lock:
+            agora = time.monotonic()
+            if agora - self._janela_inicio >= 1:
+                self._janela_inicio = agora
+                self._envios_na_janela = 0
+            self._envios_na_janela += 1
+            return self._envios_na_janela > self.config.limite_por_segundo
+
+    def metricas(self) -> Dict[str, int]:
+        with self._lock:
+            return {str(status): total for status, total in sorted(self._respostas.items())}
+
+    def zerar(self) -> None:
+        with self._lock:
+            self._respostas.clear()
+
+
+def _estado_instancia(config: ConfiguracaoStub, instancia: str) -> str:
+    return "close" if instancia in config.fechadas else "open"
+
+
+def criar_handler(estado: EstadoStub):
+    config = estado.config
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, formato, *args):  # noqa: D401 - silencia o log por requisição
+            pass
+
+        def _responder(self, status: int, corpo) -> None:
+            dados = json.dumps(corpo).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(dados)))
+            self.end_headers()
+            self.wfile.write(dados)
+
+        def _rota(self) -> Tuple[str, str]:
+            caminho = urlparse(self.path).path.rstrip("/")
+            prefixo, _, instancia = caminho.rpartition("/")
+            return prefixo, instancia
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            prefixo, instancia = self._rota()
+            if url.path == "/stub/metricas":
+                self._responder(200, estado.metricas())
+            elif prefixo == "/instance/connectionState":
+                self._responder(200, {"instance": {
+                    "instanceName": instancia, "state": _estado_instancia(config, instancia),
+                }})
+            elif prefixo == "/instance/connect":
+                self._responder(200, {"instance": {
+                    "instanceName": instancia, "state": _estado_instancia(config, instancia),
+                }})
+            elif url.path == "/instance/fetchInstances":
+                nome = parse_qs(url.query).get("instanceName", ["stub"])[0]
+                self._responder(200, [{
+                    "instanceName": nome,
+                    "connectionStatus": _estado_instancia(config, nome),
+                    "profileName": "Evolution local",
+                    "ownerJid": "550000000000@s.whatsapp.net",
+                    "profilePicUrl": None,
+                }])
+            else:
+                self._responder(404, {"error": "rota não atendida pelo stub"})
+
+        def do_DELETE(self):
+            prefixo, _ = self._rota()
+            if prefixo == "/instance/logout":
+                self._responder(200, {"status": "SUCCESS", "error": False})
+            else:
+                self._responder(404, {"error": "rota não atendida pelo stub"})
+
+        def do_POST(self):
+            prefixo, instancia = self._rota()
+            tamanho = int(self.headers.get("Content-Length") or 0)
+            corpo = json.loads(self.rfile.read(tamanho) or b"{}")
+            if prefixo != "/message/sendText":
+                self._responder(404, {"error": "rota não atendida pelo stub"})
+                return
+
+            latencia = max(0.0, random.gauss(config.latencia_ms, config.variacao_ms)) / 1000
+            time.sleep(latencia)
+
+            if estado.excedeu_limite() or random.random() < config.taxa_429:
+                status, resposta = 429, {"error": "Too Many Requests"}
+            elif random.random() < config.taxa_erro:
+                status, resposta = 500, {"error": "Internal Server Error"}
+            elif _estado_instancia(config, instancia) != "open":
+                status, resposta = 400, {"error": "Connection Closed"}
+            else:
+                status = 201
+                resposta = {
+                    "key": {"remoteJid": f"{corpo.get('number')}@s.whatsapp.net", "fromMe": True},
+                    "status": "PENDING",
+                }
+            estado.registrar(status)
+            self._responder(status, resposta)
+
+    return Handler
+
+
+def iniciar_servidor(config: ConfiguracaoStub, porta: int = 0, host: str = "127.0.0.1"):
+    """Sobe o servidor em uma thread e retorna ``(servidor, estado, url_base)``."""
+    estado = EstadoStub(config)
+    servidor = ThreadingHTTPServer((host, porta), criar_handler(estado))
+    servidor.daemon_threads = True
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor, estado, f"http://{host}:{servidor.server_address[1]}"
+
+
+def adicionar_argumentos(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--latencia-ms", type=float, default=100.0, help="latência média de cada envio")
+    parser.add_argument("--variacao-ms", type=float, default=50.0, help="desvio padrão da latência")
+    parser.add_argument("--taxa-erro", type=float, default=0.0, help="fração dos envios que recebe 500")
+    parser.add_argument("--taxa-429", type=float, default=0.0, help="fração dos envios que recebe 429")
+    parser.add_argument("--limite-por-segundo", type=float, default=0.0, help="envios/s acima dos quais responde 429 (0 desativa)")
+    parser.add_argument("--fechadas", nargs="*", default=[], help="instâncias que respondem com sessão fechada")
+
+
+def configuracao_dos_argumentos(args: argparse.Namespace) -> ConfiguracaoStub:
+    return ConfiguracaoStub(
+        latencia_ms=args.latencia_ms,
+        variacao_ms=args.variacao_ms,
+        taxa_erro=args.taxa_erro,
+        taxa_429=args.taxa_429,
+        limite_por_segundo=args.limite_por_segundo,
+        fechadas=set(args.fechadas),
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--porta", type=int, default=8099)
+    adicionar_argumentos(parser)
+    args = parser.parse_args()
+
+    servidor, estado, url = iniciar_servidor(configuracao_dos_argumentos(args), args.porta, args.host)
+    print(f"Evolution local em {url} (Ctrl+C para encerrar)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        servidor.shutdown()
+        print(f"Respostas: {estado.metricas()}")
+
+
+if __name__ == "__main__":
+    main()
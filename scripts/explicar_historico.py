@@ -0,0 +1,61 @@
+"""Confere no MySQL se os filtros do histórico usam os índices de ``envios``.
+
+Uso:
+    python -m scripts.explicar_historico
+    python -m scripts.explicar_historico --inicio 2024-01-01 --fim 2024-01-31 --equipe "LOJA 75"
+
+Roda ``EXPLAIN`` nas consultas de :func:`app.history.listar_envios` (só
+período, período com equipe e período com tipo, além dos filtros
+informados) contra o banco do ``.env`` e imprime o plano de cada uma.
+Termina com código 1 se alguma delas fizer varredura completa da tabela
+(``type = ALL``), por exemplo se um filtro voltar a envolver ``data_envio``
+em uma função. Em uma tabela quase vazia o MySQL pode preferir a varredura
+mesmo com o índice disponível; rode contra um banco com volume real.
+"""
+from __future__ import annotations
+
+import argparse
+import sys
+from datetime import date, timedelta
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from app.history import explicar_consulta_envios, listar_equipes_disponiveis  # noqa: E402
+
+
+def main() -> None:
+    hoje = date.today()
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--inicio", default=(hoje - timedelta(days=7)).isoformat())
+    parser.add_argument("--fim", default=hoje.isoformat())
+    parser.add_argument("--equipe", help="equipe usada no filtro combinado (padrão: a primeira do histórico)")
+    parser.add_argument("--tipo", default="Auditoria")
+    args = parser.parse_args()
+
+    equipe = args.equipe or next(iter(listar_equipes_disponiveis()), "LOJA 1")
+    consultas = {
+        "período": {"inicio": args.inicio, "fim": args.fim},
+        "período + equipe": {"equipe": equipe, "inicio": args.inicio, "fim": args.fim},
+        "período + tipo": {"tipo": args.tipo, "inicio": args.inicio, "fim": args.fim},
+    }
+
+    varreduras = []
+    for nome, filtros in consultas.items():
+        for linha in explicar_consulta_envios(**filtros):
+            print(
+                f"{nome:<18} type={linha.get('type')!s:<6} key={linha.get('key')!s:<28} "
+                f"rows={linha.get('rows')!s:<8} extra={linha.get('Extra') or ''}"
+            )
+            if linha.get("type") == "ALL":
+                varreduras.append(nome)
+
+    if varreduras:
+        print(f"Varredura completa em: {', '.join(varreduras)}")
+        sys.exit(1)
+    print("Todas as consultas usam índice.")
+
+
+if __name__ == "__main__":
+    main()
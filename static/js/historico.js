@@ -2,6 +2,9 @@ let graficoPorEquipe;
 let dados = [];
 let resumoAtual = { total: 0, sucessos: 0, erros: 0 };
 let equipesDisponiveis = [];
+// Cursor da proxima pagina de equipes e filtros usados na primeira pagina
+let proximaEquipe = null;
+let filtrosTabela = null;
 
 const CHECKBOX_ALL_VALUE = '__all__';
 
@@ -200,30 +203,41 @@ async function carregarDados() {
   const query = params.toString();
 
   try {
-    const url = query ? `/historico/dados?${query}` : '/historico/dados';
-    const resp = await fetch(url);
+    // Contagens agrupadas no servidor, uma pagina de equipes por vez; sem datas
+    // o servidor aplica o periodo padrao e devolve as datas usadas
+    const sufixo = query ? `?${query}` : '';
+    const [resp, respGrafico] = await Promise.all([
+      fetch(`/historico/resumo${sufixo}`),
+      fetch(`/historico/grafico${sufixo}`),
+    ]);
     const data = await resp.json();
+    const grafico = await respGrafico.json();
 
     if (!resp.ok || !data.success) {
       throw new Error(data.error || 'Falha ao consultar historico.');
     }
+    if (!respGrafico.ok || !grafico.success) {
+      throw new Error(grafico.error || 'Falha ao consultar grafico do historico.');
+    }
 
-    dados = Array.isArray(data.dados) ? data.dados : [];
-    resumoAtual = data.resumo || {
-      total: dados.length,
-      sucessos: dados.filter((d) => (d.status || '').toLowerCase() === 'sucesso').length,
-      erros: dados.filter((d) => (d.status || '').toLowerCase() === 'erro').length,
-    };
+    dados = Array.isArray(data.grupos) ? data.grupos : [];
+    resumoAtual = data.resumo || { total: 0, sucessos: 0, erros: 0 };
     equipesDisponiveis = Array.isArray(data.equipes) ? data.equipes : [];
+    preencherPeriodo(data.inicio, data.fim);
+    filtrosTabela = new URLSearchParams(params);
+    if (data.inicio && !filtrosTabela.has('inicio')) filtrosTabela.append('inicio', data.inicio);
+    if (data.fim && !filtrosTabela.has('fim')) filtrosTabela.append('fim', data.fim);
+    atualizarProximaEquipe(data.proximo);
 
     preencherTabela(dados);
     atualizarEquipeSelect(equipesDisponiveis);
     atualizarContadores(resumoAtual);
-    atualizarGraficoEquipes(dados);
+    atualizarGraficoEquipes(Array.isArray(grafico.por_equipe) ? grafico.por_equipe : []);
   } catch (error) {
     console.error('Erro ao carregar dados:', error);
     dados = [];
     resumoAtual = { total: 0, sucessos: 0, erros: 0 };
+    atualizarProximaEquipe(null);
     preencherTabela([]);
     atualizarContadores(resumoAtual);
     atualizarGraficoEquipes([]);
@@ -234,6 +248,44 @@ async function carregarDados() {
   }
 }
 
+function preencherPeriodo(inicio, fim) {
+  const campoInicio = document.getElementById('filtroInicio');
+  const campoFim = document.getElementById('filtroFim');
+  if (campoInicio && !campoInicio.value && inicio) campoInicio.value = inicio;
+  if (campoFim && !campoFim.value && fim) campoFim.value = fim;
+}
+
+function atualizarProximaEquipe(proximo) {
+  proximaEquipe = proximo ?? null;
+  const botao = document.getElementById('carregarMaisEquipes');
+  if (botao) {
+    botao.style.display = proximaEquipe === null ? 'none' : '';
+  }
+}
+
+async function carregarMaisEquipes() {
+  if (proximaEquipe === null || !filtrosTabela) return;
+  const botao = document.getElementById('carregarMaisEquipes');
+  if (botao) botao.disabled = true;
+
+  const params = new URLSearchParams(filtrosTabela);
+  params.set('apos', proximaEquipe);
+  try {
+    const resp = await fetch(`/historico/resumo?${params.toString()}`);
+    const data = await resp.json();
+    if (!resp.ok || !data.success) {
+      throw new Error(data.error || 'Falha ao consultar historico.');
+    }
+    dados = dados.concat(Array.isArray(data.grupos) ? data.grupos : []);
+    preencherTabela(dados);
+    atualizarProximaEquipe(data.proximo);
+  } catch (error) {
+    console.error('Erro ao carregar mais equipes:', error);
+  } finally {
+    if (botao) botao.disabled = false;
+  }
+}
+
 function exportarHistorico() {
   closeAllDropdowns();
   const params = new URLSearchParams();
@@ -339,8 +391,9 @@ function agruparPorEquipeTipoMotivo(registros) {
       });
     }
 
+    const quantidade = Number(registro.total ?? 1);
     const grupo = grupos.get(equipe);
-    grupo.total += 1;
+    grupo.total += quantidade;
 
     const chaveDetalhe = `${pessoa}|||${tipo}|||${motivo}`;
     if (!grupo.detalhes.has(chaveDetalhe)) {
@@ -351,7 +404,7 @@ function agruparPorEquipeTipoMotivo(registros) {
         total: 0,
       });
     }
-    grupo.detalhes.get(chaveDetalhe).total += 1;
+    grupo.detalhes.get(chaveDetalhe).total += quantidade;
   });
 
   const lista = Array.from(grupos.values()).map((grupo) => ({
@@ -554,15 +607,11 @@ function atualizarGraficoEquipes(dados) {
   const equipeCounts = {};
   dados.forEach((item) => {
     const equipeNome = item.equipe || 'Nao informado';
-    const status = (item.status || '').toLowerCase();
     if (!equipeCounts[equipeNome]) {
       equipeCounts[equipeNome] = { sucesso: 0, erro: 0 };
     }
-    if (status === 'sucesso') {
-      equipeCounts[equipeNome].sucesso += 1;
-    } else if (status === 'erro') {
-      equipeCounts[equipeNome].erro += 1;
-    }
+    equipeCounts[equipeNome].sucesso += Number(item.sucessos || 0);
+    equipeCounts[equipeNome].erro += Number(item.erros || 0);
   });
 
   const equipes = Object.keys(equipeCounts).sort();
@@ -648,6 +697,11 @@ document.addEventListener('DOMContentLoaded', () => {
     exportar.addEventListener('click', exportarHistorico);
   }
 
+  const carregarMais = document.getElementById('carregarMaisEquipes');
+  if (carregarMais) {
+    carregarMais.addEventListener('click', carregarMaisEquipes);
+  }
+
   carregarDados();
 });
 